@@ -1,4 +1,7 @@
 import config
+import controllers
+import tracing
+import os
 import time
 import numpy as np
 
@@ -8,18 +11,74 @@ Device_I2C = config.Device_I2C
 LCD_WIDTH   = 128 #LCD width
 LCD_HEIGHT  = 64  #LCD height
 
+# Contrast after Init().  Init used to send 0x81 without its value byte,
+# so the next command (0xA0) became the contrast: keep that brightness.
+CONTRAST_DEFAULT = controllers.CONTRAST_DEFAULT
+
+# spi_writebyte() argument for each data byte, sent inverted: built once,
+# so sending a frame allocates no per-byte lists
+_INVERTED = [[0xFF ^ b] for b in range(256)]
+
+
+class ContrastFade(object):
+    """Contrast ramp that does not block: call step() from a loop (e.g.
+    once per FramePacer tick).  Each step sends the contrast for the
+    current time if it changed, two command bytes; step() returns True
+    once the target is reached."""
+
+    def __init__(self, disp, target, duration):
+        self.disp = disp
+        self.start = disp.contrast
+        self.target = target
+        self.duration = duration
+        self.t0 = time.monotonic()
+        self.done = False
+
+    def step(self):
+        if self.duration > 0:
+            t = min(1.0, (time.monotonic() - self.t0) / self.duration)
+        else:
+            t = 1.0
+        value = int(round(self.start + (self.target - self.start) * t))
+        if value != self.disp.contrast:
+            self.disp.SetContrast(value)
+        self.done = t >= 1.0
+        return self.done
+
 class SH1106(object):
-    def __init__(self):
-        self.width = LCD_WIDTH
-        self.height = LCD_HEIGHT
+    """Driver for the panel; despite the name, any controller in
+    controllers.py (OLED_CONTROLLER, default sh1106) does the addressing."""
+
+    def __init__(self, rpi=None, controller=None):
+        if controller is None:
+            controller = controllers.from_env()
+        elif isinstance(controller, str):
+            controller = controllers.get(controller)
+        self.controller = controller
+        self.width = controller.width
+        self.height = controller.height
         #Initialize DC RST pin
-        self.RPI = config.RaspberryPi()
+        if rpi is None:
+            if os.environ.get("OLED_BACKEND") == "emulator":
+                import emulator
+                rpi = emulator.EmulatedRaspberryPi(panel=emulator.SH1106Emulator(controller=controller))
+            else:
+                rpi = config.RaspberryPi()
+        if os.environ.get("OLED_RECORD"):
+            import recorder
+            rpi = recorder.wrap_from_env(rpi, self.width, self.height, controller.name)
+        self.RPI = rpi
         self._dc = self.RPI.GPIO_DC_PIN
         self._rst = self.RPI.GPIO_RST_PIN
         self.Device = self.RPI.Device
+        # Frame boundary hook of recording/emulated backends
+        self._mark_frame = getattr(self.RPI, "mark_frame", None)
+        self.contrast = CONTRAST_DEFAULT
+        self._full_frame = controller.full_frame()
 
 
     """    Write register address and data     """
+    @tracing.traced
     def command(self, cmd):
         if(self.Device == Device_SPI):
             self.RPI.digital_write(self._dc,False)
@@ -36,30 +95,15 @@ class SH1106(object):
             return -1
         """Initialize dispaly"""    
         self.reset()
+        self.configure()
+
+    def configure(self):
+        """Send the init sequence (after reset()); panels that share a
+        reset line are reset once and configured each (videowall.py)."""
         self.command(0xAE);#--turn off oled panel
-        self.command(0x02);#---set low column address
-        self.command(0x10);#---set high column address
-        self.command(0x40);#--set start line address  Set Mapping RAM Display Start Line (0x00~0x3F)
-        self.command(0x81);#--set contrast control register
-        self.command(0xA0);#--Set SEG/Column Mapping     
-        self.command(0xC0);#Set COM/Row Scan Direction   
-        self.command(0xA6);#--set normal display
-        self.command(0xA8);#--set multiplex ratio(1 to 64)
-        self.command(0x3F);#--1/64 duty
-        self.command(0xD3);#-set display offset    Shift Mapping RAM Counter (0x00~0x3F)
-        self.command(0x00);#-not offset
-        self.command(0xd5);#--set display clock divide ratio/oscillator frequency
-        self.command(0x80);#--set divide ratio, Set Clock as 100 Frames/Sec
-        self.command(0xD9);#--set pre-charge period
-        self.command(0xF1);#Set Pre-Charge as 15 Clocks & Discharge as 1 Clock
-        self.command(0xDA);#--set com pins hardware configuration
-        self.command(0x12);
-        self.command(0xDB);#--set vcomh
-        self.command(0x40);#Set VCOM Deselect Level
-        self.command(0x20);#-Set Page Addressing Mode (0x00/0x01/0x02)
-        self.command(0x02);#
-        self.command(0xA4);# Disable Entire Display On (0xa4/0xa5)
-        self.command(0xA6);# Disable Inverse Display On (0xa6/a7) 
+        for cmd in self.controller.init:
+            self.command(cmd)
+        self.contrast = CONTRAST_DEFAULT
         time.sleep(0.1)
         self.command(0xAF);#--turn on oled panel
         
@@ -73,6 +117,7 @@ class SH1106(object):
         self.RPI.digital_write(self._rst,True)
         time.sleep(0.1)
     
+    @tracing.traced
     def getbuffer(self, image):
         # print "bufsiz = ",(self.width/8) * self.height
         buf = [0xFF] * ((self.width//8) * self.height)
@@ -106,27 +151,77 @@ class SH1106(object):
         # for i in range(0,self.width * self.height/8):
             # config.spi_writebyte([~Image[i]])
             
+    @tracing.traced
     def ShowImage(self, pBuf):
-        for page in range(0,8):
-            # set page address #
-            self.command(0xB0 + page)
-            # set low column address #
-            self.command(0x02); 
-            # set high column address #
-            self.command(0x10); 
-            # write data #
-            # time.sleep(0.01)
+        for burst in self._full_frame:
+            self.send_burst(pBuf, burst)
+        if self._mark_frame is not None:
+            self._mark_frame()
+
+    @tracing.traced
+    def ShowRegions(self, pBuf, rects):
+        """Send only the bytes of pBuf inside rects.
+
+        rects are (x0, y0, x1, y1) boxes, end exclusive, as returned by
+        sprites.Scene.render().  The controller picks the cheapest way to
+        address them (see controllers.py); on the SH1106 every page they
+        touch is sent over the columns they cover, and spans on one page
+        closer than the cost of re-addressing are sent as one.
+        """
+        for burst in self.controller.plan(rects):
+            self.send_burst(pBuf, burst)
+        if self._mark_frame is not None:
+            self._mark_frame()
+
+    def plan(self, rects):
+        """Bursts that send the bytes inside rects (controllers.py)."""
+        return self.controller.plan(rects)
+
+    def send_burst(self, pBuf, burst):
+        """Send a burst's commands, then its columns x0..x1-1 of pages
+        p0..p1-1 from pBuf."""
+        cmds, p0, p1, x0, x1 = burst
+        for cmd in cmds:
+            self.command(cmd)
+        if(self.Device == Device_SPI):
+            self.RPI.digital_write(self._dc,True)
+        for page in range(p0, p1):
             if(self.Device == Device_SPI):
-                self.RPI.digital_write(self._dc,True)
-            for i in range(0,self.width):#for(int i=0;i<self.width; i++)
-                if(self.Device == Device_SPI):
-                    self.RPI.spi_writebyte([~pBuf[i+self.width*page]]); 
-                else :
-                    self.RPI.i2c_writebyte(0x40, ~pBuf[i+self.width*page])
-                    
-                    
-
-	
+                for i in range(x0 + self.width * page, x1 + self.width * page):
+                    self.RPI.spi_writebyte(_INVERTED[pBuf[i]])
+            else:
+                for i in range(x0 + self.width * page, x1 + self.width * page):
+                    self.RPI.i2c_writebyte(0x40, 0xFF ^ pBuf[i])
+
+    def mark_frame(self):
+        """Tell a recording/emulated backend that a frame is complete."""
+        if self._mark_frame is not None:
+            self._mark_frame()
+
+    def SetStartLine(self, line):
+        """Show RAM line `line` on the top row of the panel (0-63).
+
+        The RAM is a ring of 64 lines, so this scrolls the picture
+        vertically with a single command byte (see console.py).
+        """
+        for cmd in self.controller.start_line(line):
+            self.command(cmd)
+
+    def SetContrast(self, value):
+        """Panel brightness, 0-255 (two command bytes)."""
+        value = max(0, min(255, int(value)))
+        self.command(0x81)
+        self.command(value)
+        self.contrast = value
+
+    def SetPower(self, on):
+        """Panel on (0xAF) or off (0xAE); the RAM keeps its content."""
+        self.command(0xAF if on else 0xAE)
+
+    def FadeContrast(self, target, duration):
+        """Start ramping the contrast to target over duration seconds;
+        returns a ContrastFade to step() from the caller's loop."""
+        return ContrastFade(self, target, duration)
 
     def clear(self):
         """Clear contents of image buffer"""
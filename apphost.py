@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# apphost.py — several UIs in one process, switched with a key combo.
+#
+# Starting a UI costs a panel reset, a Python start-up, the imports and
+# the asset decoding (glyph atlas, animation frames, QR code).  The host
+# pays that once: it opens and initializes the display, then imports every
+# app with displayd.share() in effect, so each app's open_display() returns
+# the same panel and its Init() does not reset it.  The apps stay imported;
+# their caches and screens are kept while another app runs.
+#
+#   python3 apphost.py                            # the four UIs
+#   python3 apphost.py edit.py "biometric_attack (2).py"
+#
+# Holding KEY1 and KEY3 together switches to the next app.  The switch
+# happens in the tick the combo is seen: the running app is suspended,
+# the next is resumed and draws a whole frame right away.  Until the
+# combo keys are let go the apps read no keys at all, so the switch does
+# not also press KEY1 or KEY3 in the app switched to.
+#
+# An app is a module with a step(periods) function, one tick of input and
+# drawing; periods is how many frame periods elapsed since the last tick
+# (pacing.FramePacer.wait()), which animations advance by.  Optional hooks,
+# all called without arguments:
+#
+#   suspend()        another app takes the panel
+#   resume()         the panel is back (showing another app's frame)
+#   shutdown()       the host is exiting (the UIs save their snapshot)
+#   handle_input()   and render(): step() split in two, instead of step()
+#
+# The UIs read their keys while they draw, so they only have step().
+
+import argparse
+import gc
+import importlib.util
+import os
+import re
+import sys
+import time
+
+import displayd
+import metrics
+import pacing
+import tracing
+
+DEFAULT_APPS = ("biometric_attack.py", "biometric_attack (1).py", "biometric_attack (2).py", "edit.py")
+DEFAULT_COMBO = ("KEY1", "KEY3")
+
+
+class _MaskedInputs(object):
+    """The shared display's RPI, reading no key presses while masked."""
+
+    def __init__(self, rpi):
+        self._rpi = rpi
+        self.masked = False
+
+    def digital_read(self, pin):
+        if self.masked:
+            return False
+        return self._rpi.digital_read(pin)
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        pass    # the host closes the backend
+
+    def __getattr__(self, name):
+        return getattr(self._rpi, name)
+
+
+class SharedDisplay(object):
+    """The host's display as the apps see it: already initialized."""
+
+    def __init__(self, disp):
+        self._disp = disp
+        self.RPI = _MaskedInputs(disp.RPI)
+
+    def Init(self):
+        # The host set the panel up already: no reset
+        return 0
+
+    def __getattr__(self, name):
+        return getattr(self._disp, name)
+
+
+class App(object):
+    """A UI module imported into the host, and its lifecycle hooks."""
+
+    def __init__(self, path, name=None):
+        self.path = os.path.abspath(path)
+        if name is None:
+            name = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(self.path))[0]).strip("_")
+        self.name = name
+        self.module = None
+
+    def init(self):
+        """Import the app; its module-level set-up runs now, once."""
+        # Assets are loaded relative to the script's directory
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(self.path))
+        try:
+            spec = importlib.util.spec_from_file_location(self.name, self.path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[self.name] = module
+            spec.loader.exec_module(module)
+        except Exception:
+            sys.modules.pop(self.name, None)
+            raise
+        finally:
+            os.chdir(cwd)
+        if not hasattr(module, "step") and not hasattr(module, "render"):
+            raise ValueError("%s has neither step() nor render()" % self.path)
+        self.module = module
+        self.stats = getattr(module, "stats", None)
+
+    def _hook(self, name):
+        fn = getattr(self.module, name, None)
+        if fn is not None:
+            fn()
+
+    def suspend(self):
+        self._hook("suspend")
+
+    def resume(self):
+        self._hook("resume")
+
+    def shutdown(self):
+        self._hook("shutdown")
+
+    def step(self, periods=1):
+        if self.stats is not None:
+            self.stats.begin_frame()
+        if hasattr(self.module, "step"):
+            self.module.step(periods)
+        else:
+            self._hook("handle_input")
+            self.module.render()
+
+
+class Host(object):
+    def __init__(self, disp, paths, combo=DEFAULT_COMBO):
+        self.disp = disp
+        self.shared = SharedDisplay(disp)
+        self.apps = [App(path) for path in paths]
+        if not self.apps:
+            raise ValueError("no apps to host")
+        rpi = disp.RPI
+        self._combo = [getattr(rpi, "GPIO_%s_PIN" % key) for key in combo]
+        self._held = False
+        self.current = 0
+        self.switches = metrics.RingBuffer(64)     # switch times, ns
+
+    def load(self):
+        """Import every app; the first one is resumed."""
+        displayd.share(self.shared)
+        try:
+            for app in self.apps:
+                app.init()
+                app.suspend()
+        finally:
+            displayd.share(None)
+        self.apps[self.current].resume()
+
+    @property
+    def app(self):
+        return self.apps[self.current]
+
+    def switch(self, index=None):
+        """Suspend the running app and resume app index (default the next)."""
+        if index is None:
+            index = (self.current + 1) % len(self.apps)
+        self.app.suspend()
+        self.disp.SetStartLine(0)
+        self.current = index
+        self.app.resume()
+        print("→ %s" % self.app.name)
+
+    def tick(self, periods=1):
+        """One frame: switch on a combo press, then step the running app;
+        periods is what FramePacer.wait() returned."""
+        rpi = self.disp.RPI
+        held = [rpi.digital_read(pin) for pin in self._combo]
+        if all(held) and not self._held:
+            t0 = time.perf_counter_ns()
+            self.switch()
+            self.shared.RPI.masked = True
+            self.app.step(periods)
+            self.switches.append(time.perf_counter_ns() - t0)
+        else:
+            # Keys reach the apps again once every combo key is let go
+            if not any(held):
+                self.shared.RPI.masked = False
+            self.app.step(periods)
+        self._held = all(held)
+
+    def close(self):
+        self.app.suspend()
+        for app in self.apps:
+            app.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several UIs on one panel, KEY1+KEY3 switches")
+    parser.add_argument("apps", nargs="*", help="UI scripts (default: %s)" % ", ".join(DEFAULT_APPS))
+    parser.add_argument("--fps", type=float, default=20)
+    args = parser.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = args.apps or [os.path.join(here, name) for name in DEFAULT_APPS]
+
+    disp = displayd.open_display()
+    if disp.Init() != 0:
+        print("Error initializing display")
+        return 1
+    disp.clear()
+    host = Host(disp, paths)
+    host.load()
+    print("Hosting %s; KEY1+KEY3 switches" % ", ".join(app.name for app in host.apps))
+    # The apps live as long as the host: keep their objects out of the
+    # collector's way (see benchmark.py --allocations)
+    gc.collect()
+    gc.freeze()
+
+    pacer = pacing.FramePacer(fps=args.fps)
+    try:
+        while True:
+            periods = pacer.wait()
+            tracing.tick()
+            host.tick(periods)
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        host.close()
+        disp.clear()
+        disp.RPI.module_exit()
+        print(f"Frame pacing: {pacer.summary()}")
+        print(f"App switches: {host.switches.summary()}")
+        for app in host.apps:
+            if app.stats is not None:
+                print(f"{app.name}: frames sent {app.stats.frames}, skipped {app.stats.skipped}, errors {app.stats.errors}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
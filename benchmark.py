@@ -0,0 +1,527 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# benchmark.py — display path benchmarks against the emulated backend.
+#
+# Every stage of the display path is measured on its own:
+#   getbuffer.*   encoding a landscape / portrait PIL image
+#   showimage.*   ShowImage over SPI and I2C (EmulatedRaspberryPi + BusModel)
+#   show.*        the full getbuffer + ShowImage path
+#   screen.*      each UI screen function of biometric_attack.py
+#   transition.*  rendering one intermediate frame of each screen transition
+#   stream.*      encoding a delta frame for stream.py, and applying it
+#   controller.*  a 24x16 sprite moving, sent as each controller plans it
+#   fbdev.*       ShowImage / one changed box into an mmap'd framebuffer
+#                 (a temporary file standing in for /dev/fbN)
+#   wall.*        a full-screen change on a video wall; bus_us is the
+#                 slowest bus, which bounds the wall's frame rate
+#   hook.*        running an empty hook script to completion: a new
+#                 python3 per run, or through the warm hooks.py worker
+#
+# Results are frames/s, us/frame (CPU time measured here), bytes/frame and
+# bus_us/frame (modelled bus time on the Pi).  Inputs are seeded, runs are
+# repeated and the median is reported, so two runs on one machine compare.
+#
+#   python3 benchmark.py                          # print a table
+#   python3 benchmark.py --json out.json          # machine-readable results
+#   python3 benchmark.py --save-baseline base.json
+#   python3 benchmark.py --baseline base.json     # compare, exit 1 on regression
+#
+# --allocations checks instead that the UIs draw without allocating: each
+# UI ticks in each screen it can sit on (identify, the menus, the success
+# screens, screensaver, QR) under tracemalloc, and a tick allocating more
+# than its budget at once (ALLOC_PEAK_BUDGET; ALLOC_SEND_PEAK_BUDGET when
+# it sends a frame), or keeping memory from tick to tick, exits 1; so does
+# a screensaver that sends nothing.  golden.py runs the same check.
+#
+#   python3 benchmark.py --allocations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+import SH1106
+import config
+import emulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _random_image(size, seed):
+    rnd = random.Random(seed)
+    data = bytes(rnd.getrandbits(8) for _ in range(size[0] * size[1] // 8))
+    return Image.frombytes("1", size, data)
+
+
+def _display(device=config.Device_SPI):
+    rpi = emulator.EmulatedRaspberryPi(device)
+    disp = SH1106.SH1106(rpi)
+    disp.Init()
+    return disp
+
+
+class Bench(object):
+    def __init__(self, repeats=5, min_time=0.2):
+        self.repeats = repeats
+        self.min_time = min_time
+        self.results = {}
+
+    def run(self, name, fn, rpi=None, frames_per_call=1):
+        """Time fn() and record per-frame cost; rpi supplies bus counters."""
+        # Calibrate the iteration count so each repeat runs ~min_time
+        n = 1
+        while True:
+            t0 = time.perf_counter_ns()
+            for _ in range(n):
+                fn()
+            if time.perf_counter_ns() - t0 >= self.min_time * 1e9 / 4 or n >= 1 << 16:
+                break
+            n *= 2
+
+        samples = []
+        nbytes = bus_ns = 0
+        for _ in range(self.repeats):
+            before = (rpi.bytes_sent, rpi.bus_ns) if rpi else (0, 0)
+            frames0 = frames_per_call() if callable(frames_per_call) else 0
+            t0 = time.perf_counter_ns()
+            for _ in range(n):
+                fn()
+            elapsed = time.perf_counter_ns() - t0
+            if callable(frames_per_call):
+                frames = max(1, frames_per_call() - frames0)
+            else:
+                frames = n * frames_per_call
+            samples.append(elapsed / frames)
+            if rpi:
+                nbytes = (rpi.bytes_sent - before[0]) / frames
+                bus_ns = (rpi.bus_ns - before[1]) / frames
+
+        us = statistics.median(samples) / 1000.0
+        self.results[name] = {
+            "fps": round(1e6 / us, 1) if us else 0.0,
+            "us_per_frame": round(us, 1),
+            "bytes_per_frame": round(nbytes, 1),
+            "bus_us_per_frame": round(bus_ns / 1000.0, 1),
+        }
+        return self.results[name]
+
+
+def bench_encoder(bench):
+    disp = _display()
+    land = _random_image((128, 64), 1)
+    port = _random_image((64, 128), 2)
+    bench.run("getbuffer.landscape", lambda: disp.getbuffer(land))
+    bench.run("getbuffer.portrait", lambda: disp.getbuffer(port))
+
+
+def bench_transport(bench):
+    img = _random_image((128, 64), 3)
+    for label, device in (("spi", config.Device_SPI), ("i2c", config.Device_I2C)):
+        disp = _display(device)
+        buf = disp.getbuffer(img)
+        bench.run("showimage." + label, lambda: disp.ShowImage(buf), disp.RPI)
+        bench.run("show." + label, lambda: disp.ShowImage(disp.getbuffer(img)), disp.RPI)
+
+
+def bench_screens(bench, path=os.path.join(HERE, "biometric_attack.py")):
+    ui = emulator.load_ui(path)
+    rpi = ui.disp.RPI
+
+    def screen(fn, *args):
+        def call():
+            ui.stats.invalidate()   # measure the send, not the skip
+            fn(*args)
+        return call
+
+    bench.run("screen.identify", screen(ui.draw_identify_screen), rpi)
+    bench.run("screen.devices_found", screen(ui.draw_devices_found_screen, 0), rpi)
+    bench.run("screen.biometric_menu", screen(ui.draw_biometric_menu_screen, 1), rpi)
+    bench.run("screen.arm_success", screen(ui.draw_arm_success_screen, 0), rpi)
+    bench.run("screen.format_success", screen(ui.draw_format_success_screen), rpi)
+    bench.run("screen.screensaver", screen(ui.draw_screensaver_frame), rpi)
+    # Consecutive frames, as the screensaver runs: only the sprite's boxes are sent
+    bench.run("screen.screensaver.steady", ui.draw_screensaver_frame, rpi)
+    bench.run("screen.qr", screen(ui.draw_qr_screen), rpi)
+    if hasattr(ui, "arch_boot_animation"):
+        lines = ["[ OK ] Starting ARM", "[ OK ] Loading exploit", "[ ** ] Executing..."]
+        # Holds and pacing sleeps cost nothing on the virtual clock
+        with emulator.VirtualClock():
+            bench.run("screen.boot_animation",
+                      lambda: ui.arch_boot_animation(lines, "DOOR OPEN"), rpi,
+                      frames_per_call=lambda: ui.stats.frames)
+
+
+def bench_transitions(bench):
+    import pagebuf
+    import transitions
+    a = pagebuf.PageBuffer.from_image(_random_image((128, 64), 4))
+    b = pagebuf.PageBuffer.from_image(_random_image((128, 64), 5))
+    out = a.copy()
+    for kind in transitions.KINDS:
+        bench.run("transition." + kind, lambda: transitions.render(kind, a, b, 0.37, out))
+
+
+def bench_lists(bench):
+    import glyphs
+    import listview
+    import pagebuf
+    atlas = glyphs.default()
+
+    def row(draw, x, y, w, h, text, selected):
+        draw.rectangle((x, y, x + w, y + h), outline=0, fill=0 if selected else 1)
+        atlas.text(draw, (x + 4, y + 3), text, fill=1 if selected else 0)
+
+    # One cursor step per frame; the cost should not depend on the length
+    for n in (200, 20000):
+        menu = listview.ListView(["Device %05d" % i for i in range(n)], row, rows=3, pitch=15)
+        frame = pagebuf.PageBuffer()
+        bench.run("list.keypress.%d" % n, lambda: (menu.render(frame), menu.move(+1)))
+    lazy = listview.ListView(("Device %05d" % i for i in range(10 ** 9)), row, rows=3, pitch=15)
+    bench.run("list.keypress.lazy", lambda: (lazy.render(frame), lazy.move(+1)))
+
+
+def bench_playback(bench):
+    import playback
+    # Scale, dither and pack one full-size source frame, as the decoder does
+    frame = _random_image((1280, 640), 6).convert("L")
+    decoder = playback.Decoder(None, position=(0, 5), invert=True)
+    bench.run("playback.convert", lambda: decoder._convert(frame))
+    plain = playback.Decoder(None, dither=False)
+    bench.run("playback.convert.threshold", lambda: plain._convert(frame))
+
+
+def bench_stream(bench):
+    import pagebuf
+    import stream
+    before = pagebuf.PageBuffer.from_image(_random_image((128, 64), 9))
+    after = before.copy()
+    pagebuf.Draw(after).rectangle((40, 20, 63, 35), fill=0)
+    packet = stream.encode_delta(before.pages, after.pages, 2)
+    bench.run("stream.encode.delta", lambda: stream.encode_delta(before.pages, after.pages, 2))
+    pages = before.pages.copy()
+
+    def apply():
+        pages[:] = before.pages
+        stream.apply_delta(pages, packet)
+    bench.run("stream.apply.delta", apply)
+
+
+def bench_controllers(bench):
+    import controllers
+    import pagebuf
+    for name in sorted(controllers.CONTROLLERS):
+        controller = controllers.get(name)
+        rpi = emulator.EmulatedRaspberryPi(panel=emulator.SH1106Emulator(controller=controller))
+        disp = SH1106.SH1106(rpi, controller)
+        disp.Init()
+        buf = pagebuf.PageBuffer(disp.width, disp.height)
+        draw = pagebuf.Draw(buf)
+        pos = [0]
+
+        def move():
+            before = buf.copy()
+            x = pos[0] = (pos[0] + 3) % (disp.width - 24)
+            buf.clear()
+            draw.rectangle((x, 20, x + 23, 35), fill=0)
+            disp.ShowRegions(buf.tolist(), buf.diff(before))
+        bench.run("controller.%s" % name, move, rpi)
+
+
+def bench_fbdev(bench):
+    import tempfile
+    import fbdev
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(bytes(1024))
+        f.flush()
+        disp = fbdev.FramebufferDisplay(f.name, 128, 64, rpi=emulator.EmulatedRaspberryPi())
+        buf = disp.getbuffer(_random_image((128, 64), 10))
+        bench.run("fbdev.showimage", lambda: disp.ShowImage(buf))
+        bench.run("fbdev.region", lambda: disp.ShowRegions(buf, [(40, 16, 64, 32)]))
+        disp.close()
+
+
+class _WallCounters(object):
+    """Bus counters of a video wall for Bench.run(): bytes add up, bus
+    time is that of the busiest bus (the buses run in parallel)."""
+
+    def __init__(self, wall):
+        self.wall = wall
+
+    @property
+    def bytes_sent(self):
+        return sum(p.disp.RPI.bytes_sent for p in self.wall.panels)
+
+    @property
+    def bus_ns(self):
+        buses = {}
+        for p in self.wall.panels:
+            buses[p.bus] = buses.get(p.bus, 0) + p.disp.RPI.bus_ns
+        return max(buses.values())
+
+
+def bench_wall(bench):
+    import pagebuf
+    import videowall
+    frames = [_random_image((256, 64), seed) for seed in (7, 8)]
+    for label, layout in (("1panel", [("spi0", 0)]),
+                          ("2panel.2bus", [("spi0", 0), ("spi1", 128)]),
+                          ("2panel.1bus", [("spi0", 0), ("spi0", 128)])):
+        wall = videowall.VideoWall(videowall.Panel(_display(), x, 0, bus) for bus, x in layout)
+        bufs = []
+        for im in frames:
+            buf = pagebuf.PageBuffer.from_image(im.crop((0, 0, wall.width, 64)))
+            bufs.append(buf.pages)
+        flip = [0]
+
+        def frame():
+            flip[0] ^= 1
+            wall.frame.pages[:] = bufs[flip[0]]
+            wall.show()
+            wall.wait()
+        bench.run("wall." + label, frame, _WallCounters(wall))
+        wall.close()
+
+
+def bench_hooks(bench):
+    import subprocess
+    import tempfile
+    import hooks
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, "hook.py")
+        with open(script, "w") as f:
+            f.write("import json\n")
+        bench.run("hook.popen", lambda: subprocess.run([sys.executable, script], check=True))
+        runner = hooks.HookRunner([script])
+        bench.run("hook.worker", lambda: runner.run(script).wait())
+        runner.close()
+
+
+# -- Allocations in steady state ---------------------------------------------
+
+# The UIs, and the screens each one sits on for minutes: a tick of these
+# should draw and send (or skip) a frame without allocating anything
+ALLOC_UIS = ("biometric_attack.py", "biometric_attack (1).py", "biometric_attack (2).py", "edit.py")
+STEADY_STATES = ("STATE_IDENTIFY", "STATE_DEVICES_FOUND", "STATE_BIOMETRIC_MENU", "STATE_ARM_SUCCESS",
+                 "STATE_FORMAT_SUCCESS", "STATE_SCREENSAVER", "STATE_QR")
+# States that change the picture every tick: they must send, or the send
+# path went unmeasured
+ANIMATED_STATES = ("STATE_SCREENSAVER",)
+# The screensaver clip of the UIs that animate pngframes/nite*.bmp; it
+# ships zipped, so without it they would loop a one-frame fallback
+CLIP_ZIP = os.path.join(HERE, "pngframes.zip")
+CLIP_FRAMES = 8
+# Bytes a tick may have allocated at once (temporaries it frees again):
+# a tick that sends a frame also builds its transfer plan, a few dozen
+# small tuples, but never a frame-sized buffer (the worst measured is the
+# bouncing screensaver, 3144 B).  And bytes it may keep.
+ALLOC_PEAK_BUDGET = 1024
+ALLOC_SEND_PEAK_BUDGET = 3200
+ALLOC_RETAINED_BUDGET = 1
+
+
+def _tick(ui):
+    import tracing
+    tracing.tick()
+    ui.stats.begin_frame()
+    ui.step()
+
+
+def _clip_pages(ui, count=CLIP_FRAMES):
+    """The first count frames of the screensaver clip, made into pages the
+    way the UIs load pngframes/nite*.bmp."""
+    import io
+    import zipfile
+    import pagebuf
+    pages = []
+    with zipfile.ZipFile(CLIP_ZIP) as clip:
+        for name in sorted(n for n in clip.namelist() if n.endswith(".bmp"))[:count]:
+            frame = Image.open(io.BytesIO(clip.read(name))).convert("1")
+            frame = frame.resize((ui.width, ui.height), Image.Resampling.LANCZOS)
+            page = pagebuf.PageBuffer(ui.width, ui.height)
+            page.blit(frame, (0, 0))
+            pages.append(page)
+    return pages
+
+
+def allocations(paths, frames=200, warmup=20):
+    """Trace the allocations of each UI ticking in each steady state.
+
+    Returns rows (ui, state, frames sent per tick, peak bytes per tick,
+    retained bytes per tick).  The first `warmup` ticks of a state (drawing
+    its cached frames) are not traced; as in the UIs' main(), gc.freeze()
+    runs before the rest.  Retained bytes are counted from the third traced
+    tick: objects replaced every tick were allocated untraced before that.
+    A UI that found no screensaver clip gets the one in CLIP_ZIP.
+    """
+    import gc
+    import tracemalloc
+    rows = []
+    for path in paths:
+        ui = emulator.load_ui(path)
+        if len(getattr(ui, "animation_pages", ())) == 1:
+            ui.animation_pages = _clip_pages(ui)
+        try:
+            for state in STEADY_STATES:
+                with emulator.VirtualClock():
+                    ui.current_state = getattr(ui, state)
+                    ui.selected_option = 0
+                    for _ in range(warmup):
+                        _tick(ui)
+                    gc.collect()
+                    gc.freeze()
+                    tracemalloc.start()
+                    sent = ui.stats.frames
+                    peak = 0
+                    for n in range(frames + 2):
+                        if n == 2:
+                            start = tracemalloc.get_traced_memory()[0]
+                        tracemalloc.reset_peak()
+                        before = tracemalloc.get_traced_memory()[0]
+                        _tick(ui)
+                        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+                    retained = (tracemalloc.get_traced_memory()[0] - start) / frames
+                    tracemalloc.stop()
+                    gc.unfreeze()
+                sends = (ui.stats.frames - sent) / (frames + 2)
+                rows.append((os.path.basename(path), state[len("STATE_"):].lower(), sends, peak, retained))
+        finally:
+            if getattr(ui, "door_hooks", None):
+                ui.door_hooks.close()
+    return rows
+
+
+def allocation_problem(state, sends, peak, retained):
+    """What is wrong with a row of allocations(), or "" if nothing."""
+    if "STATE_" + state.upper() in ANIMATED_STATES and not sends:
+        return "sent no frames"
+    budget = ALLOC_SEND_PEAK_BUDGET if sends else ALLOC_PEAK_BUDGET
+    if peak > budget:
+        return "peak %d B over %d B" % (peak, budget)
+    if retained > ALLOC_RETAINED_BUDGET:
+        return "retains %.1f B per tick" % retained
+    return ""
+
+
+def check_allocations(args):
+    """--allocations: print the table, exit 1 if a state is over budget
+    (golden.py runs the same check)."""
+    rows = allocations([os.path.join(HERE, name) for name in ALLOC_UIS],
+                       frames=50 if args.quick else 200)
+    print("%-26s %-16s %11s %12s %16s" % ("ui", "state", "sent/tick", "peak B/tick", "retained B/tick"))
+    over = 0
+    for ui, state, sends, peak, retained in rows:
+        problem = allocation_problem(state, sends, peak, retained)
+        if problem:
+            over += 1
+        print("%-26s %-16s %11.2f %12d %16.1f%s" % (
+            ui, state, sends, peak, retained, "  " + problem.upper() if problem else ""))
+    if over:
+        print("%d state(s) over budget (peak %d B, %d B when sending; retained %d B per tick)" % (
+            over, ALLOC_PEAK_BUDGET, ALLOC_SEND_PEAK_BUDGET, ALLOC_RETAINED_BUDGET))
+        return 1
+    return 0
+
+
+def environment():
+    import numpy
+    import PIL
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "pillow": PIL.__version__,
+        "numpy": numpy.__version__,
+        "bus_models": dict((m.name, {"hz": m.hz, "overhead_us": m.overhead_us, "gpio_us": m.gpio_us})
+                           for m in (emulator.SPI_1MHZ, emulator.I2C_400KHZ)),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return (lines, regressions) comparing us/frame against a baseline."""
+    lines = []
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or not base["us_per_frame"]:
+            continue
+        ratio = res["us_per_frame"] / base["us_per_frame"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        lines.append("%-26s %10.1f -> %10.1f us  (x%.2f)  bytes %s -> %s%s" % (
+            name, base["us_per_frame"], res["us_per_frame"], ratio,
+            base["bytes_per_frame"], res["bytes_per_frame"], flag))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OLED display path")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument("--save-baseline", help="store results as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="short runs, for smoke testing")
+    parser.add_argument("--only", help="run only benchmarks whose name starts with this")
+    parser.add_argument("--allocations", action="store_true",
+                        help="trace allocations of the UIs' steady states instead, exit 1 over budget")
+    args = parser.parse_args(argv)
+    if args.allocations:
+        return check_allocations(args)
+
+    bench = Bench(repeats=2 if args.quick else args.repeats, min_time=0.02 if args.quick else 0.2)
+    groups = ((("getbuffer",), bench_encoder),
+              (("showimage", "show"), bench_transport),
+              (("screen",), bench_screens),
+              (("transition",), bench_transitions),
+              (("list",), bench_lists),
+              (("playback",), bench_playback),
+              (("stream",), bench_stream),
+              (("controller",), bench_controllers),
+              (("fbdev",), bench_fbdev),
+              (("wall",), bench_wall),
+              (("hook",), bench_hooks))
+    for prefixes, fn in groups:
+        if args.only and not any(p.startswith(args.only) or args.only.startswith(p) for p in prefixes):
+            continue
+        fn(bench)
+    results = dict((k, v) for k, v in bench.results.items()
+                   if not args.only or k.startswith(args.only))
+
+    print("%-26s %10s %12s %12s %14s" % ("benchmark", "fps", "us/frame", "bytes/frame", "bus us/frame"))
+    for name, res in results.items():
+        print("%-26s %10.1f %12.1f %12.1f %14.1f" % (
+            name, res["fps"], res["us_per_frame"], res["bytes_per_frame"], res["bus_us_per_frame"]))
+
+    report = {"environment": environment(), "results": results}
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        lines, regressions = compare(results, baseline, args.threshold)
+        print("\nvs baseline %s:" % args.baseline)
+        for line in lines:
+            print(line)
+        if regressions:
+            print("%d regression(s) over %d%%" % (len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,10 +6,22 @@
 #   1. Non-blocking animations via state machine (no time.sleep in main loop)
 #   2. Screensaver state checks buttons every iteration
 #   3. Aspect-ratio-preserving frame resize (centered on black canvas)
-#   4. Pixel-accurate text wrapping via font.getlength()
+#   4. Pixel-accurate text wrapping via the glyph atlas widths
 
-import SH1106
 import config
+import console
+import displayd
+import glyphs
+import listview
+import metrics
+import pacing
+import pagebuf
+import qrgen
+import snapshot
+import sprites
+import tracing
+import transitions
+import gc
 import time
 import os
 import glob
@@ -19,9 +31,8 @@ from PIL import Image, ImageDraw, ImageFont
 # INITIALIZE DISPLAY
 # =============================
 try:
-    disp = SH1106.SH1106()
+    disp = displayd.open_display()
     disp.Init()
-    disp.clear()
 except Exception as e:
     print(f"Error initializing display: {e}")
     exit(1)
@@ -29,10 +40,22 @@ except Exception as e:
 width  = disp.width   # 128
 height = disp.height  # 64
 
-try:
-    font = ImageFont.load_default()
-except Exception:
-    font = None
+# Per-frame timings and bus counters (see metrics.py)
+stats = metrics.from_env(disp.RPI)
+
+# Warm start (see snapshot.py): the screen shown when the UI last stopped
+# goes back on the panel at once; state and caches are restored below
+SNAPSHOT_PATH = snapshot.path_for(__file__)
+warm = snapshot.load(SNAPSHOT_PATH)
+if warm is not None and warm.frame is not None and (warm.frame.width, warm.frame.height) != (width, height):
+    warm.frame = None   # saved for another panel
+if warm is not None and warm.frame is not None:
+    stats.show(disp, warm.frame, start_line=warm.start_line)
+else:
+    disp.clear()
+
+# Default font, rasterized once into a glyph atlas (see glyphs.py)
+atlas = glyphs.default()
 
 # =============================
 # SCREEN STATES
@@ -102,66 +125,99 @@ if not animation_frames:
     draw_bmp.polygon([(8, 0), (16, 8), (8, 16), (0, 8)], outline=0, fill=0)
     animation_frames = [bmp]
 
+# Each frame blitted onto a blank screen once: a tick shows one as it is.
+animation_pages = []
+for frame in animation_frames:
+    page = pagebuf.PageBuffer(width, height)
+    page.blit(frame, (0, 0))
+    animation_pages.append(page)
+
 current_frame = 0
 
 # =============================
-# QR IMAGE
+# QR CODE
 # =============================
-try:
-    qr = Image.open("qr.png").convert("1")
-    qr = qr.resize((64, 64))
-except Exception:
-    try:
-        qr = Image.open("/mnt/user-data/uploads/qr.png").convert("1")
-        qr = qr.resize((64, 64))
-    except Exception as e:
-        print(f"Warning: QR code not found ({e}), using placeholder")
-        qr = Image.new("1", (64, 64), 1)
-        dq = ImageDraw.Draw(qr)
-        for i in range(0, 64, 8):
-            dq.line([(i, 0), (i, 64)], fill=0)
-            dq.line([(0, i), (64, i)], fill=0)
-        for cx, cy in [(0, 0), (56, 0), (0, 56)]:
-            dq.rectangle((cx, cy, cx + 8, cy + 8), outline=0)
-            dq.rectangle((cx + 2, cy + 2, cx + 6, cy + 6), fill=0)
+# Encoded on the device and drawn at an integer module scale (see qrgen.py)
+QR_PAYLOAD = "https://cryptonitemit.in/"
 
 # =============================
 # HELPER — DISPLAY
 # =============================
-def show(img: Image.Image):
+# Screen transitions: the state machine requests one when it changes
+# screens, and the next frame passed to show() slides in from the frame on
+# the panel instead of cutting to it (see transitions.py)
+pending_transition: "str | None" = None
+last_frame: "pagebuf.PageBuffer | None" = None
+
+def start_transition(kind: str) -> None:
+    """Play transition `kind` into the next screen shown"""
+    global pending_transition
+    pending_transition = kind
+
+def _show_transition(frame: pagebuf.PageBuffer, dirty: list) -> None:
+    stats.show(disp, frame, dirty)
+
+def show(img: "Image.Image | pagebuf.PageBuffer", dirty: "list | None" = None,
+         start_line: int = 0):
+    # Timed and counted by metrics; unchanged frames are not re-sent, and
+    # with dirty boxes (sprites.Scene.render(), console.Console.update())
+    # only those are
+    global pending_transition, last_frame
     try:
-        disp.ShowImage(disp.getbuffer(img))
+        if pending_transition and isinstance(img, pagebuf.PageBuffer) \
+                and isinstance(last_frame, pagebuf.PageBuffer):
+            transitions.play(_show_transition, last_frame, img, pending_transition)
+        pending_transition = None
+        stats.show(disp, img, dirty, start_line)
+        # A scrolled console frame is not what the panel rows show
+        last_frame = img if start_line == 0 else None
     except Exception as e:
+        stats.error(e)
         print(f"Display error: {e}")
 
+# =============================
+# OVERLAYS
+# =============================
+# Modal boxes and toasts are layers composited over the frame on the panel
+# (see sprites.Scene): showing or hiding one sends only its box
+overlays = sprites.Scene(pagebuf.PageBuffer(width, height))
+
+def show_overlay(sprite: sprites.Sprite, x: int, y: int, z: int = 0,
+                 op: str = "copy") -> sprites.Actor:
+    if last_frame is not overlays.frame:
+        # New screen underneath: start from what the panel shows
+        for layer in list(overlays.actors):
+            overlays.remove(layer)
+        overlays.set_background(last_frame.copy() if last_frame is not None
+                                else pagebuf.PageBuffer(width, height))
+        overlays.render()
+        stats.adopt(overlays.frame)
+    layer = overlays.add(sprite, x, y, z, op)
+    show(overlays.frame, overlays.render())
+    return layer
+
+def hide_overlay(layer: sprites.Actor) -> None:
+    overlays.remove(layer)
+    show(overlays.frame, overlays.render())
+
+def modal_box(text: str, text_x: int, w: int = 108, h: int = 30) -> sprites.Sprite:
+    """Opaque double-ruled box with a line of text, as an overlay"""
+    box  = pagebuf.PageBuffer(w + 1, (h + 8) & ~7)
+    draw = pagebuf.Draw(box)
+    draw.rectangle((0, 0, w, h), outline=0)
+    draw.rectangle((2, 2, w - 2, h - 2), outline=0)
+    atlas.text(draw, (text_x, 8), text, fill=0)
+    return sprites.Sprite(pagebuf.PageBuffer._unpack(box)[:h + 1])
+
 # =============================
 # FIX 4 — PIXEL-ACCURATE TEXT WRAPPING
 # =============================
 def _wrap_text(text: str, max_px: int) -> list[str]:
     """
     Split *text* into lines whose rendered width does not exceed *max_px*.
-    Uses font.getlength() when available; falls back to character counting.
+    Widths come from the glyph atlas, so this is one pass over the words.
     """
-    def text_width(s: str) -> float:
-        if font and hasattr(font, "getlength"):
-            return font.getlength(s)
-        # Fallback: default font is ~6 px per character
-        return len(s) * 6.0
-
-    words  = text.split()
-    lines  = []
-    line   = ""
-    for word in words:
-        candidate = (line + " " + word).lstrip()
-        if text_width(candidate) <= max_px:
-            line = candidate
-        else:
-            if line:
-                lines.append(line)
-            line = word
-    if line:
-        lines.append(line)
-    return lines
+    return atlas.wrap(text, max_px)
 
 # =============================
 # HELPER — BUTTON (draws a filled or outline button)
@@ -169,10 +225,10 @@ def _wrap_text(text: str, max_px: int) -> list[str]:
 def draw_button(draw, x, y, w, h, text, selected=False):
     if selected:
         draw.rectangle((x, y, x + w, y + h), outline=0, fill=0)
-        draw.text((x + 4, y + 3), text, font=font, fill=1)
+        atlas.text(draw, (x + 4, y + 3), text, fill=1)
     else:
         draw.rectangle((x, y, x + w, y + h), outline=0, fill=1)
-        draw.text((x + 4, y + 3), text, font=font, fill=0)
+        atlas.text(draw, (x + 4, y + 3), text, fill=0)
 
 # =============================
 # NON-BLOCKING ANIMATION STATE  (FIX 1)
@@ -183,19 +239,106 @@ def draw_button(draw, x, y, w, h, text, selected=False):
 
 _anim_steps        = []    # list of (phase, payload, duration_ms)
 _anim_step_index   = 0
-_anim_step_start   = 0.0   # wall-clock time when current step began
+_anim_step_start   = 0.0   # monotonic deadline (s) at which current step began
 _anim_done_state   = STATE_ARM_SUCCESS   # state to enter when done
 
 _PHASE_BOOT_LINE  = "boot_line"   # payload = list of visible lines so far
 _PHASE_PROGRESS   = "progress"    # payload = int 0-100
 _PHASE_SUCCESS    = "success"     # payload = final_message string
 
+def draw_cat(draw, cat_x: int, track_y: int, frame: int) -> None:
+    """Running cat standing on the loading bar, pose 0 or 1"""
+    if frame == 0:
+        # Running pose 1
+        draw.rectangle((cat_x, track_y - 5, cat_x + 8, track_y), fill=0)
+        draw.rectangle((cat_x + 6, track_y - 8, cat_x + 10, track_y - 4), fill=0)
+        draw.polygon([(cat_x + 6, track_y - 8), (cat_x + 7, track_y - 10), (cat_x + 8, track_y - 8)], fill=0)
+        draw.polygon([(cat_x + 8, track_y - 8), (cat_x + 9, track_y - 10), (cat_x + 10, track_y - 8)], fill=0)
+        draw.line([(cat_x, track_y - 4), (cat_x - 2, track_y - 7)], fill=0)
+        draw.line([(cat_x + 7, track_y), (cat_x + 7, track_y + 2)], fill=0)
+        draw.line([(cat_x + 2, track_y), (cat_x + 1, track_y + 2)], fill=0)
+    else:
+        # Running pose 2
+        draw.rectangle((cat_x, track_y - 4, cat_x + 8, track_y), fill=0)
+        draw.rectangle((cat_x + 6, track_y - 7, cat_x + 10, track_y - 3), fill=0)
+        draw.polygon([(cat_x + 6, track_y - 7), (cat_x + 7, track_y - 9), (cat_x + 8, track_y - 7)], fill=0)
+        draw.polygon([(cat_x + 8, track_y - 7), (cat_x + 9, track_y - 9), (cat_x + 10, track_y - 7)], fill=0)
+        draw.line([(cat_x, track_y - 3), (cat_x - 2, track_y - 5)], fill=0)
+        draw.line([(cat_x + 4, track_y), (cat_x + 4, track_y + 2)], fill=0)
+        draw.line([(cat_x + 5, track_y), (cat_x + 5, track_y + 2)], fill=0)
+
+def _cat_sprite(frame: int) -> sprites.Sprite:
+    # The cat covers cat_x-2..cat_x+10 and track_y-10..track_y+2
+    cat = Image.new("1", (13, 13), 1)
+    draw_cat(ImageDraw.Draw(cat), 2, 10, frame)
+    return sprites.Sprite.from_ink(cat)
+
+# Both poses compiled once into sprites (see sprites.py)
+CAT_POSES = [_cat_sprite(0), _cat_sprite(1)]
+
+
+class _ProgressScreen:
+    """
+    The progress step of the animation.  "Processing", the bar track and
+    "Please wait..." are drawn once on the scene background; per step only
+    the percentage and the bar fill are redrawn and the cat sprite moved,
+    so only those boxes are sent.
+    """
+
+    TRACK_Y = 25
+
+    def __init__(self) -> None:
+        self.scene = sprites.Scene(pagebuf.PageBuffer(width, height))
+        self.draw  = pagebuf.Draw(self.scene.background)
+        track_y = self.TRACK_Y
+        atlas.text(self.draw, (30, 5), "Processing", fill=0)
+        self.draw.rectangle((10, track_y, 118, track_y + 8), outline=0)
+        self.draw.rectangle((11, track_y + 1, 117, track_y + 7), outline=0)
+        atlas.text(self.draw, (25, 40), "Please wait...", fill=0)
+        self.cat         = None
+        self.percent_box = None
+        self.shown       = None   # (progress, cat_frame) last drawn
+
+    def update(self, progress: int, cat_frame: int) -> None:
+        if self.shown == (progress, cat_frame):
+            return
+        self.shown = (progress, cat_frame)
+        draw, scene, track_y = self.draw, self.scene, self.TRACK_Y
+
+        if self.percent_box is not None:
+            x0, y0, x1, y1 = self.percent_box
+            draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=1)
+            scene.invalidate(self.percent_box)
+        self.percent_box = atlas.textbbox((100, 5), f"{progress}%")
+        atlas.text(draw, (100, 5), f"{progress}%", fill=0)
+        scene.invalidate(self.percent_box)
+
+        cat_x = 12 + int((104 * progress) / 100)
+
+        if progress > 0:
+            fill_width = int((106 * progress) / 100)
+            draw.rectangle((12, track_y + 2, 12 + fill_width, track_y + 6), fill=0)
+            scene.invalidate((12, track_y + 2, 13 + fill_width, track_y + 7))
+
+        if self.cat is None:
+            self.cat = scene.add(CAT_POSES[cat_frame], cat_x - 2, track_y - 10)
+        else:
+            scene.move(self.cat, cat_x - 2, track_y - 10, CAT_POSES[cat_frame])
+
+
+_progress: "_ProgressScreen | None" = None   # built when the bar is first shown
+_boot_log: "console.Console | None" = None   # built with the first boot line
+
+
 def _build_animation_steps(boot_lines: list[str],
                             final_message: str,
                             next_state: int) -> None:
     """Populate _anim_steps with boot-line, progress and success steps."""
     global _anim_steps, _anim_step_index, _anim_step_start, _anim_done_state
+    global _progress, _boot_log
     _anim_steps      = []
+    _progress        = None
+    _boot_log        = None
     _anim_step_index = 0
     _anim_step_start = time.monotonic()
     _anim_done_state = next_state
@@ -212,6 +355,7 @@ def _build_animation_steps(boot_lines: list[str],
     _anim_steps.append((_PHASE_SUCCESS, final_message, 2000))
 
 
+@tracing.traced
 def _tick_animation() -> bool:
     """
     Called once per main-loop iteration when in STATE_ARM_LOADING or
@@ -222,7 +366,7 @@ def _tick_animation() -> bool:
 
     Returns True when the entire animation sequence is finished.
     """
-    global _anim_step_index, _anim_step_start
+    global _anim_step_index, _anim_step_start, _progress, _boot_log
 
     if _anim_step_index >= len(_anim_steps):
         return True  # already done
@@ -232,51 +376,29 @@ def _tick_animation() -> bool:
     elapsed_ms = (now - _anim_step_start) * 1000.0
 
     # --- Render current step ---
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
+    img  = pagebuf.PageBuffer(width, height)
+    draw = pagebuf.Draw(img)
+    dirty = None
+    start_line = 0
 
     if phase == _PHASE_BOOT_LINE:
-        y_pos = 5
-        for line in payload[-5:]:   # show at most 5 lines
-            if y_pos < height - 10:
-                draw.text((5, y_pos), line, font=font, fill=0)
-                y_pos += 12
+        # At most 5 lines; older ones scroll off with the display start line
+        if _boot_log is None:
+            _boot_log = console.Console(atlas, x=5, y=5, line_height=12, rows=5,
+                                        width=width, height=height)
+        for line in payload[_boot_log.count:]:
+            _boot_log.append(line)
+        img        = _boot_log.ram
+        dirty      = _boot_log.update()
+        start_line = _boot_log.start_line
 
     elif phase == _PHASE_PROGRESS:
-        progress = payload
-        draw.text((30, 5), "Processing", font=font, fill=0)
-        draw.text((100, 5), f"{progress}%", font=font, fill=0)
-
-        track_y = 25
-        draw.rectangle((10, track_y, 118, track_y + 8), outline=0)
-        draw.rectangle((11, track_y + 1, 117, track_y + 7), outline=0)
-
-        cat_x = 12 + int((104 * progress) / 100)
-
-        if progress > 0:
-            fill_width = int((106 * progress) / 100)
-            draw.rectangle((12, track_y + 2, 12 + fill_width, track_y + 6), fill=0)
-
+        if _progress is None:
+            _progress = _ProgressScreen()
         # Alternating cat pose — use step index for animation variety
-        cat_frame = (_anim_step_index // 2) % 2
-        if cat_frame == 0:
-            draw.rectangle((cat_x, track_y - 5, cat_x + 8, track_y), fill=0)
-            draw.rectangle((cat_x + 6, track_y - 8, cat_x + 10, track_y - 4), fill=0)
-            draw.polygon([(cat_x + 6, track_y - 8), (cat_x + 7, track_y - 10), (cat_x + 8, track_y - 8)], fill=0)
-            draw.polygon([(cat_x + 8, track_y - 8), (cat_x + 9, track_y - 10), (cat_x + 10, track_y - 8)], fill=0)
-            draw.line([(cat_x, track_y - 4), (cat_x - 2, track_y - 7)], fill=0)
-            draw.line([(cat_x + 7, track_y), (cat_x + 7, track_y + 2)], fill=0)
-            draw.line([(cat_x + 2, track_y), (cat_x + 1, track_y + 2)], fill=0)
-        else:
-            draw.rectangle((cat_x, track_y - 4, cat_x + 8, track_y), fill=0)
-            draw.rectangle((cat_x + 6, track_y - 7, cat_x + 10, track_y - 3), fill=0)
-            draw.polygon([(cat_x + 6, track_y - 7), (cat_x + 7, track_y - 9), (cat_x + 8, track_y - 7)], fill=0)
-            draw.polygon([(cat_x + 8, track_y - 7), (cat_x + 9, track_y - 9), (cat_x + 10, track_y - 7)], fill=0)
-            draw.line([(cat_x, track_y - 3), (cat_x - 2, track_y - 5)], fill=0)
-            draw.line([(cat_x + 4, track_y), (cat_x + 4, track_y + 2)], fill=0)
-            draw.line([(cat_x + 5, track_y), (cat_x + 5, track_y + 2)], fill=0)
-
-        draw.text((25, 40), "Please wait...", font=font, fill=0)
+        _progress.update(payload, (_anim_step_index // 2) % 2)
+        img   = _progress.scene.frame
+        dirty = _progress.scene.render()
 
     elif phase == _PHASE_SUCCESS:
         # FIX 4: pixel-accurate wrapping within the box interior (max ~90 px)
@@ -287,209 +409,226 @@ def _tick_animation() -> bool:
         total_h = len(lines) * 12
         y_start = 32 - total_h // 2   # vertical-centre inside the box
         for i, ln in enumerate(lines):
-            draw.text((20, y_start + i * 12), ln, font=font, fill=0)
+            atlas.text(draw, (20, y_start + i * 12), ln, fill=0)
 
-    show(img)
+    show(img, dirty, start_line)
 
     # --- Advance step when duration has elapsed ---
-    if elapsed_ms >= duration_ms:
+    # Steps are chained on absolute deadlines so late ticks do not stretch
+    # the animation; steps whose whole duration already passed are skipped.
+    while elapsed_ms >= duration_ms:
         _anim_step_index += 1
-        _anim_step_start  = time.monotonic()
+        _anim_step_start += duration_ms / 1000.0
+        if _anim_step_index >= len(_anim_steps):
+            break
+        elapsed_ms -= duration_ms
+        duration_ms = _anim_steps[_anim_step_index][2]
 
     return _anim_step_index >= len(_anim_steps)
 
 # =============================
 # STATIC SCREEN DRAWING FUNCTIONS
 # =============================
+# Screens with nothing moving are drawn once per content and kept, like the
+# menu frames below: showing one again allocates and sends nothing.
+_screen_frames: dict = {}
+
+DISARMED_MODAL = modal_box("DISARMED", 20)
+
+@tracing.traced
 def draw_identify_screen():
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
-    draw.text((15, 3),  "BIOMETRIC ATTACK", font=font, fill=1)
-    draw.text((20, 25), "IDENTIFY",         font=font, fill=0)
-    draw.text((25, 37), "DEVICE",           font=font, fill=0)
-    draw.text((10, 52), "Press [CENTER]",   font=font, fill=0)
+    img = _screen_frames.get("identify")
+    if img is None:
+        img  = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
+        atlas.text(draw, (15, 3),  "BIOMETRIC ATTACK", fill=1)
+        atlas.text(draw, (20, 25), "IDENTIFY",         fill=0)
+        atlas.text(draw, (25, 37), "DEVICE",           fill=0)
+        atlas.text(draw, (10, 52), "Press [CENTER]",   fill=0)
+        _screen_frames["identify"] = img
     show(img)
 
+# Menus are scrolling lists (see listview.py) drawn into one frame per
+# screen that is kept between calls, so moving the cursor redraws two rows
+devices_menu   = listview.ListView(["Biometric Lock", "Re-scan"], draw_button)
+biometric_menu = listview.ListView(["ARM", "FORMAT"], draw_button)
+_menu_frames: dict = {}
+
+def show_menu(menu: listview.ListView, title: str, title_x: int, selected: int) -> None:
+    frame = _menu_frames.get(title)
+    if frame is None:
+        frame = pagebuf.PageBuffer(width, height)
+        draw  = pagebuf.Draw(frame)
+        draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
+        atlas.text(draw, (title_x, 3), title, fill=1)
+        _menu_frames[title] = frame
+    menu.select(selected)
+    show(frame, menu.render(frame))
+
+@tracing.traced
 def draw_devices_found_screen(selected):
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
-    draw.text((20, 3), "DEVICES FOUND", font=font, fill=1)
-    draw_button(draw, 10, 20, 108, 15, "Biometric Lock", selected == 0)
-    draw_button(draw, 10, 40, 108, 15, "Re-scan",        selected == 1)
-    show(img)
+    show_menu(devices_menu, "DEVICES FOUND", 20, selected)
 
+@tracing.traced
 def draw_biometric_menu_screen(selected):
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
-    draw.text((10, 3), "BIOMETRIC LOCK", font=font, fill=1)
-    draw_button(draw, 10, 20, 108, 15, "ARM",    selected == 0)
-    draw_button(draw, 10, 40, 108, 15, "FORMAT", selected == 1)
-    show(img)
+    show_menu(biometric_menu, "BIOMETRIC LOCK", 10, selected)
 
+@tracing.traced
 def draw_arm_success_screen(selected):
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
-    draw.text((30, 3),  "DISARMED",        font=font, fill=1)
-    draw.text((15, 20), "Attack Complete", font=font, fill=0)
-    draw_button(draw, 10, 35, 108, 12, "Rerun Attack", selected == 0)
-    draw.text((15, 52), "Press [3] to exit", font=font, fill=0)
+    img = _screen_frames.get(("arm_success", selected))
+    if img is None:
+        img  = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
+        atlas.text(draw, (30, 3),  "DISARMED",        fill=1)
+        atlas.text(draw, (15, 20), "Attack Complete", fill=0)
+        draw_button(draw, 10, 35, 108, 12, "Rerun Attack", selected == 0)
+        atlas.text(draw, (15, 52), "Press [3] to exit", fill=0)
+        _screen_frames[("arm_success", selected)] = img
     show(img)
 
+@tracing.traced
 def draw_format_success_screen():
-    img  = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
-    draw.text((20, 3),  "FORMAT DONE",      font=font, fill=1)
-    draw.text((10, 25), "All users cleared", font=font, fill=0)
-    draw.text((15, 45), "Press [3] to exit", font=font, fill=0)
+    img = _screen_frames.get("format_success")
+    if img is None:
+        img  = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        draw.rectangle((0, 0, width - 1, 15), outline=0, fill=0)
+        atlas.text(draw, (20, 3),  "FORMAT DONE",      fill=1)
+        atlas.text(draw, (10, 25), "All users cleared", fill=0)
+        atlas.text(draw, (15, 45), "Press [3] to exit", fill=0)
+        _screen_frames["format_success"] = img
     show(img)
 
+@tracing.traced
+def draw_screensaver_frame(periods=1):
+    """Screensaver - one animation frame per tick"""
+    global current_frame
+    show(animation_pages[current_frame])
+    # One frame per period elapsed: late ticks skip frames, not slow down
+    current_frame = (current_frame + periods) % len(animation_pages)
+    # No extra sleep — the pacer at the top of the loop
+    # controls the frame rate (~20 FPS).
+
+@tracing.traced
+def draw_qr_screen():
+    """QR code, centred"""
+    show(qrgen.page(QR_PAYLOAD))
+
 # =============================
 # MAIN LOOP
 # =============================
-print("Starting Biometric Attack Interface...")
-print("Controls:")
-print("  UP/DOWN  : Navigate menu")
-print("  CENTER   : Select")
-print("  KEY1 (1) : Screensaver")
-print("  KEY2 (2) : QR Code")
-print("  KEY3 (3) : Return to identify screen (works ANY time, even during animation)")
+# =============================
+# WARM START (see snapshot.py)
+# =============================
+# Screens a restarted UI comes back to: not halfway through an animation
+RESUMABLE_STATES  = (STATE_IDENTIFY, STATE_DEVICES_FOUND, STATE_BIOMETRIC_MENU, STATE_ARM_SUCCESS,
+                     STATE_FORMAT_SUCCESS, STATE_SCREENSAVER, STATE_QR)
+CACHE_FINGERPRINT = snapshot.fingerprint(__file__, display=disp)
+
+def take_snapshot() -> snapshot.Snapshot:
+    """The screen, state and menu frames a restart comes back to."""
+    sent               = stats.last_sent(width, height)
+    frame, start_line  = sent if sent else (None, 0)
+    state              = current_state if current_state in RESUMABLE_STATES else STATE_IDENTIFY
+    caches             = {"menu:" + title: buf for title, buf in _menu_frames.items()}
+    return snapshot.Snapshot({"current_state": state, "selected_option": selected_option},
+                             frame, start_line, caches, CACHE_FINGERPRINT)
+
+if warm is not None:
+    if warm.state.get("current_state") in RESUMABLE_STATES:
+        current_state   = warm.state["current_state"]
+        selected_option = warm.state.get("selected_option", 0)
+    if warm.frame is not None and warm.start_line == 0:
+        last_frame = warm.frame
+    if warm.fingerprint == CACHE_FINGERPRINT:
+        for name, buf in warm.caches.items():
+            if name.startswith("menu:"):
+                _menu_frames[name[len("menu:"):]] = buf
+
+autosave = snapshot.Autosave(SNAPSHOT_PATH, take_snapshot)
 
-try:
-    FRAME_PERIOD = 0.05          # 20 Hz main loop  (~50 ms per tick)
-    last_tick    = time.monotonic()
-    button_db    = {}            # debounce registry
-
-    def btn(pin_attr: str) -> bool:
-        """Return True on the rising edge of a button (with debounce)."""
-        pressed = disp.RPI.digital_read(getattr(disp.RPI, pin_attr))
-        was     = button_db.get(pin_attr, False)
-        button_db[pin_attr] = pressed
-        return pressed and not was
-
-    while True:
-        # --- Enforce a consistent tick rate (non-blocking) ---
-        now   = time.monotonic()
-        delta = now - last_tick
-        if delta < FRAME_PERIOD:
-            time.sleep(FRAME_PERIOD - delta)
-        last_tick = time.monotonic()
-
-        # -------------------------------------------------------
-        # GLOBAL BUTTONS — checked every tick, including during
-        # animations (FIX 1 side-effect: interruption now works)
-        # -------------------------------------------------------
-        if btn("GPIO_KEY3_PIN"):
-            current_state   = STATE_IDENTIFY
+# =============================
+# APP LIFECYCLE (see apphost.py)
+# =============================
+button_db: dict = {}            # debounce registry
+
+def btn(pin_attr: str) -> bool:
+    """Return True on the rising edge of a button (with debounce)."""
+    pressed = disp.RPI.digital_read(getattr(disp.RPI, pin_attr))
+    was     = button_db.get(pin_attr, False)
+    button_db[pin_attr] = pressed
+    return pressed and not was
+
+def step(periods: int = 1) -> None:
+    """One tick: poll the buttons, advance the state machine, draw.
+
+    periods is how many frame periods elapsed since the last tick (what
+    FramePacer.wait() returned); the screensaver advances by it.
+    """
+    global current_state, selected_option
+
+    # -------------------------------------------------------
+    # GLOBAL BUTTONS — checked every tick, including during
+    # animations (FIX 1 side-effect: interruption now works)
+    # -------------------------------------------------------
+    if btn("GPIO_KEY3_PIN"):
+        current_state   = STATE_IDENTIFY
+        selected_option = 0
+        print("→ [KEY3] Returned to IDENTIFY screen")
+
+    if btn("GPIO_KEY1_PIN") and current_state not in (STATE_ARM_LOADING, STATE_FORMAT_LOADING):
+        current_state = STATE_SCREENSAVER
+        print("→ [KEY1] Screensaver")
+
+    if btn("GPIO_KEY2_PIN") and current_state not in (STATE_ARM_LOADING, STATE_FORMAT_LOADING):
+        current_state = STATE_QR
+        print("→ [KEY2] QR Code")
+
+    # -------------------------------------------------------
+    # STATE MACHINE
+    # -------------------------------------------------------
+
+    # ---- IDENTIFY ----
+    if current_state == STATE_IDENTIFY:
+        draw_identify_screen()
+        if btn("GPIO_KEY_PRESS_PIN"):
+            print("→ Scanning for devices...")
+            start_transition("slide_left")
+            current_state   = STATE_DEVICES_FOUND
             selected_option = 0
-            print("→ [KEY3] Returned to IDENTIFY screen")
-
-        if btn("GPIO_KEY1_PIN") and current_state not in (STATE_ARM_LOADING, STATE_FORMAT_LOADING):
-            current_state = STATE_SCREENSAVER
-            print("→ [KEY1] Screensaver")
-
-        if btn("GPIO_KEY2_PIN") and current_state not in (STATE_ARM_LOADING, STATE_FORMAT_LOADING):
-            current_state = STATE_QR
-            print("→ [KEY2] QR Code")
-
-        # -------------------------------------------------------
-        # STATE MACHINE
-        # -------------------------------------------------------
-
-        # ---- IDENTIFY ----
-        if current_state == STATE_IDENTIFY:
-            draw_identify_screen()
-            if btn("GPIO_KEY_PRESS_PIN"):
-                print("→ Scanning for devices...")
-                current_state   = STATE_DEVICES_FOUND
+
+    # ---- DEVICES FOUND ----
+    elif current_state == STATE_DEVICES_FOUND:
+        draw_devices_found_screen(selected_option)
+        if btn("GPIO_KEY_UP_PIN"):
+            selected_option = devices_menu.move(-1)
+        if btn("GPIO_KEY_DOWN_PIN"):
+            selected_option = devices_menu.move(+1)
+        if btn("GPIO_KEY_PRESS_PIN"):
+            if selected_option == 0:
+                print("→ Entering BIOMETRIC LOCK menu")
+                start_transition("slide_left")
+                current_state   = STATE_BIOMETRIC_MENU
+                selected_option = 0
+            else:
+                print("→ Re-scanning...")
+                start_transition("slide_right")
+                current_state   = STATE_IDENTIFY
                 selected_option = 0
 
-        # ---- DEVICES FOUND ----
-        elif current_state == STATE_DEVICES_FOUND:
-            draw_devices_found_screen(selected_option)
-            if btn("GPIO_KEY_UP_PIN"):
-                selected_option = (selected_option - 1) % 2
-            if btn("GPIO_KEY_DOWN_PIN"):
-                selected_option = (selected_option + 1) % 2
-            if btn("GPIO_KEY_PRESS_PIN"):
-                if selected_option == 0:
-                    print("→ Entering BIOMETRIC LOCK menu")
-                    current_state   = STATE_BIOMETRIC_MENU
-                    selected_option = 0
-                else:
-                    print("→ Re-scanning...")
-                    current_state   = STATE_IDENTIFY
-                    selected_option = 0
-
-        # ---- BIOMETRIC MENU ----
-        elif current_state == STATE_BIOMETRIC_MENU:
-            draw_biometric_menu_screen(selected_option)
-            if btn("GPIO_KEY_UP_PIN"):
-                selected_option = (selected_option - 1) % 2
-            if btn("GPIO_KEY_DOWN_PIN"):
-                selected_option = (selected_option + 1) % 2
-            if btn("GPIO_KEY_PRESS_PIN"):
-                if selected_option == 0:
-                    # FIX 1: kick off non-blocking ARM animation
-                    print("→ Executing ARM attack (non-blocking)...")
-                    _build_animation_steps(
-                        boot_lines=[
-                            "[ OK ] Starting ARM",
-                            "[ OK ] Loading exploit",
-                            "[ OK ] Bypassing auth",
-                            "[ OK ] Injecting code",
-                            "[ ** ] Executing...",
-                        ],
-                        final_message="DOOR OPEN",
-                        next_state=STATE_ARM_SUCCESS,
-                    )
-                    current_state   = STATE_ARM_LOADING
-                    selected_option = 0
-                else:
-                    # FIX 1: kick off non-blocking FORMAT animation
-                    print("→ Executing FORMAT attack (non-blocking)...")
-                    _build_animation_steps(
-                        boot_lines=[
-                            "[ OK ] Starting FORMAT",
-                            "[ OK ] Accessing DB",
-                            "[ OK ] Clearing users",
-                            "[ ** ] Wiping data...",
-                            "[ OK ] Cleanup done",
-                        ],
-                        final_message="FORMAT COMPLETE",
-                        next_state=STATE_FORMAT_SUCCESS,
-                    )
-                    current_state = STATE_FORMAT_LOADING
-
-        # ---- ARM LOADING (non-blocking animation) ----
-        elif current_state == STATE_ARM_LOADING:
-            # FIX 1: one frame of animation per loop tick; KEY3 can preempt
-            if _tick_animation():
-                # Also show the "DISARMED" splash for one extra beat
-                img  = Image.new("1", (width, height), 1)
-                draw = ImageDraw.Draw(img)
-                draw.rectangle((10, 10, 118, 40), outline=0)
-                draw.rectangle((12, 12, 116, 38), outline=0)
-                draw.text((30, 18), "DISARMED", font=font, fill=0)
-                show(img)
-                time.sleep(1.0)            # single intentional pause after done
-                current_state = _anim_done_state
-
-        # ---- FORMAT LOADING (non-blocking animation) ----
-        elif current_state == STATE_FORMAT_LOADING:
-            # FIX 1: same pattern
-            if _tick_animation():
-                current_state = _anim_done_state
-
-        # ---- ARM SUCCESS ----
-        elif current_state == STATE_ARM_SUCCESS:
-            draw_arm_success_screen(selected_option)
-            if btn("GPIO_KEY_PRESS_PIN"):
-                print("→ Rerunning ARM attack (non-blocking)...")
+    # ---- BIOMETRIC MENU ----
+    elif current_state == STATE_BIOMETRIC_MENU:
+        draw_biometric_menu_screen(selected_option)
+        if btn("GPIO_KEY_UP_PIN"):
+            selected_option = biometric_menu.move(-1)
+        if btn("GPIO_KEY_DOWN_PIN"):
+            selected_option = biometric_menu.move(+1)
+        if btn("GPIO_KEY_PRESS_PIN"):
+            if selected_option == 0:
+                # FIX 1: kick off non-blocking ARM animation
+                print("→ Executing ARM attack (non-blocking)...")
                 _build_animation_steps(
                     boot_lines=[
                         "[ OK ] Starting ARM",
@@ -501,43 +640,136 @@ try:
                     final_message="DOOR OPEN",
                     next_state=STATE_ARM_SUCCESS,
                 )
-                current_state = STATE_ARM_LOADING
-
-        # ---- FORMAT SUCCESS ----
-        elif current_state == STATE_FORMAT_SUCCESS:
-            draw_format_success_screen()
-            # Wait for KEY3 (handled globally above)
-
-        # ---- SCREENSAVER ----
-        elif current_state == STATE_SCREENSAVER:
-            # FIX 2: buttons are already polled at the top of every tick,
-            # so KEY1/KEY2/KEY3 respond immediately — no extra handling needed.
-            img = Image.new("1", (width, height), 1)
-            if animation_frames:
-                img.paste(animation_frames[current_frame], (0, 0))
-            show(img)
-            current_frame = (current_frame + 1) % len(animation_frames)
-            # No extra sleep — the FRAME_PERIOD at the top of the loop
-            # controls the frame rate (~20 FPS).
-
-        # ---- QR ----
-        elif current_state == STATE_QR:
-            img   = Image.new("1", (width, height), 1)
-            qr_x  = (width  - 64) // 2
-            qr_y  = (height - 64) // 2
-            img.paste(qr, (qr_x, qr_y))
-            show(img)
-
-except KeyboardInterrupt:
-    print("\nShutting down...")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-    import traceback
-    traceback.print_exc()
-finally:
+                current_state   = STATE_ARM_LOADING
+                selected_option = 0
+            else:
+                # FIX 1: kick off non-blocking FORMAT animation
+                print("→ Executing FORMAT attack (non-blocking)...")
+                _build_animation_steps(
+                    boot_lines=[
+                        "[ OK ] Starting FORMAT",
+                        "[ OK ] Accessing DB",
+                        "[ OK ] Clearing users",
+                        "[ ** ] Wiping data...",
+                        "[ OK ] Cleanup done",
+                    ],
+                    final_message="FORMAT COMPLETE",
+                    next_state=STATE_FORMAT_SUCCESS,
+                )
+                current_state = STATE_FORMAT_LOADING
+
+    # ---- ARM LOADING (non-blocking animation) ----
+    elif current_state == STATE_ARM_LOADING:
+        # FIX 1: one frame of animation per loop tick; KEY3 can preempt
+        if _tick_animation():
+            # Also show the "DISARMED" modal for one extra beat,
+            # over the final screen: only its box is sent
+            show_overlay(DISARMED_MODAL, 10, 10)
+            tracing.sleep(1.0)            # single intentional pause after done
+            current_state = _anim_done_state
+
+    # ---- FORMAT LOADING (non-blocking animation) ----
+    elif current_state == STATE_FORMAT_LOADING:
+        # FIX 1: same pattern
+        if _tick_animation():
+            current_state = _anim_done_state
+
+    # ---- ARM SUCCESS ----
+    elif current_state == STATE_ARM_SUCCESS:
+        draw_arm_success_screen(selected_option)
+        if btn("GPIO_KEY_PRESS_PIN"):
+            print("→ Rerunning ARM attack (non-blocking)...")
+            _build_animation_steps(
+                boot_lines=[
+                    "[ OK ] Starting ARM",
+                    "[ OK ] Loading exploit",
+                    "[ OK ] Bypassing auth",
+                    "[ OK ] Injecting code",
+                    "[ ** ] Executing...",
+                ],
+                final_message="DOOR OPEN",
+                next_state=STATE_ARM_SUCCESS,
+            )
+            current_state = STATE_ARM_LOADING
+
+    # ---- FORMAT SUCCESS ----
+    elif current_state == STATE_FORMAT_SUCCESS:
+        draw_format_success_screen()
+        # Wait for KEY3 (handled globally above)
+
+    # ---- SCREENSAVER ----
+    elif current_state == STATE_SCREENSAVER:
+        # FIX 2: buttons are already polled at the top of every tick,
+        # so KEY1/KEY2/KEY3 respond immediately — no extra handling needed.
+        draw_screensaver_frame(periods)
+
+    # ---- QR ----
+    elif current_state == STATE_QR:
+        draw_qr_screen()
+
+    # Keep the warm-start snapshot current (see snapshot.py)
+    autosave.tick()
+
+def suspend() -> None:
+    """The host switched to another app; step() is not called until resume()."""
+    button_db.clear()
+
+def resume() -> None:
+    """The host switched back: the panel shows another app's frame."""
+    global last_frame
+    stats.invalidate()
+    last_frame = None
+
+def shutdown() -> None:
+    """The UI (or its host) is exiting: save the snapshot for the next start."""
+    autosave.save()
+
+
+def main():
+    global current_state, selected_option
+
+    print("Starting Biometric Attack Interface...")
+    print("Controls:")
+    print("  UP/DOWN  : Navigate menu")
+    print("  CENTER   : Select")
+    print("  KEY1 (1) : Screensaver")
+    print("  KEY2 (2) : QR Code")
+    print("  KEY3 (3) : Return to identify screen (works ANY time, even during animation)")
+
     try:
-        disp.clear()
-        disp.RPI.module_exit()
-        print("Display cleaned up successfully")
-    except Exception:
-        pass
+        pacer        = pacing.FramePacer(fps=20)   # 20 Hz main loop (~50 ms per tick)
+
+        # Everything loaded so far lives as long as the UI: move it out of
+        # the collector's sight so steady-state ticks never rescan it
+        # (see benchmark.py --allocations).
+        gc.collect()
+        gc.freeze()
+
+        while True:
+            # --- Tick on absolute deadlines; overrun ticks are dropped ---
+            periods = pacer.wait()
+            tracing.tick()
+            stats.begin_frame()
+
+            step(periods)
+
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            shutdown()
+            disp.clear()
+            disp.RPI.module_exit()
+            print("Display cleaned up successfully")
+            print(f"Frame pacing: {pacer.summary()}")
+            print(f"Frames sent: {stats.frames}, skipped unchanged: {stats.skipped}, errors: {stats.errors}")
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    main()
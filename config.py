@@ -29,10 +29,14 @@
 
 
 import time
-from smbus import SMBus
-import spidev
 import ctypes
-from gpiozero import *
+try:
+    from smbus import SMBus
+    import spidev
+    from gpiozero import *
+except ImportError:
+    # Off the Pi (emulator, replay, benchmarks) only RaspberryPi() needs these
+    SMBus = spidev = None
 
 # Pin definition
 RST_PIN         = 25
@@ -53,21 +57,32 @@ Device_SPI = 1
 Device_I2C = 0
 
 class RaspberryPi:
-    def __init__(self,spi=spidev.SpiDev(0,0),spi_freq=40000000,rst = 27,dc = 25,bl = 18,bl_freq=1000,i2c=None):
+    # rst/dc are pin numbers, or devices already opened by another panel
+    # on the same bus (see videowall.py); keys=False leaves the key pins
+    # to another instance.
+    def __init__(self,spi=None,spi_freq=40000000,rst=None,dc=None,bl = 18,bl_freq=1000,i2c=None,
+                 device=Device_SPI,address=0x3c,keys=True):
         self.INPUT = False
         self.OUTPUT = True
+
+        # Bus counters, read by metrics.FrameMetrics
+        self.bytes_sent = 0
+        self.transactions = 0
+        self.gpio_toggles = 0
         
-        if(Device_SPI == 1):
+        if(device == Device_SPI):
             self.Device = Device_SPI
-            self.spi = spi
+            self.spi = spi if spi is not None else spidev.SpiDev(0,0)
         else :
             self.Device = Device_I2C
-            self.address = 0x3c
-            self.bus = SMBus(1)
+            self.address = address
+            self.bus = SMBus(i2c if i2c is not None else 1)
         
-        self.GPIO_RST_PIN = self.gpio_mode(RST_PIN,self.OUTPUT)
-        self.GPIO_DC_PIN = self.gpio_mode(DC_PIN,self.OUTPUT)
+        self.GPIO_RST_PIN = self._output(RST_PIN if rst is None else rst)
+        self.GPIO_DC_PIN = self._output(DC_PIN if dc is None else dc)
 
+        if not keys:
+            return
         self.GPIO_KEY_UP_PIN     = self.gpio_mode(KEY_UP_PIN,self.INPUT,True,None)
         self.GPIO_KEY_DOWN_PIN   = self.gpio_mode(KEY_DOWN_PIN,self.INPUT,True,None)
         self.GPIO_KEY_LEFT_PIN   = self.gpio_mode(KEY_LEFT_PIN,self.INPUT,True,None)
@@ -78,6 +93,11 @@ class RaspberryPi:
         self.GPIO_KEY2_PIN       = self.gpio_mode(KEY2_PIN,self.INPUT,True,None)
         self.GPIO_KEY3_PIN       = self.gpio_mode(KEY3_PIN,self.INPUT,True,None)
 
+    def _output(self, pin):
+        if isinstance(pin, int):
+            return self.gpio_mode(pin,self.OUTPUT)
+        return pin
+
 
 
     def delay_ms(self,delaytime):
@@ -97,6 +117,7 @@ class RaspberryPi:
         Pin.value = value
 
     def digital_write(self, Pin, value):
+        self.gpio_toggles += 1
         if value:
             Pin.on()
         else:
@@ -106,9 +127,13 @@ class RaspberryPi:
         return Pin.value
 
     def spi_writebyte(self,data):
-        self.spi.writebytes([data[0]])
+        self.bytes_sent += 1
+        self.transactions += 1
+        self.spi.writebytes(data)     # a one-byte list, not copied
 
     def i2c_writebyte(self,reg, value):
+        self.bytes_sent += 2   # control byte + value
+        self.transactions += 1
         self.bus.write_byte_data(self.address, reg, value)
     
     def module_init(self): 
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# console.py — scrolling text console using the SH1106 display start line.
+#
+# The controller shows RAM line (row + start_line) % 64 on panel row
+# `row`, so its 64-line RAM is a ring: scrolling the view is one 0x40-0x7F
+# command, and only the RAM rows that scroll into view have to be written.
+#
+# A Console keeps the lines it shows in a ring buffer and a shadow copy of
+# the panel RAM (a PageBuffer).  Each new line is drawn only into the rows
+# it reveals; update() returns the boxes of RAM that changed, and the
+# start line to show them with:
+#
+#   log = console.Console(atlas, x=5, y=5, line_height=12, rows=5)
+#   log.append("[ OK ] Starting ARM")
+#   show(log.ram, log.update(), log.start_line)
+#
+# With scroll_step set, update() moves the view that many pixels per call
+# (smooth scrolling, one call per frame) until the newest line is in view.
+
+import collections
+
+import numpy as np
+
+import pagebuf
+
+
+class Console(object):
+    """Log-style text area: black text on white, lines are appended at the
+    bottom and scroll up.
+
+    Line n is drawn at (x, y + n * line_height) of a virtual page that
+    scrolls by line_height once more than `rows` lines were appended.
+    scroll_step=None jumps a whole line at once.
+    """
+
+    def __init__(self, atlas, x=0, y=0, line_height=12, rows=5, scroll_step=None,
+                 width=128, height=64):
+        self.atlas = atlas
+        self.x = x
+        self.y = y
+        self.line_height = line_height
+        self.rows = rows
+        self.scroll_step = scroll_step
+        self.width = width
+        self.height = height
+        self.ram = pagebuf.PageBuffer(width, height)
+        self.top = 0            # virtual row at the top of the panel
+        self.target = 0         # where the view is scrolling to
+        self.count = 0          # lines appended so far
+        self.lines = collections.deque()    # (index, ink top, pixel rows)
+        self._pending = []      # virtual row ranges to repaint
+
+    @property
+    def start_line(self):
+        """Display start line that shows the view (for the 0x40 command)."""
+        return self.top % self.height
+
+    @property
+    def scrolling(self):
+        return self.top != self.target
+
+    def append(self, text):
+        """Add a line at the bottom; it is drawn by the next update()."""
+        n = self.count
+        self.count += 1
+        pos = (self.x, self.y + n * self.line_height)
+        x0, y0, x1, y1 = self.atlas.textbbox(pos, text)
+        # The line is rasterized once; repaints copy its rows
+        pix = None
+        if y1 > y0:
+            scratch = pagebuf.PageBuffer(self.width, (y1 - y0 + 7) & ~7)
+            self.atlas.text(scratch, (pos[0], pos[1] - y0), text, fill=0)
+            pix = pagebuf.PageBuffer._unpack(scratch)[:y1 - y0]
+        self.lines.append((n, y0, pix))
+        self._pending.append((y0, y1))
+        self.target = self.line_height * max(0, self.count - self.rows)
+
+    def update(self):
+        """Advance the scroll by one step and bring the RAM shadow up to
+        date; returns the changed boxes (page aligned, end exclusive)."""
+        before = self.ram.pages.copy()
+        if self.scrolling:
+            old = self.top
+            step = self.target - self.top
+            if self.scroll_step is not None:
+                step = min(step, self.scroll_step)
+            self.top += step
+            # Rows that came into view at the bottom
+            self._pending.append((old + self.height, self.top + self.height))
+        if not self.scrolling:
+            # Lines that left the view for good
+            first = self.count - self.rows
+            while self.lines and self.lines[0][0] < first:
+                n, y0, pix = self.lines.popleft()
+                if pix is not None:
+                    self._pending.append((y0, y0 + len(pix)))
+        for v0, v1 in self._pending:
+            self._repaint(v0, v1)
+        self._pending = []
+        return self.ram.diff(before)
+
+    def _repaint(self, v0, v1):
+        # Only rows inside the view exist in RAM
+        v0 = max(v0, self.top)
+        v1 = min(v1, self.top + self.height)
+        if v0 >= v1:
+            return
+        band = np.ones((v1 - v0, self.width), dtype=bool)
+        for n, y0, pix in self.lines:
+            if pix is None:
+                continue
+            a = max(v0, y0)
+            b = min(v1, y0 + len(pix))
+            if a < b:
+                band[a - v0:b - v0] &= pix[a - y0:b - y0]
+        # Write the band into the RAM ring, splitting where it wraps
+        row = v0 % self.height
+        split = min(len(band), self.height - row)
+        self.ram.blit(band[:split], (0, row))
+        if split < len(band):
+            self.ram.blit(band[split:], (0, 0))
@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# controllers.py — what differs between the OLED controllers we drive.
+#
+# A Controller declares a panel's geometry, its init sequence, how RAM is
+# addressed, and how to scroll; the SH1106 driver class (SH1106.py) sends
+# whatever plan the controller makes.  Changing panels is then
+#
+#   OLED_CONTROLLER=ssd1306 python3 biometric_attack.py
+#
+# with no code changes.  Supported: sh1106 (the default, 128x64 in a
+# 132-column RAM), ssd1306 and ssd1306_128x32, ssd1309, sh1107 (128x128).
+#
+# A transfer plan is a list of bursts (commands, p0, p1, x0, x1): the
+# command bytes, then the data of columns x0..x1-1 of pages p0..p1-1,
+# page by page.  plan() builds the candidate plans a controller can do
+# for a set of dirty boxes and returns the cheapest by bytes on the bus:
+#
+#   page addressing (SH1106, SH1107): one burst per page span, 3 command
+#       bytes each; spans closer than that are merged.
+#   horizontal addressing (SSD1306/9): a column/page window, 6 command
+#       bytes, takes any rectangle as one burst.  Spans, runs of pages
+#       with the same span, or the bounding box of everything, whichever
+#       is cheapest; a full frame is one 1 KiB burst.
+
+import os
+
+CONTRAST_DEFAULT = 0xA0
+
+
+class Controller(object):
+    name = None
+    width = 128
+    height = 64
+    ram_columns = 128
+    ram_pages = 8
+    column_offset = 0       # RAM column of panel column 0
+    # Commands followed by argument bytes, and how many (for emulator.py)
+    command_args = {0x81: 1, 0xA8: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1, 0xAD: 1}
+    # Sent after reset, between display off and (100 ms later) display on
+    init = ()
+    # Command bytes that open a burst
+    burst_overhead = 3
+
+    @property
+    def pages(self):
+        return self.height // 8
+
+    def start_line(self, line):
+        """Commands showing RAM line `line` on the top row."""
+        return (0x40 | (line & 0x3F),)
+
+    def burst(self, p0, p1, x0, x1):
+        raise NotImplementedError
+
+    @staticmethod
+    def cost(bursts):
+        """Bytes on the bus, counting a command/data switch as one."""
+        return sum(len(cmds) + (p1 - p0) * (x1 - x0) + 1 for cmds, p0, p1, x0, x1 in bursts)
+
+    def spans(self, rects):
+        """{page: [(x0, x1), ...]} column spans covering rects; spans closer
+        than a burst's commands are merged."""
+        spans = {}
+        for x0, y0, x1, y1 in rects:
+            x0, x1 = max(0, x0), min(self.width, x1)
+            if x0 >= x1:
+                continue
+            for page in range(max(0, y0 // 8), min(self.pages, (y1 + 7) // 8)):
+                spans.setdefault(page, []).append((x0, x1))
+        for page in spans:
+            merged = []
+            for x0, x1 in sorted(spans[page]):
+                if merged and x0 <= merged[-1][1] + self.burst_overhead - 1:
+                    merged[-1][1] = max(merged[-1][1], x1)
+                else:
+                    merged.append([x0, x1])
+            spans[page] = [tuple(span) for span in merged]
+        return spans
+
+    def candidates(self, spans):
+        """Plans that send at least the bytes of spans."""
+        yield [self.burst(page, page + 1, x0, x1) for page in sorted(spans) for x0, x1 in spans[page]]
+
+    def plan(self, rects):
+        """Cheapest burst list sending the bytes inside rects."""
+        spans = self.spans(rects)
+        if not spans:
+            return []
+        return min(self.candidates(spans), key=self.cost)
+
+    def full_frame(self):
+        return self.plan([(0, 0, self.width, self.height)])
+
+
+class PageAddressing(Controller):
+    def burst(self, p0, p1, x0, x1):
+        assert p1 == p0 + 1, "page addressing writes one page per burst"
+        column = x0 + self.column_offset
+        return ((0xB0 + p0, column & 0x0F, 0x10 | (column >> 4)), p0, p1, x0, x1)
+
+
+class HorizontalAddressing(Controller):
+    burst_overhead = 6
+    command_args = dict(Controller.command_args)
+    command_args.update({0x20: 1, 0x21: 2, 0x22: 2, 0x8D: 1})
+
+    def burst(self, p0, p1, x0, x1):
+        c0 = x0 + self.column_offset
+        return ((0x21, c0, c0 + x1 - x0 - 1, 0x22, p0, p1 - 1), p0, p1, x0, x1)
+
+    def candidates(self, spans):
+        yield from Controller.candidates(self, spans)
+        # Runs of consecutive pages with the same spans are one window each
+        bursts = []
+        run = None
+        for page in sorted(spans) + [None]:
+            if run is not None and page == run[1] and spans[page] == spans[run[0]]:
+                run[1] += 1
+                continue
+            if run is not None:
+                bursts.extend(self.burst(run[0], run[1], x0, x1) for x0, x1 in spans[run[0]])
+            run = None if page is None else [page, page + 1]
+        yield bursts
+        # Everything in one window
+        pages = sorted(spans)
+        x0 = min(span[0][0] for span in spans.values())
+        x1 = max(span[-1][1] for span in spans.values())
+        yield [self.burst(pages[0], pages[-1] + 1, x0, x1)]
+
+
+class SH1106(PageAddressing):
+    name = "sh1106"
+    ram_columns = 132
+    column_offset = 2
+    command_args = dict(Controller.command_args)
+    command_args.update({0x20: 1})
+    init = (
+        0x02, 0x10,         # column address 2 (panel column 0)
+        0x40,               # display start line 0
+        0x81, CONTRAST_DEFAULT,
+        0xA0,               # segment mapping
+        0xC0,               # COM scan direction
+        0xA6,               # normal display
+        0xA8, 0x3F,         # multiplex ratio 1/64
+        0xD3, 0x00,         # display offset
+        0xD5, 0x80,         # clock divide ratio / oscillator
+        0xD9, 0xF1,         # pre-charge 15 clocks, discharge 1
+        0xDA, 0x12,         # COM pins hardware configuration
+        0xDB, 0x40,         # VCOM deselect level
+        0x20, 0x02,         # page addressing mode
+        0xA4,               # RAM content, not entire display on
+        0xA6,               # not inverted
+    )
+
+
+class SSD1306(HorizontalAddressing):
+    name = "ssd1306"
+    init = (
+        0xD5, 0x80,         # clock divide ratio / oscillator
+        0xA8, 0x3F,         # multiplex ratio 1/64
+        0xD3, 0x00,         # display offset
+        0x40,               # display start line 0
+        0x8D, 0x14,         # charge pump on
+        0x20, 0x00,         # horizontal addressing mode
+        0xA0,               # segment mapping (as the SH1106 HAT)
+        0xC0,               # COM scan direction
+        0xDA, 0x12,         # COM pins hardware configuration
+        0x81, CONTRAST_DEFAULT,
+        0xD9, 0xF1,         # pre-charge
+        0xDB, 0x40,         # VCOM deselect level
+        0xA4,               # RAM content
+        0xA6,               # not inverted
+    )
+
+
+class SSD1306_128x32(SSD1306):
+    name = "ssd1306_128x32"
+    height = 32
+    init = (
+        0xD5, 0x80,         # clock divide ratio / oscillator
+        0xA8, 0x1F,         # multiplex ratio 1/32
+        0xD3, 0x00,         # display offset
+        0x40,               # display start line 0
+        0x8D, 0x14,         # charge pump on
+        0x20, 0x00,         # horizontal addressing mode
+        0xA0,               # segment mapping
+        0xC0,               # COM scan direction
+        0xDA, 0x02,         # COM pins: sequential
+        0x81, CONTRAST_DEFAULT,
+        0xD9, 0xF1,         # pre-charge
+        0xDB, 0x40,         # VCOM deselect level
+        0xA4,               # RAM content
+        0xA6,               # not inverted
+    )
+
+
+class SSD1309(HorizontalAddressing):
+    name = "ssd1309"
+    init = (
+        0xD5, 0xA0,         # clock divide ratio / oscillator
+        0xA8, 0x3F,         # multiplex ratio 1/64
+        0xD3, 0x00,         # display offset
+        0x40,               # display start line 0
+        0x20, 0x00,         # horizontal addressing mode (external VCC: no charge pump)
+        0xA0,               # segment mapping
+        0xC0,               # COM scan direction
+        0xDA, 0x12,         # COM pins hardware configuration
+        0x81, CONTRAST_DEFAULT,
+        0xD9, 0x22,         # pre-charge
+        0xDB, 0x34,         # VCOM deselect level 0.78 Vcc
+        0xA4,               # RAM content
+        0xA6,               # not inverted
+    )
+
+
+class SH1107(PageAddressing):
+    name = "sh1107"
+    height = 128
+    ram_pages = 16
+    # 0x20/0x21 (addressing mode) take no argument here
+    command_args = dict(Controller.command_args)
+    command_args.update({0xDC: 1})
+    init = (
+        0x00, 0x10,         # column address 0
+        0xB0,               # page 0
+        0xDC, 0x00,         # display start line 0
+        0x81, CONTRAST_DEFAULT,
+        0x20,               # page addressing mode
+        0xA0,               # segment mapping
+        0xC0,               # COM scan direction
+        0xA8, 0x7F,         # multiplex ratio 1/128
+        0xD3, 0x00,         # display offset
+        0xD5, 0x51,         # clock divide ratio / oscillator
+        0xD9, 0x22,         # pre-charge / discharge
+        0xDB, 0x35,         # VCOM deselect level
+        0xAD, 0x8A,         # DC-DC off (external supply)
+        0xA4,               # RAM content
+        0xA6,               # not inverted
+    )
+
+    def start_line(self, line):
+        return (0xDC, line & 0x7F)
+
+
+CONTROLLERS = dict((cls.name, cls) for cls in (SH1106, SSD1306, SSD1306_128x32, SSD1309, SH1107))
+
+
+def get(name):
+    """Controller instance for a name in CONTROLLERS (case-insensitive)."""
+    try:
+        return CONTROLLERS[name.lower()]()
+    except KeyError:
+        raise ValueError("unknown controller %r (one of %s)" % (name, ", ".join(sorted(CONTROLLERS))))
+
+
+def from_env():
+    """The controller named by OLED_CONTROLLER, default sh1106."""
+    return get(os.environ.get("OLED_CONTROLLER") or "sh1106")
@@ -0,0 +1,403 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# displayd.py — display daemon that owns the panel, and its clients.
+#
+# The daemon initializes the SH1106 once and keeps it.  Programs draw into
+# a framebuffer file (the PageBuffer layout, bit set = white; 1 KiB for
+# 128x64, sized for the panel's controller, see controllers.py) that they
+# and the daemon both mmap, and tell the daemon what to send over a Unix
+# socket, one command per line:
+#
+#   commit                       send the whole framebuffer
+#   region x0 y0 x1 y1 [...]     send these boxes (end exclusive)
+#   start N                      display start line (see console.py)
+#   contrast N                   0-255
+#   power 0|1                    panel off / on
+#   keys                         -> "ok <mask>", bit i = KEYS[i] pressed
+#   size                         -> "ok <width> <height>" of the framebuffer
+#
+# Every command is answered with "ok" or "error <reason>"; a commit is
+# answered once its bytes are on the bus.  Commits that arrive together,
+# from one client or several, are merged into one transfer.
+#
+#   OLED_BACKEND=emulator python3 displayd.py     # or on the Pi, as root
+#   OLED_BACKEND=displayd python3 biometric_attack.py
+#
+# With OLED_BACKEND=displayd, open_display() returns a RemoteDisplay: an
+# SH1106 stand-in whose Init() does not reset the panel, so switching
+# programs costs no reset and no full redraw.  Client gives direct access:
+# client.frame is a PageBuffer drawn straight into the shared memory.
+#
+# OLED_FB and OLED_SOCKET override the framebuffer and socket paths.
+
+import argparse
+import mmap
+import os
+import selectors
+import signal
+import socket
+import tempfile
+
+import numpy as np
+
+import SH1106
+import metrics
+import pagebuf
+
+# Order of the key bits in the answer to "keys"
+KEYS = ("KEY_UP", "KEY_DOWN", "KEY_LEFT", "KEY_RIGHT", "KEY_PRESS", "KEY1", "KEY2", "KEY3")
+
+
+def _runtime_dir():
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def fb_path():
+    return os.environ.get("OLED_FB") or os.path.join(_runtime_dir(), "oled-fb")
+
+
+def socket_path():
+    return os.environ.get("OLED_SOCKET") or os.path.join(tempfile.gettempdir(), "oled-displayd.sock")
+
+
+def _map(path, width, height, create=False):
+    """mmap of the framebuffer file of a width x height panel and a
+    (pages, width) array view of it."""
+    size = width * height // 8
+    fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o666)
+    try:
+        if create:
+            os.ftruncate(fd, size)
+        mm = mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+    pages = np.frombuffer(mm, dtype=np.uint8).reshape(height // 8, width)
+    return mm, pages
+
+
+# -- Daemon ------------------------------------------------------------------
+
+class _Connection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = b""
+
+
+class Daemon(object):
+    def __init__(self, disp, fb=None, sock_path=None):
+        self.disp = disp
+        self.stats = metrics.from_env(disp.RPI)
+        self.fb_path = fb or fb_path()
+        self.sock_path = sock_path or socket_path()
+        self._mm, self.fb = _map(self.fb_path, disp.width, disp.height, create=True)
+        self.fb[:] = 0xFF
+        # What the panel shows: only the boxes committed are copied in
+        self.frame = pagebuf.PageBuffer(disp.width, disp.height)
+        self.start_line = 0
+        # Commits not yet sent: True for the whole frame, else boxes
+        self._full = False
+        self._boxes = []
+        self._waiting = []      # connections to answer after the transfer
+        self.running = False
+
+    def serve(self):
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.sock_path)
+        listener.listen(8)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(listener, selectors.EVENT_READ, None)
+        self.running = True
+        try:
+            while self.running:
+                # Read everything that is ready before sending anything,
+                # so commits that arrive together become one transfer.
+                # Wake up now and then to notice stop().
+                timeout = 1.0
+                while self.running:
+                    events = self.sel.select(timeout)
+                    if not events:
+                        break
+                    for key, _ in events:
+                        if key.data is None:
+                            conn, _ = listener.accept()
+                            self.sel.register(conn, selectors.EVENT_READ, _Connection(conn))
+                        else:
+                            self._read(key.data)
+                    timeout = 0
+                self._flush()
+        finally:
+            self.sel.close()
+            listener.close()
+            if os.path.exists(self.sock_path):
+                os.unlink(self.sock_path)
+
+    def stop(self, *_):
+        self.running = False
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(4096)
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(conn)
+            return
+        conn.inbuf += data
+        while b"\n" in conn.inbuf:
+            line, conn.inbuf = conn.inbuf.split(b"\n", 1)
+            try:
+                reply = self._command(conn, line.decode("ascii").split())
+            except (ValueError, IndexError) as e:
+                reply = "error %s" % e
+            if reply is not None:
+                self._reply(conn, reply)
+
+    def _drop(self, conn):
+        self.sel.unregister(conn.sock)
+        conn.sock.close()
+        self._waiting = [c for c in self._waiting if c is not conn]
+
+    def _reply(self, conn, text):
+        try:
+            conn.sock.sendall(text.encode("ascii") + b"\n")
+        except OSError:
+            self._drop(conn)
+
+    def _command(self, conn, args):
+        """Run one command; returns the reply, or None to answer later."""
+        op = args[0] if args else ""
+        if op == "commit":
+            self._full = True
+            self._waiting.append(conn)
+            return None
+        if op == "region":
+            nums = [int(v) for v in args[1:]]
+            if not nums or len(nums) % 4:
+                raise ValueError("region needs x0 y0 x1 y1 boxes")
+            self._boxes.extend(tuple(nums[i:i + 4]) for i in range(0, len(nums), 4))
+            self._waiting.append(conn)
+            return None
+        # Everything else applies after the commits sent before it
+        self._flush()
+        if op == "start":
+            self.start_line = int(args[1])     # the controller masks it
+            self.disp.SetStartLine(self.start_line)
+        elif op == "contrast":
+            self.disp.SetContrast(int(args[1]))
+        elif op == "power":
+            self.disp.SetPower(bool(int(args[1])))
+        elif op == "keys":
+            rpi = self.disp.RPI
+            mask = 0
+            for i, name in enumerate(KEYS):
+                if rpi.digital_read(getattr(rpi, "GPIO_%s_PIN" % name)):
+                    mask |= 1 << i
+            return "ok %d" % mask
+        elif op == "size":
+            return "ok %d %d" % (self.disp.width, self.disp.height)
+        else:
+            raise ValueError("unknown command %r" % op)
+        return "ok"
+
+    def _flush(self):
+        if not self._waiting:
+            return
+        if self._full:
+            self.frame.pages[:] = self.fb
+            dirty = None
+        else:
+            # Take only the committed boxes: the rest of the framebuffer
+            # may hold drawing committed later, which must not count as
+            # sent when FrameMetrics remembers this frame
+            pages = self.frame.pages
+            for x0, y0, x1, y1 in self._boxes:
+                p0, p1 = max(0, y0) // 8, (y1 + 7) // 8
+                x0 = max(0, x0)
+                pages[p0:p1, x0:x1] = self.fb[p0:p1, x0:x1]
+            dirty = self._boxes
+        try:
+            self.stats.show(self.disp, self.frame, dirty, self.start_line)
+            reply = "ok"
+        except Exception as e:
+            self.stats.error(e)
+            reply = "error %s" % e
+        waiting, self._waiting = self._waiting, []
+        self._full = False
+        self._boxes = []
+        for conn in waiting:
+            self._reply(conn, reply)
+
+
+# -- Clients -----------------------------------------------------------------
+
+class Client(object):
+    """Connection to a running displayd.
+
+    frame is a PageBuffer over the shared framebuffer: drawing on it
+    writes the daemon's memory directly, commit() puts it on the panel.
+    """
+
+    def __init__(self, sock_path=None, fb=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(sock_path or socket_path())
+        self._rfile = self.sock.makefile("rb")
+        width, height = (int(v) for v in self.request("size").split())
+        self._mm, pages = _map(fb or fb_path(), width, height)
+        self.frame = pagebuf.PageBuffer.__new__(pagebuf.PageBuffer)
+        self.frame.width, self.frame.height = width, height
+        self.frame.pages = pages
+
+    def request(self, line):
+        self.sock.sendall(line.encode("ascii") + b"\n")
+        reply = self._rfile.readline().decode("ascii").strip()
+        if not reply.startswith("ok"):
+            raise IOError("displayd: %s" % (reply or "connection closed"))
+        return reply[3:]
+
+    def commit(self, boxes=None):
+        """Send the framebuffer, or only boxes of it (x0, y0, x1, y1)."""
+        if boxes is None:
+            self.request("commit")
+        elif boxes:
+            self.request("region " + " ".join("%d %d %d %d" % tuple(b) for b in boxes))
+
+    def set_start_line(self, line):
+        self.request("start %d" % line)
+
+    def set_contrast(self, value):
+        self.request("contrast %d" % value)
+
+    def power(self, on):
+        self.request("power %d" % bool(on))
+
+    def keys(self):
+        return int(self.request("keys"))
+
+    def close(self):
+        self._rfile.close()
+        self.sock.close()
+        self.frame = None
+        self._mm.close()
+
+
+class RemoteInputs(object):
+    """The key half of config.RaspberryPi, read through the daemon."""
+
+    Device = SH1106.Device_SPI
+
+    def __init__(self, client):
+        self.client = client
+        for i, name in enumerate(KEYS):
+            setattr(self, "GPIO_%s_PIN" % name, i)
+
+    def digital_read(self, pin):
+        return bool(self.client.keys() >> pin & 1)
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        self.client.close()
+
+
+class RemoteDisplay(object):
+    """SH1106 stand-in that draws through displayd."""
+
+    getbuffer = SH1106.SH1106.getbuffer
+
+    def __init__(self, client=None):
+        self.client = client or Client()
+        self.width = self.client.frame.width
+        self.height = self.client.frame.height
+        self.RPI = RemoteInputs(self.client)
+        self.Device = self.RPI.Device
+        self.contrast = SH1106.CONTRAST_DEFAULT
+
+    def Init(self):
+        # The daemon set the panel up already: no reset
+        return 0
+
+    def ShowImage(self, pBuf):
+        self.client.frame.pages.ravel()[:] = pBuf
+        self.client.commit()
+
+    def ShowRegions(self, pBuf, rects):
+        pages = self.client.frame.pages
+        src = np.asarray(pBuf, dtype=np.uint8).reshape(pages.shape)
+        for x0, y0, x1, y1 in rects:
+            pages[y0 // 8:(y1 + 7) // 8, x0:x1] = src[y0 // 8:(y1 + 7) // 8, x0:x1]
+        self.client.commit(rects)
+
+    def SetStartLine(self, line):
+        self.client.set_start_line(line)
+
+    def SetContrast(self, value):
+        value = max(0, min(255, int(value)))
+        self.client.set_contrast(value)
+        self.contrast = value
+
+    def FadeContrast(self, target, duration):
+        return SH1106.ContrastFade(self, target, duration)
+
+    def SetPower(self, on):
+        self.client.power(on)
+
+    def clear(self):
+        self.client.frame.clear()
+        self.client.commit()
+
+
+_shared = None
+
+
+def share(disp):
+    """Make open_display() return disp: apps run in one process by
+    apphost.py all draw on the one panel it initialized."""
+    global _shared
+    _shared = disp
+
+
+def open_display():
+    """The display a UI should draw on: the shared one (see share()), a
+    RemoteDisplay with OLED_BACKEND=displayd, the kernel framebuffer
+    OLED_FBDEV (default /dev/fb1) with OLED_BACKEND=fbdev, else the panel
+    itself."""
+    if _shared is not None:
+        return _shared
+    backend = os.environ.get("OLED_BACKEND")
+    if backend == "displayd":
+        return RemoteDisplay()
+    if backend == "fbdev":
+        import fbdev
+        return fbdev.FramebufferDisplay(os.environ.get("OLED_FBDEV", "/dev/fb1"))
+    return SH1106.SH1106()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Own the OLED panel and serve clients")
+    parser.add_argument("--fb", help="framebuffer file (default %s)" % fb_path())
+    parser.add_argument("--socket", help="control socket (default %s)" % socket_path())
+    args = parser.parse_args(argv)
+
+    disp = SH1106.SH1106()
+    if disp.Init() == -1:
+        print("Error initializing display")
+        return 1
+    disp.clear()
+    daemon = Daemon(disp, args.fb, args.socket)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        disp.clear()
+        disp.RPI.module_exit()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -6,8 +6,22 @@ import glob
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import SH1106
 import config
+import console
+import displayd
+import glyphs
+import hooks
+import listview
+import metrics
+import pacing
+import pagebuf
+import playback
+import qrgen
+import snapshot
+import sprites
+import tracing
+import transitions
+import gc
 import time
-import subprocess
 import random
 import os
 
@@ -15,36 +29,8 @@ import os
 # INITIALIZE DISPLAY (ONCE!)
 # =============================
 try:
-    disp = SH1106.SH1106()
+    disp = displayd.open_display()
     disp.Init()
-    disp.clear()
-    
-    print("\r1.3inch OLED")
-    print("***play animation")
-
-    # ---- ANIMATION PART ----
-    frames = sorted(glob.glob("images/nite*.bmp"))
-
-    if not frames:
-        print("No animation frames found!")
-    else:
-        for frame_file in frames:
-            niteAnim = Image.new('1', (disp.width, disp.height), 255)
-            bmp = Image.open(frame_file).resize((128, 64))
-            bmp = ImageOps.invert(bmp)
-            niteAnim.paste(bmp, (0, 5))
-            disp.ShowImage(disp.getbuffer(niteAnim))
-            time.sleep(0.00000001)
-    
-    disp.clear()
-    niteTxt = Image.new('1', (disp.width, disp.height), "WHITE")
-    draw = ImageDraw.Draw(niteTxt)
-    font10 = ImageFont.truetype('Monocraft.ttf', 20)
-    draw.text((0, 24), 'CRYPTONITE', font=font10, fill=0)
-    disp.ShowImage(disp.getbuffer(niteTxt))
-    time.sleep(3)
-    disp.clear()
-
 except Exception as e:
     print(f"Error initializing display: {e}")
     exit(1)
@@ -52,11 +38,22 @@ except Exception as e:
 width = disp.width
 height = disp.height
 
-# Use default font
-try:
-    font = ImageFont.load_default()
-except:
-    font = None
+# Per-frame timings and bus counters (see metrics.py)
+stats = metrics.from_env(disp.RPI)
+
+# Warm start (see snapshot.py): the screen shown when the UI last stopped
+# goes back on the panel at once; state and caches are restored below
+SNAPSHOT_PATH = snapshot.path_for(__file__)
+warm = snapshot.load(SNAPSHOT_PATH)
+if warm is not None and warm.frame is not None and (warm.frame.width, warm.frame.height) != (width, height):
+    warm.frame = None   # saved for another panel
+if warm is not None and warm.frame is not None:
+    stats.show(disp, warm.frame, start_line=warm.start_line)
+else:
+    disp.clear()
+
+# Default font, rasterized once into a glyph atlas (see glyphs.py)
+atlas = glyphs.default()
 
 # =============================
 # SCREEN STATES
@@ -101,30 +98,87 @@ diamond_y = 10
 dx = 2
 dy = 2
 
+# Screensaver scene: the picture is a sprite bouncing over a blank screen
+saver = sprites.Scene(pagebuf.PageBuffer(width, height))
+saver_bmp = saver.add(sprites.Sprite(bmp), diamond_x, diamond_y)
+
 # =============================
-# QR IMAGE
+# QR CODE
 # =============================
-try:
-    qr = Image.open("qr.png").convert("1")
-    qr = qr.resize((64, 64))
-except:
-    qr = Image.new("1", (64, 64), 1)
+# Encoded on the device and drawn at an integer module scale (see qrgen.py)
+QR_PAYLOAD = "https://cryptonitemit.in/"
 
 # =============================
 # HELPER FUNCTIONS
 # =============================
-def show(img):
+# Screen transitions: the state machine requests one when it changes
+# screens, and the next frame passed to show() slides in from the frame on
+# the panel instead of cutting to it (see transitions.py)
+pending_transition = None
+last_frame = None
+
+def start_transition(kind):
+    """Play transition `kind` into the next screen shown"""
+    global pending_transition
+    pending_transition = kind
+
+def _show_transition(frame, dirty):
+    stats.show(disp, frame, dirty)
+
+def show(img, dirty=None, start_line=0):
+    global pending_transition, last_frame
     try:
-        disp.ShowImage(disp.getbuffer(img))
+        if pending_transition and isinstance(img, pagebuf.PageBuffer) \
+                and isinstance(last_frame, pagebuf.PageBuffer):
+            transitions.play(_show_transition, last_frame, img, pending_transition)
+        pending_transition = None
+        stats.show(disp, img, dirty, start_line)
+        # A scrolled console frame is not what the panel rows show
+        last_frame = img if start_line == 0 else None
     except Exception as e:
+        stats.error(e)
         print(f"Error displaying image: {e}")
 
 # ✅ FIXED BUTTON TEXT ALIGNMENT HERE
+# Overlays (modal boxes, toasts) are layers composited over the frame on
+# the panel (see sprites.Scene): showing or hiding one sends only its box
+overlays = sprites.Scene(pagebuf.PageBuffer(width, height))
+
+def show_overlay(sprite, x, y, z=0, op="copy"):
+    """Composite sprite over the screen on the panel; returns its layer"""
+    if last_frame is not overlays.frame:
+        # New screen underneath: start from what the panel shows
+        for layer in list(overlays.actors):
+            overlays.remove(layer)
+        if last_frame is not None:
+            overlays.set_background(last_frame.copy())
+        else:
+            overlays.set_background(pagebuf.PageBuffer(width, height))
+        overlays.render()
+        stats.adopt(overlays.frame)
+    layer = overlays.add(sprite, x, y, z, op)
+    show(overlays.frame, overlays.render())
+    return layer
+
+def hide_overlay(layer):
+    """Take an overlay off the screen"""
+    overlays.remove(layer)
+    show(overlays.frame, overlays.render())
+
+def modal_box(text, text_x, w=108, h=30):
+    """Opaque double-ruled box with a line of text, as an overlay"""
+    box = pagebuf.PageBuffer(w + 1, (h + 8) & ~7)
+    draw = pagebuf.Draw(box)
+    draw.rectangle((0, 0, w, h), outline=0)
+    draw.rectangle((2, 2, w - 2, h - 2), outline=0)
+    atlas.text(draw, (text_x, 8), text, fill=0)
+    return sprites.Sprite(pagebuf.PageBuffer._unpack(box)[:h + 1])
+
 def draw_button(draw, x, y, w, h, text, selected=False):
     """Draw a button - filled if selected, outline if not"""
 
     # Calculate centered position
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = atlas.textbbox((0, 0), text)
     text_w = bbox[2] - bbox[0]
     text_h = bbox[3] - bbox[1]
     text_x = x + (w - text_w) // 2
@@ -133,10 +187,40 @@ def draw_button(draw, x, y, w, h, text, selected=False):
     if selected:
         draw.rectangle((x, y, x+w, y+h), outline=0, fill=0)
         draw.rectangle((x+1, y+1, x+w-1, y+h-1), outline=1, fill=1)
-        draw.text((text_x, text_y), text, font=font, fill=0)
+        atlas.text(draw, (text_x, text_y), text, fill=0)
     else:
         draw.rectangle((x, y, x+w, y+h), outline=0, fill=1)
-        draw.text((text_x, text_y), text, font=font, fill=0)
+        atlas.text(draw, (text_x, text_y), text, fill=0)
+
+def draw_cat(draw, cat_x, track_y, frame):
+    """Running cat standing on the loading bar, pose 0 or 1"""
+    if frame == 0:
+        # Running pose 1
+        draw.rectangle((cat_x, track_y - 5, cat_x + 8, track_y), fill=0)
+        draw.rectangle((cat_x + 6, track_y - 8, cat_x + 10, track_y - 4), fill=0)
+        draw.polygon([(cat_x + 6, track_y - 8), (cat_x + 7, track_y - 10), (cat_x + 8, track_y - 8)], fill=0)
+        draw.polygon([(cat_x + 8, track_y - 8), (cat_x + 9, track_y - 10), (cat_x + 10, track_y - 8)], fill=0)
+        draw.line([(cat_x, track_y - 4), (cat_x - 2, track_y - 7)], fill=0)
+        draw.line([(cat_x + 7, track_y), (cat_x + 7, track_y + 2)], fill=0)
+        draw.line([(cat_x + 2, track_y), (cat_x + 1, track_y + 2)], fill=0)
+    else:
+        # Running pose 2
+        draw.rectangle((cat_x, track_y - 4, cat_x + 8, track_y), fill=0)
+        draw.rectangle((cat_x + 6, track_y - 7, cat_x + 10, track_y - 3), fill=0)
+        draw.polygon([(cat_x + 6, track_y - 7), (cat_x + 7, track_y - 9), (cat_x + 8, track_y - 7)], fill=0)
+        draw.polygon([(cat_x + 8, track_y - 7), (cat_x + 9, track_y - 9), (cat_x + 10, track_y - 7)], fill=0)
+        draw.line([(cat_x, track_y - 3), (cat_x - 2, track_y - 5)], fill=0)
+        draw.line([(cat_x + 4, track_y), (cat_x + 4, track_y + 2)], fill=0)
+        draw.line([(cat_x + 5, track_y), (cat_x + 5, track_y + 2)], fill=0)
+
+def _cat_sprite(frame):
+    # The cat covers cat_x-2..cat_x+10 and track_y-10..track_y+2
+    cat = Image.new("1", (13, 13), 1)
+    draw_cat(ImageDraw.Draw(cat), 2, 10, frame)
+    return sprites.Sprite.from_ink(cat)
+
+# Both poses compiled once into sprites (see sprites.py)
+CAT_POSES = [_cat_sprite(0), _cat_sprite(1)]
 
 # =============================
 # (Everything below is EXACTLY your original code)
@@ -144,43 +228,55 @@ def draw_button(draw, x, y, w, h, text, selected=False):
 
 
 
+
+@tracing.traced
 def arch_boot_animation(lines, final_message):
     """Arch Linux style boot animation with loading bar and cat"""
-    # Phase 1: Boot messages
-    for i, line in enumerate(lines):
-        img = Image.new("1", (width, height), 1)
-        draw = ImageDraw.Draw(img)
-        
-        # Show previous lines
-        y_pos = 5
-        for j in range(max(0, i-4), i+1):
-            if y_pos < height - 10:
-                draw.text((5, y_pos), lines[j], font=font, fill=0)
-                y_pos += 12
-        
-        show(img)
-        time.sleep(0.3)
+    # Phase 1: Boot messages, the last 5 shown; older ones scroll off in
+    # hardware and only the new line's rows are sent (see console.py)
+    log = console.Console(atlas, x=5, y=5, line_height=12, rows=5, width=width, height=height)
+    for line in lines:
+        log.append(line)
+        show(log.ram, log.update(), log.start_line)
+        tracing.sleep(0.3)
     
-    time.sleep(0.3)
+    tracing.sleep(0.3)
     
     # Phase 2: Loading bar with cat
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    draw.text((20, 5), "Processing...", font=font, fill=0)
+    img = pagebuf.PageBuffer(width, height)
+    draw = pagebuf.Draw(img)
+    atlas.text(draw, (20, 5), "Processing...", fill=0)
     show(img)
-    time.sleep(0.3)
-    
-    for progress in range(0, 101, 3):
-        img = Image.new("1", (width, height), 1)
-        draw = ImageDraw.Draw(img)
-        
-        draw.text((30, 5), "Processing", font=font, fill=0)
-        draw.text((100, 5), f"{progress}%", font=font, fill=0)
+    tracing.sleep(0.3)
+    
+    # Progress advances with wall-clock time: 3% per 50 ms frame,
+    # skipping steps if a frame took longer than its budget
+    anim = pacing.FramePacer(fps=20)
+    progress = 0
+    # Static parts go on the scene background, the cat is a sprite; each
+    # frame only the percentage, the bar fill and the cat's boxes are sent
+    scene = sprites.Scene(pagebuf.PageBuffer(width, height))
+    draw = pagebuf.Draw(scene.background)
+    atlas.text(draw, (30, 5), "Processing", fill=0)
+    
+    # Loading bar track
+    track_y = 25
+    draw.rectangle((10, track_y, 118, track_y + 8), outline=0)
+    draw.rectangle((11, track_y + 1, 117, track_y + 7), outline=0)
+    
+    # Status text
+    atlas.text(draw, (25, 40), "Please wait...", fill=0)
+    cat = None
+    percent_box = None
+    while progress <= 100:
+        stats.begin_frame()
         
-        # Loading bar track
-        track_y = 25
-        draw.rectangle((10, track_y, 118, track_y + 8), outline=0)
-        draw.rectangle((11, track_y + 1, 117, track_y + 7), outline=0)
+        if percent_box is not None:
+            draw.rectangle((percent_box[0], percent_box[1], percent_box[2] - 1, percent_box[3] - 1), fill=1)
+            scene.invalidate(percent_box)
+        percent_box = atlas.textbbox((100, 5), f"{progress}%")
+        atlas.text(draw, (100, 5), f"{progress}%", fill=0)
+        scene.invalidate(percent_box)
         
         # Cat position
         cat_x = 12 + int((104 * progress) / 100)
@@ -189,38 +285,21 @@ def arch_boot_animation(lines, final_message):
         if progress > 0:
             fill_width = int((106 * progress) / 100)
             draw.rectangle((12, track_y + 2, 12 + fill_width, track_y + 6), fill=0)
+            scene.invalidate((12, track_y + 2, 13 + fill_width, track_y + 7))
         
-        # Draw running cat (alternating animation)
+        # Running cat (alternating animation)
         frame = (progress // 5) % 2
-        
-        if frame == 0:
-            # Running pose 1
-            draw.rectangle((cat_x, track_y - 5, cat_x + 8, track_y), fill=0)
-            draw.rectangle((cat_x + 6, track_y - 8, cat_x + 10, track_y - 4), fill=0)
-            draw.polygon([(cat_x + 6, track_y - 8), (cat_x + 7, track_y - 10), (cat_x + 8, track_y - 8)], fill=0)
-            draw.polygon([(cat_x + 8, track_y - 8), (cat_x + 9, track_y - 10), (cat_x + 10, track_y - 8)], fill=0)
-            draw.line([(cat_x, track_y - 4), (cat_x - 2, track_y - 7)], fill=0)
-            draw.line([(cat_x + 7, track_y), (cat_x + 7, track_y + 2)], fill=0)
-            draw.line([(cat_x + 2, track_y), (cat_x + 1, track_y + 2)], fill=0)
+        if cat is None:
+            cat = scene.add(CAT_POSES[frame], cat_x - 2, track_y - 10)
         else:
-            # Running pose 2
-            draw.rectangle((cat_x, track_y - 4, cat_x + 8, track_y), fill=0)
-            draw.rectangle((cat_x + 6, track_y - 7, cat_x + 10, track_y - 3), fill=0)
-            draw.polygon([(cat_x + 6, track_y - 7), (cat_x + 7, track_y - 9), (cat_x + 8, track_y - 7)], fill=0)
-            draw.polygon([(cat_x + 8, track_y - 7), (cat_x + 9, track_y - 9), (cat_x + 10, track_y - 7)], fill=0)
-            draw.line([(cat_x, track_y - 3), (cat_x - 2, track_y - 5)], fill=0)
-            draw.line([(cat_x + 4, track_y), (cat_x + 4, track_y + 2)], fill=0)
-            draw.line([(cat_x + 5, track_y), (cat_x + 5, track_y + 2)], fill=0)
-        
-        # Status text
-        draw.text((25, 40), "Please wait...", font=font, fill=0)
+            scene.move(cat, cat_x - 2, track_y - 10, CAT_POSES[frame])
         
-        show(img)
-        time.sleep(0.05)
+        show(scene.frame, scene.render())
+        progress += 3 * anim.wait()
     
     # Phase 3: Success message
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
+    img = pagebuf.PageBuffer(width, height)
+    draw = pagebuf.Draw(img)
     
     # Draw box
     draw.rectangle((10, 15, 118, 50), outline=0)
@@ -242,64 +321,103 @@ def arch_boot_animation(lines, final_message):
     # Center text
     y_start = 25 - (len(lines) * 6)
     for i, line in enumerate(lines):
-        draw.text((20, y_start + i * 12), line, font=font, fill=0)
+        atlas.text(draw, (20, y_start + i * 12), line, fill=0)
     
     show(img)
-    time.sleep(2)
+    tracing.sleep(2)
 
 # =============================
 # SCREEN DRAWING FUNCTIONS
 # =============================
+# Screens with nothing moving are drawn once per content and kept, like the
+# menu frames below: showing one again allocates and sends nothing
+screen_frames = {}
+
+@tracing.traced
 def draw_identify_screen():
     """Initial screen - IDENTIFY DEVICE"""
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    # Title
-    draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
-    draw.text((15, 3), "BIOMETRIC ATTACK", font=font, fill=1)
-    
-    # Main message
-    draw.text((20, 25), "IDENTIFY", font=font, fill=0)
-    draw.text((25, 37), "DEVICE", font=font, fill=0)
-    
-    # Instruction
-    draw.text((10, 52), "Press [CENTER]", font=font, fill=0)
+    img = screen_frames.get("identify")
+    if img is None:
+        img = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        
+        # Title
+        draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
+        atlas.text(draw, (15, 3), "BIOMETRIC ATTACK", fill=1)
+        
+        # Main message
+        atlas.text(draw, (20, 25), "IDENTIFY", fill=0)
+        atlas.text(draw, (25, 37), "DEVICE", fill=0)
+        
+        # Instruction
+        atlas.text(draw, (10, 52), "Press [CENTER]", fill=0)
+        screen_frames["identify"] = img
     
     show(img)
 
+# Menus are scrolling lists (see listview.py) drawn into one frame per
+# screen that is kept between calls, so moving the cursor redraws two rows
+devices_menu = listview.ListView(["Biometric Lock", "Re-scan"], draw_button)
+biometric_menu = listview.ListView(["ARM", "FORMAT"], draw_button)
+menu_frames = {}
+
+def show_menu(menu, title, title_x, selected):
+    """Menu screen: title bar and the list with entry `selected` highlighted"""
+    frame = menu_frames.get(title)
+    if frame is None:
+        frame = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(frame)
+        
+        # Title
+        draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
+        atlas.text(draw, (title_x, 3), title, fill=1)
+        menu_frames[title] = frame
+    
+    # Options: only the rows that changed
+    menu.select(selected)
+    show(frame, menu.render(frame))
+
+@tracing.traced
 def draw_devices_found_screen(selected):
     """Devices found screen with two options"""
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    # Title
-    draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
-    draw.text((20, 3), "DEVICES FOUND", font=font, fill=1)
-    
-    # Options
-    draw_button(draw, 10, 20, 108, 15, "Biometric Lock", selected == 0)
-    draw_button(draw, 10, 40, 108, 15, "Re-scan", selected == 1)
-    
-    show(img)
+    show_menu(devices_menu, "DEVICES FOUND", 20, selected)
 
+@tracing.traced
 def draw_biometric_menu_screen(selected):
     """Biometric lock menu - ARM or FORMAT"""
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    # Title
-    draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
-    draw.text((10, 3), "BIOMETRIC LOCK", font=font, fill=1)
-    
-    # Options
-    draw_button(draw, 10, 20, 108, 15, "ARM", selected == 0)
-    draw_button(draw, 10, 40, 108, 15, "FORMAT", selected == 1)
-    
-    show(img)
+    show_menu(biometric_menu, "BIOMETRIC LOCK", 10, selected)
+
+DISARMED_MODAL = modal_box("DISARMED", 20)
+
+# door.py runs in a hook worker started now (see hooks.py), so ARM does
+# not wait for an interpreter to start; door_call is the latest run
+DOOR_SCRIPT = None
+if os.path.exists("door.py"):
+    DOOR_SCRIPT = os.path.abspath("door.py")
+elif os.path.exists("/mnt/user-data/uploads/door.py"):
+    DOOR_SCRIPT = "/mnt/user-data/uploads/door.py"
+
+if DOOR_SCRIPT:
+    door_hooks = hooks.HookRunner([DOOR_SCRIPT])
+else:
+    door_hooks = None
+    print("door.py not found - continuing without external script")
+door_call = None
+
+def door_status():
+    """Status line of the ARM success screen: how door.py did"""
+    if door_call is None or door_call.status == "ok":
+        return "Attack Complete"
+    if door_call.status == "running":
+        return "Opening door..."
+    if door_call.status == "timeout":
+        return "Door timed out"
+    return "Door hook failed"
 
+@tracing.traced
 def arm_attack_sequence():
     """Execute ARM attack with boot animation"""
+    global door_call
     boot_lines = [
         "[ OK ] Starting ARM",
         "[ OK ] Loading exploit",
@@ -310,53 +428,41 @@ def arm_attack_sequence():
     
     arch_boot_animation(boot_lines, "DOOR OPEN")
     
-    # Launch door.py if it exists
-    door_script = None
-    if os.path.exists("door.py"):
-        door_script = "door.py"
-    elif os.path.exists("/mnt/user-data/uploads/door.py"):
-        door_script = "/mnt/user-data/uploads/door.py"
+    # Run door.py; the success screen shows its status as it comes in
+    if door_hooks:
+        door_call = door_hooks.run(DOOR_SCRIPT)
+        print(f"✓ Launched {DOOR_SCRIPT}")
     
-    if door_script:
-        try:
-            subprocess.Popen(["python3", door_script])
-            print(f"✓ Launched {door_script}")
-        except Exception as e:
-            print(f"Error launching door.py: {e}")
-    else:
-        print("door.py not found - continuing without external script")
-    
-    # Show DISARMED message
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    draw.rectangle((10, 10, 118, 40), outline=0)
-    draw.rectangle((12, 12, 116, 38), outline=0)
-    draw.text((30, 18), "DISARMED", font=font, fill=0)
-    
-    show(img)
-    time.sleep(1.5)
+    # DISARMED modal over the final screen: only its box is sent
+    show_overlay(DISARMED_MODAL, 10, 10)
+    tracing.sleep(1.5)
 
+@tracing.traced
 def draw_arm_success_screen(selected):
     """After ARM success - show rerun or back options"""
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    # Title
-    draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
-    draw.text((30, 3), "DISARMED", font=font, fill=1)
-    
-    # Status
-    draw.text((15, 20), "Attack Complete", font=font, fill=0)
-    
-    # Options
-    draw_button(draw, 10, 35, 108, 12, "Rerun Attack", selected == 0)
-    
-    # Instruction at bottom
-    draw.text((15, 52), "Press [3] to exit", font=font, fill=0)
+    status = door_status()
+    img = screen_frames.get(("arm_success", selected, status))
+    if img is None:
+        img = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        
+        # Title
+        draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
+        atlas.text(draw, (30, 3), "DISARMED", fill=1)
+        
+        # Status
+        atlas.text(draw, (15, 20), status, fill=0)
+        
+        # Options
+        draw_button(draw, 10, 35, 108, 12, "Rerun Attack", selected == 0)
+        
+        # Instruction at bottom
+        atlas.text(draw, (15, 52), "Press [3] to exit", fill=0)
+        screen_frames[("arm_success", selected, status)] = img
     
     show(img)
 
+@tracing.traced
 def format_attack_sequence():
     """Execute FORMAT attack with boot animation"""
     boot_lines = [
@@ -369,238 +475,383 @@ def format_attack_sequence():
     
     arch_boot_animation(boot_lines, "FORMAT COMPLETE")
 
+@tracing.traced
 def draw_format_success_screen():
     """After FORMAT success"""
-    img = Image.new("1", (width, height), 1)
-    draw = ImageDraw.Draw(img)
-    
-    # Title
-    draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
-    draw.text((20, 3), "FORMAT DONE", font=font, fill=1)
+    img = screen_frames.get("format_success")
+    if img is None:
+        img = pagebuf.PageBuffer(width, height)
+        draw = pagebuf.Draw(img)
+        
+        # Title
+        draw.rectangle((0, 0, width-1, 15), outline=0, fill=0)
+        atlas.text(draw, (20, 3), "FORMAT DONE", fill=1)
+        
+        # Status
+        atlas.text(draw, (10, 25), "All users cleared", fill=0)
+        
+        # Instruction
+        atlas.text(draw, (15, 45), "Press [3] to exit", fill=0)
+        screen_frames["format_success"] = img
     
-    # Status
-    draw.text((10, 25), "All users cleared", font=font, fill=0)
+    show(img)
+
+@tracing.traced
+def draw_screensaver_frame(periods=1):
+    """Screensaver - bounce the picture around the screen"""
+    global diamond_x, diamond_y, dx, dy
+    
+    # One step per frame period elapsed: the picture keeps its speed
+    # when a tick is late
+    for _ in range(periods):
+        # Update diamond position
+        diamond_x += dx
+        diamond_y += dy
+        
+        # Bounce off edges
+        if diamond_x <= 0 or diamond_x >= width - bmp_w:
+            dx *= -1
+        if diamond_y <= 0 or diamond_y >= height - bmp_h:
+            dy *= -1
+        
+        # Ensure diamond stays in bounds
+        diamond_x = max(0, min(width - bmp_w, diamond_x))
+        diamond_y = max(0, min(height - bmp_h, diamond_y))
     
-    # Instruction
-    draw.text((15, 45), "Press [3] to exit", font=font, fill=0)
+    # Move the picture; only its old and new boxes are redrawn and sent
+    saver.move(saver_bmp, diamond_x, diamond_y)
+    show(saver.frame, saver.render())
+
+@tracing.traced
+def draw_qr_screen():
+    """QR code screen"""
+    show(qrgen.page(QR_PAYLOAD))
+
+# =============================
+# INTRO ANIMATION + SPLASH
+# =============================
+def intro_frame(image):
+    """An intro clip frame as the intro always drew it: resized, inverted
+    and pasted on a white 1-bit screen, which PIL dithers (Floyd-Steinberg)"""
+    niteAnim = Image.new('1', (width, height), 255)
+    bmp = ImageOps.invert(image.resize((128, 64)))
+    niteAnim.paste(bmp, (0, 5))
+    return pagebuf.PageBuffer.from_image(niteAnim)
+
+def play_intro_clip():
+    """The animation part of the intro"""
+    frames = sorted(glob.glob("images/nite*.bmp"))
+
+    if not frames:
+        print("No animation frames found!")
+    else:
+        # Decoded on a worker thread and shown at 20 fps; frames that
+        # cannot be decoded and sent in time are dropped so the clip keeps
+        # its wall-clock length (see playback.py)
+        anim = playback.play(show, frames, fps=20, convert=intro_frame)
+        print(f"Animation: {anim['shown']} frames, {anim['dropped']} dropped")
+
+def play_intro():
+    print("\r1.3inch OLED")
+    print("***play animation")
+
+    # ---- ANIMATION PART ----
+    play_intro_clip()
     
-    show(img)
+    disp.clear()
+    stats.invalidate()
+    niteTxt = Image.new('1', (disp.width, disp.height), "WHITE")
+    draw = ImageDraw.Draw(niteTxt)
+    # Glyphs come from the on-disk atlas cache after the first launch
+    glyphs.truetype('Monocraft.ttf', 20).text(draw, (0, 24), 'CRYPTONITE', fill=0)
+    # Fade the title in and out with the contrast register: a couple of
+    # command bytes per step instead of rendering and sending fade frames
+    disp.SetContrast(0)
+    disp.ShowImage(disp.getbuffer(niteTxt))
+    fader = pacing.FramePacer(fps=50)
+    for target, hold in ((SH1106.CONTRAST_DEFAULT, 2.0), (0, 0)):
+        fade = disp.FadeContrast(target, 0.5)
+        while not fade.step():
+            fader.wait()
+        tracing.sleep(hold)
+    disp.clear()
+    disp.SetContrast(SH1106.CONTRAST_DEFAULT)
 
 # =============================
 # MAIN LOOP
 # =============================
-print("Starting Biometric Attack Interface...")
-print("Controls:")
-print("  UP/DOWN: Navigate menu")
-print("  CENTER: Select")
-print("  KEY1 (1): Screensaver")
-print("  KEY2 (2): QR Code")
-print("  KEY3 (3): Return to identify screen")
+# =============================
+# WARM START (see snapshot.py)
+# =============================
+# Screens a restarted UI comes back to: not halfway through an animation
+RESUMABLE_STATES = (STATE_IDENTIFY, STATE_DEVICES_FOUND, STATE_BIOMETRIC_MENU, STATE_ARM_SUCCESS,
+                    STATE_FORMAT_SUCCESS, STATE_SCREENSAVER, STATE_QR)
+CACHE_FINGERPRINT = snapshot.fingerprint(__file__, display=disp)
 
-try:
-    last_time = time.time()
-    frame_delay = 0.05
-    button_debounce = {}
-    
-    while True:
-        # Frame timing
-        current_time = time.time()
-        if current_time - last_time < frame_delay:
-            time.sleep(frame_delay - (current_time - last_time))
-        last_time = time.time()
+def take_snapshot():
+    """The screen, state and menu frames a restart comes back to"""
+    sent = stats.last_sent(width, height)
+    frame, start_line = sent if sent else (None, 0)
+    state = current_state if current_state in RESUMABLE_STATES else STATE_IDENTIFY
+    caches = dict(("menu:" + title, buf) for title, buf in menu_frames.items())
+    return snapshot.Snapshot({"current_state": state, "selected_option": selected_option},
+                             frame, start_line, caches, CACHE_FINGERPRINT)
+
+if warm is not None:
+    if warm.state.get("current_state") in RESUMABLE_STATES:
+        current_state = warm.state["current_state"]
+        selected_option = warm.state.get("selected_option", 0)
+    if warm.frame is not None and warm.start_line == 0:
+        last_frame = warm.frame
+    if warm.fingerprint == CACHE_FINGERPRINT:
+        for name, buf in warm.caches.items():
+            if name.startswith("menu:"):
+                menu_frames[name[len("menu:"):]] = buf
+
+autosave = snapshot.Autosave(SNAPSHOT_PATH, take_snapshot)
+
+# =============================
+# APP LIFECYCLE (see apphost.py)
+# =============================
+button_debounce = {}
+
+def step(periods=1):
+    """One frame: read the keys, run the current screen and draw it.
+    periods is how many frame periods elapsed since the last step (what
+    FramePacer.wait() returned); the screensaver advances by it"""
+    global current_state, selected_option
+    
+    # KEY1 - Screensaver mode
+    if disp.RPI.digital_read(disp.RPI.GPIO_KEY1_PIN):
+        if current_state != STATE_SCREENSAVER:
+            current_state = STATE_SCREENSAVER
+            print("→ Switched to SCREENSAVER mode")
+        tracing.sleep(0.3)
+    
+    # KEY2 - QR Code mode
+    if disp.RPI.digital_read(disp.RPI.GPIO_KEY2_PIN):
+        if current_state != STATE_QR:
+            current_state = STATE_QR
+            print("→ Switched to QR CODE mode")
+        tracing.sleep(0.3)
+    
+    # KEY3 always returns to identify screen
+    if disp.RPI.digital_read(disp.RPI.GPIO_KEY3_PIN):
+        current_state = STATE_IDENTIFY
+        selected_option = 0
+        print("→ Returned to IDENTIFY screen")
+        tracing.sleep(0.3)
+    
+    # =============================
+    # STATE: IDENTIFY DEVICE
+    # =============================
+    if current_state == STATE_IDENTIFY:
+        draw_identify_screen()
         
-        # KEY1 - Screensaver mode
-        if disp.RPI.digital_read(disp.RPI.GPIO_KEY1_PIN):
-            if current_state != STATE_SCREENSAVER:
-                current_state = STATE_SCREENSAVER
-                print("→ Switched to SCREENSAVER mode")
-            time.sleep(0.3)
+        # Center press to continue
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
+            if not button_debounce.get('press', False):
+                print("→ Scanning for devices...")
+                start_transition("slide_left")
+                current_state = STATE_DEVICES_FOUND
+                selected_option = 0
+                button_debounce['press'] = True
+                tracing.sleep(0.5)
+        else:
+            button_debounce['press'] = False
+    
+    # =============================
+    # STATE: DEVICES FOUND
+    # =============================
+    elif current_state == STATE_DEVICES_FOUND:
+        draw_devices_found_screen(selected_option)
         
-        # KEY2 - QR Code mode
-        if disp.RPI.digital_read(disp.RPI.GPIO_KEY2_PIN):
-            if current_state != STATE_QR:
-                current_state = STATE_QR
-                print("→ Switched to QR CODE mode")
-            time.sleep(0.3)
+        # Navigation
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_UP_PIN):
+            if not button_debounce.get('up', False):
+                selected_option = devices_menu.move(-1)
+                button_debounce['up'] = True
+                tracing.sleep(0.2)
+        else:
+            button_debounce['up'] = False
         
-        # KEY3 always returns to identify screen
-        if disp.RPI.digital_read(disp.RPI.GPIO_KEY3_PIN):
-            current_state = STATE_IDENTIFY
-            selected_option = 0
-            print("→ Returned to IDENTIFY screen")
-            time.sleep(0.3)
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_DOWN_PIN):
+            if not button_debounce.get('down', False):
+                selected_option = devices_menu.move(+1)
+                button_debounce['down'] = True
+                tracing.sleep(0.2)
+        else:
+            button_debounce['down'] = False
         
-        # =============================
-        # STATE: IDENTIFY DEVICE
-        # =============================
-        if current_state == STATE_IDENTIFY:
-            draw_identify_screen()
-            
-            # Center press to continue
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
-                if not button_debounce.get('press', False):
-                    print("→ Scanning for devices...")
-                    current_state = STATE_DEVICES_FOUND
+        # Selection
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
+            if not button_debounce.get('press', False):
+                if selected_option == 0:
+                    # Biometric Lock
+                    print("→ Entering BIOMETRIC LOCK menu")
+                    start_transition("slide_left")
+                    current_state = STATE_BIOMETRIC_MENU
+                    selected_option = 0
+                else:
+                    # Re-scan
+                    print("→ Re-scanning...")
+                    start_transition("slide_right")
+                    current_state = STATE_IDENTIFY
                     selected_option = 0
-                    button_debounce['press'] = True
-                    time.sleep(0.5)
-            else:
-                button_debounce['press'] = False
+                button_debounce['press'] = True
+                tracing.sleep(0.3)
+        else:
+            button_debounce['press'] = False
+    
+    # =============================
+    # STATE: BIOMETRIC MENU
+    # =============================
+    elif current_state == STATE_BIOMETRIC_MENU:
+        draw_biometric_menu_screen(selected_option)
         
-        # =============================
-        # STATE: DEVICES FOUND
-        # =============================
-        elif current_state == STATE_DEVICES_FOUND:
-            draw_devices_found_screen(selected_option)
-            
-            # Navigation
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_UP_PIN):
-                if not button_debounce.get('up', False):
-                    selected_option = (selected_option - 1) % 2
-                    button_debounce['up'] = True
-                    time.sleep(0.2)
-            else:
-                button_debounce['up'] = False
-            
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_DOWN_PIN):
-                if not button_debounce.get('down', False):
-                    selected_option = (selected_option + 1) % 2
-                    button_debounce['down'] = True
-                    time.sleep(0.2)
-            else:
-                button_debounce['down'] = False
-            
-            # Selection
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
-                if not button_debounce.get('press', False):
-                    if selected_option == 0:
-                        # Biometric Lock
-                        print("→ Entering BIOMETRIC LOCK menu")
-                        current_state = STATE_BIOMETRIC_MENU
-                        selected_option = 0
-                    else:
-                        # Re-scan
-                        print("→ Re-scanning...")
-                        current_state = STATE_IDENTIFY
-                        selected_option = 0
-                    button_debounce['press'] = True
-                    time.sleep(0.3)
-            else:
-                button_debounce['press'] = False
+        # Navigation
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_UP_PIN):
+            if not button_debounce.get('up', False):
+                selected_option = biometric_menu.move(-1)
+                button_debounce['up'] = True
+                tracing.sleep(0.2)
+        else:
+            button_debounce['up'] = False
         
-        # =============================
-        # STATE: BIOMETRIC MENU
-        # =============================
-        elif current_state == STATE_BIOMETRIC_MENU:
-            draw_biometric_menu_screen(selected_option)
-            
-            # Navigation
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_UP_PIN):
-                if not button_debounce.get('up', False):
-                    selected_option = (selected_option - 1) % 2
-                    button_debounce['up'] = True
-                    time.sleep(0.2)
-            else:
-                button_debounce['up'] = False
-            
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_DOWN_PIN):
-                if not button_debounce.get('down', False):
-                    selected_option = (selected_option + 1) % 2
-                    button_debounce['down'] = True
-                    time.sleep(0.2)
-            else:
-                button_debounce['down'] = False
-            
-            # Selection
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
-                if not button_debounce.get('press', False):
-                    if selected_option == 0:
-                        # ARM
-                        print("→ Executing ARM attack...")
-                        arm_attack_sequence()
-                        current_state = STATE_ARM_SUCCESS
-                        selected_option = 0
-                    else:
-                        # FORMAT
-                        print("→ Executing FORMAT attack...")
-                        format_attack_sequence()
-                        current_state = STATE_FORMAT_SUCCESS
-                    button_debounce['press'] = True
-                    time.sleep(0.3)
-            else:
-                button_debounce['press'] = False
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_DOWN_PIN):
+            if not button_debounce.get('down', False):
+                selected_option = biometric_menu.move(+1)
+                button_debounce['down'] = True
+                tracing.sleep(0.2)
+        else:
+            button_debounce['down'] = False
         
-        # =============================
-        # STATE: ARM SUCCESS
-        # =============================
-        elif current_state == STATE_ARM_SUCCESS:
-            draw_arm_success_screen(selected_option)
-            
-            # Selection (only rerun available, KEY3 for exit)
-            if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
-                if not button_debounce.get('press', False):
-                    print("→ Rerunning ARM attack...")
+        # Selection
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
+            if not button_debounce.get('press', False):
+                if selected_option == 0:
+                    # ARM
+                    print("→ Executing ARM attack...")
                     arm_attack_sequence()
-                    button_debounce['press'] = True
-                    time.sleep(0.3)
-            else:
-                button_debounce['press'] = False
+                    current_state = STATE_ARM_SUCCESS
+                    selected_option = 0
+                else:
+                    # FORMAT
+                    print("→ Executing FORMAT attack...")
+                    format_attack_sequence()
+                    current_state = STATE_FORMAT_SUCCESS
+                button_debounce['press'] = True
+                tracing.sleep(0.3)
+        else:
+            button_debounce['press'] = False
+    
+    # =============================
+    # STATE: ARM SUCCESS
+    # =============================
+    elif current_state == STATE_ARM_SUCCESS:
+        draw_arm_success_screen(selected_option)
         
-        # =============================
-        # STATE: FORMAT SUCCESS
-        # =============================
-        elif current_state == STATE_FORMAT_SUCCESS:
-            draw_format_success_screen()
-            # Just wait for KEY3 to exit
+        # Selection (only rerun available, KEY3 for exit)
+        if disp.RPI.digital_read(disp.RPI.GPIO_KEY_PRESS_PIN):
+            if not button_debounce.get('press', False):
+                print("→ Rerunning ARM attack...")
+                arm_attack_sequence()
+                button_debounce['press'] = True
+                tracing.sleep(0.3)
+        else:
+            button_debounce['press'] = False
+    
+    # =============================
+    # STATE: FORMAT SUCCESS
+    # =============================
+    elif current_state == STATE_FORMAT_SUCCESS:
+        draw_format_success_screen()
+        # Just wait for KEY3 to exit
+    
+    # =============================
+    # STATE: SCREENSAVER
+    # =============================
+    elif current_state == STATE_SCREENSAVER:
+        draw_screensaver_frame(periods)
+    
+    # =============================
+    # STATE: QR DISPLAY
+    # =============================
+    elif current_state == STATE_QR:
+        draw_qr_screen()
+        tracing.sleep(0.1)
+
+    # Keep the warm-start snapshot current (see snapshot.py)
+    autosave.tick()
+
+def suspend():
+    """The host switched to another app; step() is not called until resume()"""
+    button_debounce.clear()
+
+def resume():
+    """The host switched back: the panel shows another app's frame"""
+    global last_frame
+    stats.invalidate()
+    last_frame = None
+
+def shutdown():
+    """The UI (or its host) is exiting: save the snapshot for the next start"""
+    autosave.save()
+
+
+def main():
+    global current_state, selected_option
+
+    try:
+        if not snapshot.warm_start():
+            play_intro()    # OLED_WARM_START=1 resumes at once
+    except Exception as e:
+        print(f"Error initializing display: {e}")
+        exit(1)
+
+    print("Starting Biometric Attack Interface...")
+    print("Controls:")
+    print("  UP/DOWN: Navigate menu")
+    print("  CENTER: Select")
+    print("  KEY1 (1): Screensaver")
+    print("  KEY2 (2): QR Code")
+    print("  KEY3 (3): Return to identify screen")
+
+    try:
+        pacer = pacing.FramePacer(fps=20)
         
-        # =============================
-        # STATE: SCREENSAVER
-        # =============================
-        elif current_state == STATE_SCREENSAVER:
-            img = Image.new("1", (width, height), 1)
-            
-            # Update diamond position
-            diamond_x += dx
-            diamond_y += dy
-            
-            # Bounce off edges
-            if diamond_x <= 0 or diamond_x >= width - bmp_w:
-                dx *= -1
-            if diamond_y <= 0 or diamond_y >= height - bmp_h:
-                dy *= -1
-            
-            # Ensure diamond stays in bounds
-            diamond_x = max(0, min(width - bmp_w, diamond_x))
-            diamond_y = max(0, min(height - bmp_h, diamond_y))
-            
-            # Paste diamond image
-            img.paste(bmp, (diamond_x, diamond_y))
-            show(img)
+        # Everything loaded so far lives as long as the UI: move it out of
+        # the collector's sight so steady-state ticks never rescan it
+        # (see benchmark.py --allocations)
+        gc.collect()
+        gc.freeze()
         
-        # =============================
-        # STATE: QR DISPLAY
-        # =============================
-        elif current_state == STATE_QR:
-            img = Image.new("1", (width, height), 1)
-            
-            # Center QR code
-            qr_x = (width - 64) // 2
-            qr_y = 0
-            
-            img.paste(qr, (qr_x, qr_y))
-            show(img)
-            time.sleep(0.1)
-
-except KeyboardInterrupt:
-    print("\nShutting down...")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-    import traceback
-    traceback.print_exc()
-finally:
-    try:
-        disp.clear()
-        disp.RPI.module_exit()
-        print("Display cleaned up successfully")
-    except:
-        pass
+        while True:
+            # Frame timing - absolute deadlines, overrun frames are dropped
+            periods = pacer.wait()
+            tracing.tick()
+            stats.begin_frame()
+            step(periods)
+
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            shutdown()
+            disp.clear()
+            disp.RPI.module_exit()
+            if door_hooks:
+                door_hooks.close()
+            print("Display cleaned up successfully")
+            print(f"Frame pacing: {pacer.summary()}")
+            print(f"Frames sent: {stats.frames}, skipped unchanged: {stats.skipped}, errors: {stats.errors}")
+        except:
+            pass
+
+
+if __name__ == "__main__":
+    main()
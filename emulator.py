@@ -0,0 +1,354 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# emulator.py — SH1106 display RAM emulator and an off-device backend.
+#
+# SH1106Emulator decodes the command/data byte stream the driver sends and
+# keeps the controller's 132x64 display RAM, so frames can be regenerated
+# exactly as the panel would show them.
+#
+# EmulatedRaspberryPi has the same interface as config.RaspberryPi and
+# feeds every byte into an SH1106Emulator instead of spidev/smbus, so the
+# SH1106 driver and the UIs run headless:
+#
+#   disp = SH1106.SH1106(emulator.EmulatedRaspberryPi())
+#   OLED_BACKEND=emulator python3 biometric_attack.py
+#
+# A BusModel attached to the backend charges every transaction and GPIO
+# write with an estimated cost, so bus time can be compared off-device.
+
+import importlib.util
+import os
+import re
+import time
+
+import config
+
+
+
+class SH1106Emulator(object):
+    """Display RAM of an SH1106, or of any controller in controllers.py:
+    with controller given, its geometry, command arguments and (SSD130x)
+    horizontal addressing are used."""
+
+    def __init__(self, width=128, height=64, column_offset=2, controller=None):
+        if controller is None:
+            import controllers
+            controller = controllers.SH1106()
+            controller.width, controller.height, controller.column_offset = width, height, column_offset
+        self.controller = controller
+        self.width = controller.width
+        self.height = controller.height
+        self.column_offset = controller.column_offset
+        self.ram_columns = controller.ram_columns
+        self.ram_pages = controller.ram_pages
+        self._args = controller.command_args
+        self.reset()
+
+    def reset(self):
+        """Power-on state of the controller (RAM content is undefined; zero it)."""
+        self.ram = [bytearray(self.ram_columns) for _ in range(self.ram_pages)]
+        self.page = 0
+        self.column = 0
+        self.start_line = 0
+        self.contrast = 0x80
+        self.display_on = False
+        self.inverse = False
+        self.entire_on = False
+        self.seg_remap = False
+        self.com_reverse = False
+        self.multiplex = 63
+        self.offset = 0
+        self.settings = {}
+        # SSD130x horizontal addressing: mode and column/page window
+        self.horizontal = False
+        self.window = (0, self.ram_columns - 1, 0, self.ram_pages - 1)
+        self._pending = None
+        self._pending_args = []
+        self.commands = 0
+        self.data_bytes = 0
+
+    def command(self, cmd):
+        self.commands += 1
+        if self._pending is not None:
+            self._pending_args.append(cmd)
+            if len(self._pending_args) < self._args[self._pending]:
+                return
+            op, args = self._pending, self._pending_args
+            self._pending = None
+            self._pending_args = []
+            self.settings[op] = args[0] if len(args) == 1 else tuple(args)
+            if op == 0x81:
+                self.contrast = cmd
+            elif op == 0xA8:
+                self.multiplex = cmd & 0x7F
+            elif op == 0xD3:
+                self.offset = cmd & 0x7F
+            elif op == 0xDC:
+                self.start_line = cmd & 0x7F
+            elif op == 0x20 and 0x21 in self._args:
+                self.horizontal = cmd & 0x03 == 0x00
+            elif op == 0x21:
+                self.window = (args[0], args[1]) + self.window[2:]
+                self.column = args[0]
+            elif op == 0x22:
+                self.window = self.window[:2] + (args[0] & 0x07, args[1] & 0x07)
+                self.page = args[0] & 0x07
+            return
+        if cmd in self._args:
+            self._pending = cmd
+        elif cmd <= 0x0F:
+            self.column = (self.column & 0xF0) | cmd
+        elif cmd <= 0x1F:
+            self.column = (self.column & 0x0F) | ((cmd & 0x0F) << 4)
+        elif 0x40 <= cmd <= 0x7F:
+            self.start_line = cmd - 0x40
+        elif cmd in (0xA0, 0xA1):
+            self.seg_remap = cmd == 0xA1
+        elif cmd in (0xA4, 0xA5):
+            self.entire_on = cmd == 0xA5
+        elif cmd in (0xA6, 0xA7):
+            self.inverse = cmd == 0xA7
+        elif cmd in (0xAE, 0xAF):
+            self.display_on = cmd == 0xAF
+        elif 0xB0 <= cmd < 0xB0 + self.ram_pages:
+            self.page = cmd - 0xB0
+        elif cmd in (0xC0, 0xC8):
+            self.com_reverse = cmd == 0xC8
+        # 0x30-0x33 pump voltage, 0xE3 NOP and read-modify-write do not
+        # change what is displayed
+
+    def data(self, value):
+        self.data_bytes += 1
+        if self.column < self.ram_columns:
+            self.ram[self.page][self.column] = value & 0xFF
+            self.column += 1
+        if self.horizontal and self.column > self.window[1]:
+            # Wrap to the start of the window on the next page
+            c0, _, p0, p1 = self.window
+            self.column = c0
+            self.page = p0 if self.page >= p1 else self.page + 1
+
+    def page_buffer(self):
+        """Visible RAM window as page-major bytes (bit set = pixel lit)."""
+        lo = self.column_offset
+        return b"".join(bytes(self.ram[p][lo:lo + self.width]) for p in range(self.height // 8))
+
+    def panel_rows(self):
+        """What the panel shows: list of rows, each a list of 0/1 pixels."""
+        lo = self.column_offset
+        rows = []
+        for r in range(self.height):
+            if not self.display_on:
+                rows.append([0] * self.width)
+                continue
+            if self.entire_on:
+                rows.append([1] * self.width)
+                continue
+            lines = self.ram_pages * 8
+            line = (r + self.start_line + self.offset) % lines
+            if self.com_reverse:
+                line = (self.height - 1 - r + self.start_line + self.offset) % lines
+            page, bit = line // 8, line % 8
+            ram = self.ram[page]
+            row = [(ram[lo + x] >> bit) & 1 for x in range(self.width)]
+            if self.seg_remap:
+                row.reverse()
+            if self.inverse:
+                row = [1 - v for v in row]
+            rows.append(row)
+        return rows
+
+    def panel_bytes(self):
+        """Displayed image packed row-major, MSB first (PIL "1" raw layout)."""
+        out = bytearray()
+        for row in self.panel_rows():
+            for x in range(0, self.width, 8):
+                byte = 0
+                for v in row[x:x + 8]:
+                    byte = (byte << 1) | v
+                out.append(byte)
+        return bytes(out)
+
+    def to_image(self):
+        """Displayed frame as a PIL "1" image (white = lit pixel)."""
+        from PIL import Image
+        return Image.frombytes("1", (self.width, self.height), self.panel_bytes())
+
+
+class BusModel(object):
+    """Estimated cost of one bus transaction.
+
+    cost = overhead_us + bits / hz, where bits covers the whole transaction
+    (for I2C: start, address, control byte, value, acks and stop).
+    """
+
+    def __init__(self, name, hz, bits_per_transaction, overhead_us, gpio_us):
+        self.name = name
+        self.hz = hz
+        self.bits = bits_per_transaction
+        self.overhead_us = overhead_us
+        self.gpio_us = gpio_us
+        self.transaction_ns = int(overhead_us * 1000 + self.bits * 1e9 / hz)
+        self.gpio_ns = int(gpio_us * 1000)
+
+
+# spidev.writebytes() of one byte at the 1 MHz module_init() sets, plus the
+# Python/ioctl round trip; write_byte_data() at 400 kHz (9 bits per byte)
+SPI_1MHZ = BusModel("spi", 1000000, 8, 15, 5)
+I2C_400KHZ = BusModel("i2c", 400000, 29, 40, 5)
+
+
+class _Pin(object):
+    """Stand-in for a gpiozero device."""
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = 0
+
+    def on(self):
+        self.value = 1
+
+    def off(self):
+        self.value = 0
+
+
+class EmulatedRaspberryPi(object):
+    """config.RaspberryPi look-alike that drives an SH1106Emulator."""
+
+    def __init__(self, device=config.Device_SPI, panel=None, capture=False, bus=None):
+        self.INPUT = False
+        self.OUTPUT = True
+        self.Device = device
+        self.panel = panel if panel is not None else SH1106Emulator()
+        if bus is None:
+            bus = SPI_1MHZ if device == config.Device_SPI else I2C_400KHZ
+        self.bus = bus
+        self.bus_ns = 0     # modelled time spent on the bus and GPIO
+        # Keep a panel_bytes() snapshot at every frame mark
+        self.capture = capture
+        self.frames = []
+
+        self.bytes_sent = 0
+        self.transactions = 0
+        self.gpio_toggles = 0
+
+        self.GPIO_RST_PIN = self.gpio_mode(config.RST_PIN, self.OUTPUT)
+        self.GPIO_DC_PIN = self.gpio_mode(config.DC_PIN, self.OUTPUT)
+
+        self.GPIO_KEY_UP_PIN     = self.gpio_mode(config.KEY_UP_PIN, self.INPUT)
+        self.GPIO_KEY_DOWN_PIN   = self.gpio_mode(config.KEY_DOWN_PIN, self.INPUT)
+        self.GPIO_KEY_LEFT_PIN   = self.gpio_mode(config.KEY_LEFT_PIN, self.INPUT)
+        self.GPIO_KEY_RIGHT_PIN  = self.gpio_mode(config.KEY_RIGHT_PIN, self.INPUT)
+        self.GPIO_KEY_PRESS_PIN  = self.gpio_mode(config.KEY_PRESS_PIN, self.INPUT)
+
+        self.GPIO_KEY1_PIN       = self.gpio_mode(config.KEY1_PIN, self.INPUT)
+        self.GPIO_KEY2_PIN       = self.gpio_mode(config.KEY2_PIN, self.INPUT)
+        self.GPIO_KEY3_PIN       = self.gpio_mode(config.KEY3_PIN, self.INPUT)
+
+    def delay_ms(self, delaytime):
+        pass
+
+    def gpio_mode(self, Pin, Mode, pull_up=None, active_state=True):
+        return _Pin(Pin)
+
+    def digital_write(self, Pin, value):
+        self.gpio_toggles += 1
+        self.bus_ns += self.bus.gpio_ns
+        if Pin is self.GPIO_RST_PIN and Pin.value and not value:
+            self.panel.reset()
+        if value:
+            Pin.on()
+        else:
+            Pin.off()
+
+    def digital_read(self, Pin):
+        return Pin.value
+
+    def spi_writebyte(self, data):
+        self.bytes_sent += 1
+        self.transactions += 1
+        self.bus_ns += self.bus.transaction_ns
+        if self.GPIO_DC_PIN.value:
+            self.panel.data(data[0])
+        else:
+            self.panel.command(data[0] & 0xFF)
+
+    def i2c_writebyte(self, reg, value):
+        self.bytes_sent += 2
+        self.transactions += 1
+        self.bus_ns += self.bus.transaction_ns
+        if reg == 0x40:
+            self.panel.data(value)
+        else:
+            self.panel.command(value & 0xFF)
+
+    def mark_frame(self):
+        if self.capture:
+            self.frames.append(self.panel_bytes())
+
+    def panel_bytes(self):
+        return self.panel.panel_bytes()
+
+    def module_init(self):
+        self.digital_write(self.GPIO_RST_PIN, False)
+        self.digital_write(self.GPIO_DC_PIN, False)
+        return 0
+
+    def module_exit(self):
+        self.digital_write(self.GPIO_RST_PIN, False)
+        self.digital_write(self.GPIO_DC_PIN, False)
+
+
+class VirtualClock(object):
+    """Replace time.sleep/monotonic with a virtual clock while active.
+
+    Sleeping advances the clock instantly, so paced animations run as fast
+    as the CPU allows while seeing exactly the timing they asked for —
+    the frames they produce are deterministic.
+    """
+
+    def __init__(self, start_ns=10**12):
+        self.now_ns = start_ns
+
+    def sleep(self, seconds):
+        self.now_ns += int(seconds * 1e9)
+
+    def monotonic(self):
+        return self.now_ns / 1e9
+
+    def monotonic_ns(self):
+        return self.now_ns
+
+    def __enter__(self):
+        self._saved = (time.sleep, time.monotonic, time.monotonic_ns)
+        time.sleep, time.monotonic, time.monotonic_ns = self.sleep, self.monotonic, self.monotonic_ns
+        return self
+
+    def __exit__(self, *exc):
+        time.sleep, time.monotonic, time.monotonic_ns = self._saved
+        return False
+
+
+def load_ui(path, name=None):
+    """Import one of the UI scripts headless, without running its main().
+
+    The script's display is an EmulatedRaspberryPi; its asset paths are
+    resolved relative to the script's own directory.  Unless OLED_SNAPSHOT
+    says otherwise, no warm-start snapshot is loaded (see snapshot.py):
+    every load starts from the same screen.
+    """
+    path = os.path.abspath(path)
+    if name is None:
+        name = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(path))[0]).strip("_")
+    os.environ["OLED_BACKEND"] = "emulator"
+    os.environ.setdefault("OLED_SNAPSHOT", "off")
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
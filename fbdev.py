@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# fbdev.py — SH1106-compatible display on a Linux framebuffer (/dev/fbN).
+#
+# With a kernel driver for the panel (ssd1307fb and similar), the kernel
+# owns the bus and pushes the framebuffer to the panel itself (deferred
+# IO).  FramebufferDisplay maps the 1 bpp framebuffer and writes frames
+# straight into the mapping: no write() calls, no bytes through Python's
+# SPI layer.
+#
+# The UIs hand over page-major buffers (SH1106 layout, see pagebuf.py).
+# Framebuffers are row-major: stride bytes per row, 8 pixels per byte, LSB
+# first unless msb_first, bit set = lit.  ShowRegions() converts only the
+# pages and column bytes it was given; a page-major framebuffer
+# (layout="pages") takes the bytes as they are.
+#
+#   OLED_BACKEND=fbdev OLED_FBDEV=/dev/fb1 python3 biometric_attack.py
+#
+# Any regular file of the right size can stand in for the device:
+#
+#   disp = fbdev.FramebufferDisplay("/tmp/fb", width=128, height=64)
+#
+# Geometry comes from /sys/class/graphics/fbN for a device and from the
+# arguments for a file.  Contrast goes to the panel's backlight device if
+# the driver has one; SetPower() blanks the framebuffer.
+
+import fcntl
+import glob
+import mmap
+import os
+import stat
+
+import numpy as np
+
+import SH1106
+
+FBIOBLANK = 0x4611
+FB_BLANK_UNBLANK = 0
+FB_BLANK_POWERDOWN = 4
+
+
+def _sysfs(path, name):
+    """Attribute name of the framebuffer device at path, or None (also for
+    a regular file standing in for one)."""
+    try:
+        if not stat.S_ISCHR(os.stat(path).st_mode):
+            return None
+        with open("/sys/class/graphics/%s/%s" % (os.path.basename(os.path.realpath(path)), name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class _KeyInputs(object):
+    """The key half of config.RaspberryPi: the kernel owns the bus."""
+
+    Device = SH1106.Device_SPI
+
+    def __init__(self):
+        import config
+        for name in ("KEY_UP", "KEY_DOWN", "KEY_LEFT", "KEY_RIGHT", "KEY_PRESS", "KEY1", "KEY2", "KEY3"):
+            pin = config.DigitalInputDevice(getattr(config, name + "_PIN"), pull_up=True, active_state=None)
+            setattr(self, "GPIO_%s_PIN" % name, pin)
+
+    def digital_read(self, pin):
+        return pin.value
+
+    def module_init(self):
+        return 0
+
+    def module_exit(self):
+        pass
+
+
+class FramebufferDisplay(object):
+    """SH1106 stand-in that writes into a memory-mapped framebuffer."""
+
+    getbuffer = SH1106.SH1106.getbuffer
+
+    def __init__(self, path="/dev/fb1", width=None, height=None, stride=None, msb_first=False,
+                 layout="rows", rpi=None):
+        if layout not in ("rows", "pages"):
+            raise ValueError("layout must be 'rows' or 'pages', not %r" % layout)
+        bpp = _sysfs(path, "bits_per_pixel")
+        if bpp is not None and int(bpp) != 1:
+            raise ValueError("%s is %s bpp; only 1 bpp framebuffers are supported" % (path, bpp))
+        size = _sysfs(path, "virtual_size")
+        if size and width is None:
+            width, height = (int(v) for v in size.split(","))
+        self.width = width or SH1106.LCD_WIDTH
+        self.height = height or SH1106.LCD_HEIGHT
+        self.layout = layout
+        self.msb_first = msb_first
+        pages = self.height // 8
+        if layout == "pages":
+            self.stride = self.width
+            length = self.width * pages
+        else:
+            self.stride = stride or int(_sysfs(path, "stride") or 0) or (self.width + 7) // 8
+            length = self.stride * self.height
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR)
+        self._mm = mmap.mmap(self._fd, length)
+        if layout == "pages":
+            self.fb = np.frombuffer(self._mm, dtype=np.uint8).reshape(pages, self.width)
+        else:
+            self.fb = np.frombuffer(self._mm, dtype=np.uint8).reshape(self.height, self.stride)
+        # Page-major copy of the picture (bit set = lit), as the SH1106
+        # RAM would hold it, for start-line scrolling
+        self._ram = np.zeros((pages, self.width), dtype=np.uint8)
+        self.start_line = 0
+        self.contrast = SH1106.CONTRAST_DEFAULT
+        self._backlight = self._find_backlight(path)
+        self.RPI = rpi if rpi is not None else _KeyInputs()
+        self.Device = self.RPI.Device
+
+    @staticmethod
+    def _find_backlight(path):
+        if _sysfs(path, "name") is None:
+            return None
+        found = glob.glob("/sys/class/graphics/%s/device/backlight/*" % os.path.basename(os.path.realpath(path)))
+        return found[0] if found else None
+
+    def Init(self):
+        # The kernel driver has set the panel up
+        return self.RPI.module_init()
+
+    # -- frames -------------------------------------------------------------
+
+    def _write(self, p0, p1, x0, x1):
+        """Copy RAM pages p0..p1-1, columns x0..x1-1 into the framebuffer."""
+        if self.layout == "pages":
+            self.fb[p0:p1, x0:x1] = self._ram[p0:p1, x0:x1]
+            return
+        # Row-major: whole bytes of 8 columns, so widen to byte edges
+        b0, b1 = x0 // 8, (x1 + 7) // 8
+        order = "big" if self.msb_first else "little"
+        if self.start_line == 0:
+            bits = np.unpackbits(self._ram[p0:p1, b0 * 8:b1 * 8], axis=0, bitorder="little")
+            rows = np.packbits(bits.reshape((p1 - p0) * 8, -1), axis=1, bitorder=order)
+            self.fb[p0 * 8:p1 * 8, b0:b1] = rows
+            return
+        # Scrolled: panel row r shows RAM line (r + start_line) % height
+        bits = np.unpackbits(self._ram[:, b0 * 8:b1 * 8], axis=0, bitorder="little")
+        bits = np.roll(bits, -self.start_line, axis=0)
+        self.fb[:, b0:b1] = np.packbits(bits, axis=1, bitorder=order)
+
+    def ShowImage(self, pBuf):
+        # Lit is bit 0 in the buffer (the SH1106 is sent ~byte), 1 here
+        self._ram[:] = ~np.asarray(pBuf, dtype=np.uint8).reshape(self._ram.shape)
+        self._write(0, self._ram.shape[0], 0, self.width)
+
+    def ShowRegions(self, pBuf, rects):
+        src = np.asarray(pBuf, dtype=np.uint8).reshape(self._ram.shape)
+        for x0, y0, x1, y1 in rects:
+            p0, p1 = y0 // 8, (y1 + 7) // 8
+            self._ram[p0:p1, x0:x1] = ~src[p0:p1, x0:x1]
+            self._write(p0, p1, x0, x1)
+
+    def SetStartLine(self, line):
+        line = line % self.height
+        if line != self.start_line:
+            self.start_line = line
+            self._write(0, self._ram.shape[0], 0, self.width)
+
+    def clear(self):
+        self._ram[:] = 0
+        self._write(0, self._ram.shape[0], 0, self.width)
+
+    # -- panel controls -----------------------------------------------------
+
+    def SetContrast(self, value):
+        value = max(0, min(255, int(value)))
+        self.contrast = value
+        if self._backlight is None:
+            return
+        try:
+            with open(os.path.join(self._backlight, "max_brightness")) as f:
+                top = int(f.read())
+            with open(os.path.join(self._backlight, "brightness"), "w") as f:
+                f.write("%d" % round(value * top / 255.0))
+        except (OSError, ValueError):
+            pass
+
+    def FadeContrast(self, target, duration):
+        return SH1106.ContrastFade(self, target, duration)
+
+    def SetPower(self, on):
+        try:
+            fcntl.ioctl(self._fd, FBIOBLANK, FB_BLANK_UNBLANK if on else FB_BLANK_POWERDOWN)
+        except OSError:
+            pass    # a regular file standing in for the device
+
+    def close(self):
+        self.fb = None
+        self._mm.close()
+        os.close(self._fd)
@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# glyphs.py — glyph atlas text renderer with cached metrics.
+#
+# ImageDraw.text() lays out and rasterizes every glyph of a string on every
+# call.  A GlyphAtlas rasterizes each glyph of a (font, size) once into a
+# 1-bit bitmap, caches its bounding box and advance width, and draws
+# strings by blitting those bitmaps.  Every glyph is checked against
+# ImageDraw.text() when it is rasterized; the rare one that cannot be
+# reproduced pixel for pixel makes its strings fall back to ImageDraw.text().
+# Text wrapping and measuring come from the cached widths.
+#
+# Atlases can be saved to disk; default()/truetype() keep one per font and
+# reuse a copy cached under OLED_GLYPH_CACHE (default ~/.cache/oled-glyphs),
+# so a TTF does not have to be opened and rasterized on every launch.
+
+import base64
+import json
+import os
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw, ImageFont
+
+ATLAS_VERSION = 1
+CACHE_DIR = os.environ.get("OLED_GLYPH_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "oled-glyphs"))
+
+# Printable ASCII is rasterized up front; anything else on first use
+ASCII = "".join(chr(c) for c in range(32, 127))
+
+
+# While measuring, a glyph is drawn between two tall bars so the text mask
+# covers it fully and it sits where it would in the middle of a string
+_BAR = "|"
+_GAP = "    "
+
+
+class Glyph(object):
+    """One rasterized glyph.
+
+    bitmap is a "1" image (None for blank glyphs) drawn at pen + (x, y);
+    bbox is font.getbbox(ch).  FreeType places a string by the glyphs'
+    outline boxes but renders it from their bitmaps, and for a few glyphs
+    the two disagree (the left bearing of ")" and "]", the top of " "):
+    bitmap_left/bitmap_top are the bitmap's edges, which together with the
+    bbox give the shift ImageDraw.text() applies to the whole string.
+    exact is False if the glyph could not be reproduced that way; strings
+    containing it are drawn by ImageDraw.text().  mask is the bitmap as a
+    bool array, made on first use by a pagebuf.PageBuffer.
+    """
+
+    __slots__ = ("bitmap", "x", "y", "bbox", "bitmap_left", "bitmap_top", "exact", "_mask")
+
+    def __init__(self, bitmap, x, y, bbox, bitmap_left, bitmap_top, exact=True):
+        self.bitmap = bitmap
+        self.x = x
+        self.y = y
+        self.bbox = bbox
+        self.bitmap_left = bitmap_left
+        self.bitmap_top = bitmap_top
+        self.exact = exact
+        self._mask = None
+
+    @property
+    def mask(self):
+        if self._mask is None:
+            self._mask = np.asarray(self.bitmap, dtype=bool)
+        return self._mask
+
+
+def _ink(font, text, size, origin):
+    canvas = Image.new("1", size, 0)
+    ImageDraw.Draw(canvas).text(origin, text, font=font, fill=1)
+    return canvas
+
+
+class GlyphAtlas(object):
+    """Per-glyph bitmaps and metrics of one font."""
+
+    def __init__(self, font=None, charset=ASCII, name=None, make_font=None):
+        self._font = font
+        self._make_font = make_font
+        self.name = name
+        self.glyphs = {}      # char -> Glyph
+        self.advance = {}     # char -> advance width in px
+        blank = []
+        for ch in charset:
+            if self._rasterize(ch).bitmap is None:
+                blank.append(ch)
+        # Blank glyphs are measured against the inked ones
+        for ch in blank:
+            self._rasterize(ch)
+
+    @property
+    def font(self):
+        """The font; an atlas loaded from disk only opens it when needed."""
+        if self._font is None and self._make_font is not None:
+            self._font = self._make_font()
+        return self._font
+
+    def _rasterize(self, ch):
+        font = self.font
+        if font is None:
+            raise KeyError("glyph %r not in atlas %s and no font to rasterize it" % (ch, self.name))
+        bbox = font.getbbox(ch, mode="1")
+        adv = font.getlength(ch, mode="1")
+        self.advance[ch] = int(adv) if adv == int(adv) else adv
+        pen = int(font.getlength(_BAR + _GAP, mode="1"))
+        gap = int(font.getlength(_GAP, mode="1"))
+        margin = max(bbox[2] - bbox[0], bbox[3] - bbox[1], gap) + 8
+        size = (2 * pen + int(adv) + 2 * margin, 2 * margin)
+        origin = (margin, margin)
+
+        canvas = _ink(font, _BAR + _GAP + ch + _GAP + _BAR, size, origin)
+        left = margin + pen - gap // 2
+        window = canvas.crop((left, 0, margin + pen + int(adv) + gap // 2, size[1]))
+        ink = window.getbbox()
+        if ink is not None:
+            x = left + ink[0] - margin - pen
+            y = ink[1] - margin
+            glyph = Glyph(window.crop(ink), x, y, bbox, bbox[0], bbox[1])
+            # Drawn alone, the glyph moves by the difference of its edges
+            alone = _ink(font, ch, size, origin).getbbox()
+            if alone is not None:
+                glyph.bitmap_left = bbox[0] + x - (alone[0] - margin)
+                glyph.bitmap_top = bbox[1] - (alone[1] - margin - y)
+            self.glyphs[ch] = glyph
+            glyph.exact = all(self._matches(s, size, origin) for s in (ch, _BAR + ch, ch + _BAR))
+            return glyph
+
+        # Blank: only its top edge matters, find the one that explains how
+        # it moves the inked glyphs
+        glyph = Glyph(None, 0, 0, bbox, bbox[0], bbox[1])
+        self.glyphs[ch] = glyph
+        probes = {}
+        for other, g in self.glyphs.items():
+            if g.bitmap is not None and g.exact:
+                probes.setdefault(g.bitmap_top, other)
+        probes = sorted(probes.values())
+        for top in range(bbox[1], min([bbox[1]] + [self.glyphs[p].bitmap_top for p in probes]) - 2, -1):
+            glyph.bitmap_top = top
+            if all(self._matches(ch + p, size, origin) for p in probes):
+                return glyph
+        glyph.bitmap_top = bbox[1]
+        glyph.exact = False
+        return glyph
+
+    def _matches(self, text, size, origin):
+        actual = _ink(self.font, text, size, origin)
+        model = Image.new("1", size, 0)
+        self._blit(ImageDraw.Draw(model), origin, text, 1)
+        return actual.tobytes() == model.tobytes()
+
+    def getlength(self, text):
+        advance = self.advance
+        try:
+            return sum(advance[ch] for ch in text)
+        except KeyError:
+            for ch in text:
+                if ch not in advance:
+                    self._rasterize(ch)
+            return sum(advance[ch] for ch in text)
+
+    def _layout(self, text):
+        """[(glyph, pen)], the string shift and the bbox of the text mask."""
+        glyphs = self.glyphs
+        advance = self.advance
+        placed = []
+        pen = 0
+        cbox_min = bitmap_min = 0
+        left = top = right = bottom = 0
+        bitmap_top = None
+        exact = True
+        for ch in text:
+            glyph = glyphs.get(ch) or self._rasterize(ch)
+            px = int(pen + 0.5)
+            if px + glyph.bbox[0] < cbox_min:
+                cbox_min = px + glyph.bbox[0]
+            if px + glyph.bitmap_left < bitmap_min:
+                bitmap_min = px + glyph.bitmap_left
+            bbox = glyph.bbox
+            if placed:
+                left = min(left, px + bbox[0])
+                top = min(top, bbox[1])
+                right = max(right, px + bbox[2])
+                bottom = max(bottom, bbox[3])
+                bitmap_top = min(bitmap_top, glyph.bitmap_top)
+            else:
+                left, top, right, bottom = bbox
+                bitmap_top = glyph.bitmap_top
+            exact = exact and glyph.exact
+            placed.append((glyph, px))
+            pen += advance[ch]
+        shift = (cbox_min - bitmap_min, top - bitmap_top if placed else 0)
+        return placed, shift, (left, top, right, bottom), exact
+
+    def textbbox(self, xy, text):
+        """Same result as ImageDraw.textbbox(xy, text, font) for single-line text."""
+        x, y = xy
+        bbox = self._layout(text)[2]
+        return (x + bbox[0], y + bbox[1], x + bbox[2], y + bbox[3])
+
+    def text(self, draw, xy, text, fill=0):
+        """Blit text onto an ImageDraw at xy, like draw.text(xy, text, font=..., fill=fill)."""
+        if not self._blit(draw, xy, text, fill):
+            draw.text(xy, text, font=self.font, fill=fill)
+
+    def _blit(self, draw, xy, text, fill):
+        placed, (sx, sy), (left, top, right, bottom), exact = self._layout(text)
+        if not exact:
+            return False
+        blit = draw.bitmap
+        # A PageBuffer takes the bool arrays, which are cheaper to blit
+        arrays = hasattr(draw, "pages")
+        for glyph, px in placed:
+            if glyph.bitmap is None:
+                continue
+            bitmap = glyph.mask if arrays else glyph.bitmap
+            gx = sx + px + glyph.x
+            gy = sy + glyph.y
+            w, h = glyph.bitmap.size
+            if gx < left or gy < top or gx + w > right or gy + h > bottom:
+                # ImageDraw.text() clips the text to its outline bbox
+                box = (max(0, left - gx), max(0, top - gy), min(w, right - gx), min(h, bottom - gy))
+                if box[0] >= box[2] or box[1] >= box[3]:
+                    continue
+                if arrays:
+                    bitmap = bitmap[box[1]:box[3], box[0]:box[2]]
+                else:
+                    bitmap = bitmap.crop(box)
+                gx += box[0]
+                gy += box[1]
+            blit((xy[0] + gx, xy[1] + gy), bitmap, fill=fill)
+        return True
+
+    def wrap(self, text, max_px):
+        """Greedy word wrap in one pass over the cached widths."""
+        space = self.getlength(" ")
+        lines = []
+        line = []
+        width = 0
+        for word in text.split():
+            w = self.getlength(word)
+            if line and width + space + w > max_px:
+                lines.append(" ".join(line))
+                line, width = [word], w
+            elif line:
+                line.append(word)
+                width += space + w
+            else:
+                line, width = [word], w
+        if line:
+            lines.append(" ".join(line))
+        return lines
+
+    def save(self, path):
+        glyphs = {}
+        for ch, g in self.glyphs.items():
+            entry = {"x": g.x, "y": g.y, "bbox": g.bbox, "bitmap_left": g.bitmap_left,
+                     "bitmap_top": g.bitmap_top, "exact": g.exact, "adv": self.advance[ch]}
+            if g.bitmap is not None:
+                entry["size"] = g.bitmap.size
+                entry["bits"] = base64.b64encode(g.bitmap.tobytes()).decode("ascii")
+            glyphs[ch] = entry
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": ATLAS_VERSION, "name": self.name, "glyphs": glyphs}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, make_font=None):
+        """Load a saved atlas; make_font() supplies the font if it is needed."""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != ATLAS_VERSION:
+            raise ValueError("unsupported glyph atlas version in %s" % path)
+        atlas = cls(charset="", name=data.get("name"), make_font=make_font)
+        for ch, e in data["glyphs"].items():
+            bitmap = None
+            if "bits" in e:
+                bitmap = Image.frombytes("1", tuple(e["size"]), base64.b64decode(e["bits"]))
+            atlas.glyphs[ch] = Glyph(bitmap, e["x"], e["y"], tuple(e["bbox"]),
+                                     e["bitmap_left"], e["bitmap_top"], e["exact"])
+            atlas.advance[ch] = e["adv"]
+        return atlas
+
+
+_atlases = {}
+
+
+def _cache_path(key):
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in key)
+    return os.path.join(CACHE_DIR, safe + ".json")
+
+
+def cached(key, make_font):
+    """Atlas for key, from memory, the disk cache, or make_font() once."""
+    atlas = _atlases.get(key)
+    if atlas is not None:
+        return atlas
+    path = _cache_path(key)
+    try:
+        atlas = GlyphAtlas.load(path, make_font)
+    except (OSError, ValueError, KeyError):
+        atlas = GlyphAtlas(make_font(), name=key)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            atlas.save(path)
+        except OSError:
+            pass    # read-only home: keep the in-memory atlas
+    _atlases[key] = atlas
+    return atlas
+
+
+def truetype(path, size):
+    """Atlas for a TTF/OTF file; the key changes whenever the file does."""
+    st = os.stat(path)
+    key = "%s-%d-%d-%d" % (os.path.basename(path), size, st.st_size, int(st.st_mtime))
+    return cached(key, lambda: ImageFont.truetype(path, size))
+
+
+def default():
+    """Atlas for ImageFont.load_default() (its glyphs depend on the Pillow version)."""
+    return cached("default-%s" % PIL.__version__, ImageFont.load_default)
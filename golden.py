@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# golden.py — golden-frame render regression and latency suite.
+#
+# Drives every screen and animation step of the four UI scripts headless
+# (emulated panel, virtual clock) and hashes each frame the panel ends up
+# showing.  The hashes are compared against golden/frames.json, so a
+# performance change can be proven pixel-identical; render latency per
+# screen is recorded alongside, so slowdowns show up as well.  Each UI's
+# steady-state screens are also checked to allocate (almost) nothing per
+# tick, against the budgets of benchmark.py --allocations.
+#
+#   python3 golden.py                  # check, exit 1 on any pixel change
+#   python3 golden.py --update         # accept the current output as golden
+#   python3 golden.py --diff outdir/   # write PNGs of frames that changed
+#
+# Goldens depend on the Pillow version (ImageFont.load_default() changed
+# over time); the version they were made with is stored in the file.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import PIL
+
+import benchmark
+import emulator
+import pacing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(HERE, "golden", "frames.json")
+
+UI_SCRIPTS = ("biometric_attack.py", "biometric_attack (1).py", "biometric_attack (2).py", "edit.py")
+
+ARM_LINES = ["[ OK ] Starting ARM", "[ OK ] Loading exploit", "[ OK ] Bypassing auth",
+             "[ OK ] Injecting code", "[ ** ] Executing..."]
+# More lines than fit, so the boot log scrolls
+LONG_LINES = ARM_LINES[:4] + ["[ OK ] Mounting /dev/sda1", "[ OK ] Reached target gpio",
+                              "[ OK ] Started journal", "[ ** ] Executing..."]
+
+# Latency is only flagged when a screen gets this much slower
+LATENCY_FACTOR = 2.0
+# Ticks traced per steady state for the allocation check
+ALLOC_FRAMES = 50
+
+
+def _cases(ui):
+    """(name, callable) for every screen and animation the UI has."""
+    cases = [
+        ("identify", lambda: ui.draw_identify_screen()),
+        ("devices_found.0", lambda: ui.draw_devices_found_screen(0)),
+        ("devices_found.1", lambda: ui.draw_devices_found_screen(1)),
+        ("biometric_menu.0", lambda: ui.draw_biometric_menu_screen(0)),
+        ("biometric_menu.1", lambda: ui.draw_biometric_menu_screen(1)),
+        ("arm_success", lambda: ui.draw_arm_success_screen(0)),
+        ("format_success", lambda: ui.draw_format_success_screen()),
+        ("screensaver", lambda: [ui.draw_screensaver_frame() for _ in range(6)]),
+        ("qr", lambda: ui.draw_qr_screen()),
+    ]
+    if hasattr(ui, "start_transition"):
+        def transition(kind, screen):
+            ui.draw_identify_screen()
+            ui.start_transition(kind)
+            screen()
+        cases.append(("transition.slide_left", lambda: transition(
+            "slide_left", lambda: ui.draw_devices_found_screen(0))))
+        cases.append(("transition.slide_right", lambda: transition(
+            "slide_right", lambda: ui.draw_biometric_menu_screen(0))))
+    if hasattr(ui, "arm_attack_sequence"):
+        def arm():
+            # Launch no door.py: switch the hook worker off and run from an
+            # empty directory (UIs that look for door.py at ARM time)
+            runner = getattr(ui, "door_hooks", None)
+            ui.door_hooks = None
+            cwd = os.getcwd()
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    ui.arm_attack_sequence()
+                finally:
+                    os.chdir(cwd)
+                    ui.door_hooks = runner
+        cases.append(("arm_sequence", arm))
+    if hasattr(ui, "arch_boot_animation"):
+        cases.append(("boot_scroll", lambda: ui.arch_boot_animation(LONG_LINES, "DONE")))
+    if hasattr(ui, "format_attack_sequence"):
+        cases.append(("format_sequence", lambda: ui.format_attack_sequence()))
+    if hasattr(ui, "play_intro_clip"):
+        def intro():
+            # The clip is found relative to the script
+            cwd = os.getcwd()
+            os.chdir(HERE)
+            try:
+                ui.play_intro_clip()
+            finally:
+                os.chdir(cwd)
+        cases.append(("intro_clip", intro))
+    if hasattr(ui, "_tick_animation"):
+        def ticks(lines):
+            ui._build_animation_steps(lines, "DOOR OPEN", ui.STATE_ARM_SUCCESS)
+            pacer = pacing.FramePacer(fps=20)
+            while not ui._tick_animation():
+                pacer.wait()
+        cases.append(("tick_animation", lambda: ticks(ARM_LINES)))
+        cases.append(("tick_scroll", lambda: ticks(LONG_LINES)))
+    return cases
+
+
+def run_ui(script):
+    """Render every case of one UI; returns {case: {"frames": [...], "ms": ...}}."""
+    ui = emulator.load_ui(os.path.join(HERE, script))
+    rpi = ui.disp.RPI
+    rpi.capture = True
+    results = {}
+    with emulator.VirtualClock():
+        for name, fn in _cases(ui):
+            ui.stats.invalidate()
+            first = len(rpi.frames)
+            t0 = time.perf_counter_ns()
+            fn()
+            elapsed = time.perf_counter_ns() - t0
+            frames = rpi.frames[first:]
+            results[name] = {
+                "frames": [hashlib.sha1(f).hexdigest() for f in frames],
+                "ms": round(elapsed / 1e6 / max(1, len(frames)), 3),
+                "_raw": frames,
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Golden-frame regression suite for the UI screens")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden file")
+    parser.add_argument("--diff", help="write PNGs of changed frames to this directory")
+    parser.add_argument("--golden", default=GOLDEN_PATH)
+    parser.add_argument("--latency-factor", type=float, default=LATENCY_FACTOR)
+    parser.add_argument("--no-allocations", action="store_true",
+                        help="skip the steady-state allocation check")
+    args = parser.parse_args(argv)
+
+    current = {}
+    for script in UI_SCRIPTS:
+        current[script] = run_ui(script)
+
+    if args.update:
+        os.makedirs(os.path.dirname(args.golden), exist_ok=True)
+        data = {"pillow": PIL.__version__, "screens": dict(
+            (script, dict((case, {"frames": r["frames"], "ms": r["ms"]}) for case, r in cases.items()))
+            for script, cases in current.items())}
+        with open(args.golden, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        print("Wrote %s (%d screens)" % (args.golden, sum(len(c) for c in current.values())))
+        return 0
+
+    with open(args.golden) as f:
+        golden = json.load(f)
+    if golden.get("pillow") != PIL.__version__:
+        print("warning: goldens made with Pillow %s, running %s" % (golden.get("pillow"), PIL.__version__))
+
+    failures = 0
+    for script, cases in current.items():
+        for case, res in cases.items():
+            want = golden["screens"].get(script, {}).get(case)
+            label = "%s:%s" % (script, case)
+            if want is None:
+                print("NEW   %-45s %d frames (run --update)" % (label, len(res["frames"])))
+                continue
+            if res["frames"] != want["frames"]:
+                failures += 1
+                print("FAIL  %-45s %d frames, golden %d" % (label, len(res["frames"]), len(want["frames"])))
+                if args.diff:
+                    _write_diff(args.diff, script, case, res, want)
+                continue
+            slow = want["ms"] and res["ms"] > want["ms"] * args.latency_factor
+            print("%s %-45s %8.3f ms/frame (golden %.3f)" % (
+                "SLOW " if slow else "ok   ", label, res["ms"], want["ms"]))
+    over = 0 if args.no_allocations else check_allocations()
+    if failures:
+        print("%d screen(s) changed pixels" % failures)
+    if over:
+        print("%d steady state(s) over their allocation budget" % over)
+    return 1 if failures or over else 0
+
+
+def check_allocations():
+    """Print a line per UI and steady state; returns how many failed."""
+    over = 0
+    rows = benchmark.allocations([os.path.join(HERE, script) for script in UI_SCRIPTS],
+                                 frames=ALLOC_FRAMES)
+    for script, state, sends, peak, retained in rows:
+        label = "%s:alloc.%s" % (script, state)
+        problem = benchmark.allocation_problem(state, sends, peak, retained)
+        if problem:
+            over += 1
+            print("FAIL  %-45s %s" % (label, problem))
+        else:
+            print("ok    %-45s %8d B peak/tick" % (label, peak))
+    return over
+
+
+def _write_diff(outdir, script, case, res, want):
+    from PIL import Image
+    os.makedirs(outdir, exist_ok=True)
+    stem = "%s-%s" % (os.path.splitext(script)[0].replace(" ", "_"), case)
+    for i, (frame, digest) in enumerate(zip(res["_raw"], res["frames"])):
+        if i >= len(want["frames"]) or want["frames"][i] != digest:
+            Image.frombytes("1", (128, 64), frame).save(os.path.join(outdir, "%s-%03d.png" % (stem, i)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# hooks.py — external action hooks (door.py) run by a warm worker.
+#
+# Starting `python3 door.py` on every ARM costs an interpreter start-up
+# and the hook's imports, hundreds of milliseconds of CPU on a Pi Zero,
+# taken from the animation playing at the time; and the UI never learns
+# whether the hook worked.
+#
+# A HookRunner starts one worker process when the UI starts.  The worker
+# compiles the hook scripts and imports the modules they import, then
+# waits.  Each run forks the worker (a few ms: everything is loaded
+# already), runs the script as __main__ in the child and reports how it
+# ended:
+#
+#   runner = hooks.HookRunner(["door.py"])
+#   call = runner.run("door.py")          # returns at once
+#   ...
+#   call.status    # "running", then "ok", "failed", "timeout" or "error"
+#
+# Requests and replies are JSON lines over the worker's stdin and stdout
+# (the hooks' own output goes to stderr).  A hook still running after its
+# timeout is killed.  When the UI exits, the worker sees its stdin close
+# and exits once the hooks it started have ended.
+
+import ast
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+DEFAULT_TIMEOUT = 10.0
+
+
+class HookCall(object):
+    """One run of a hook; status is updated when the worker reports."""
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.status = "running"
+        self.exit_code = None
+        self.ms = None          # run time in the worker
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the hook ended; returns its status."""
+        self._done.wait(timeout)
+        return self.status
+
+    def _finish(self, status, exit_code=None, ms=None):
+        self.status = status
+        self.exit_code = exit_code
+        self.ms = ms
+        self._done.set()
+
+
+class HookRunner(object):
+    """A worker process running hook scripts on request."""
+
+    def __init__(self, hooks=(), timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"] + [os.path.abspath(h) for h in hooks],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        self._reader = threading.Thread(target=self._read, name="oled-hooks", daemon=True)
+        self._reader.start()
+
+    def run(self, hook, *args, timeout=None):
+        """Start hook (a script path) with args; returns its HookCall."""
+        call = HookCall(hook)
+        request = {"hook": os.path.abspath(hook), "args": [str(a) for a in args],
+                   "timeout": self.timeout if timeout is None else timeout}
+        with self._lock:
+            self._next_id += 1
+            request["id"] = self._next_id
+            self._calls[self._next_id] = call
+            try:
+                self._proc.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            except (OSError, ValueError):
+                del self._calls[self._next_id]
+                call._finish("error")
+        return call
+
+    def _read(self):
+        for line in self._proc.stdout:
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                call = self._calls.pop(reply.get("id"), None)
+            if call is not None:
+                call._finish(reply["status"], reply.get("exit_code"), reply.get("ms"))
+        # The worker is gone: nothing pending will be answered
+        with self._lock:
+            calls, self._calls = self._calls, {}
+        for call in calls.values():
+            call._finish("error")
+
+    def close(self, timeout=2.0):
+        """Stop the worker, waiting up to timeout for running hooks."""
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+        self._reader.join(timeout)
+
+
+# -- Worker ------------------------------------------------------------------
+
+def _prepare(path):
+    """Compile the script at path and import the modules it imports, so a
+    forked run starts with them loaded.  Returns the code object."""
+    with open(path, "rb") as f:
+        source = f.read()
+    tree = ast.parse(source, path)
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            try:
+                __import__(name)
+            except Exception:
+                pass    # the run reports it, if the script needs it
+    return compile(tree, path, "exec")
+
+
+def _run_child(code, path, args):
+    """In the forked child: run code as __main__; never returns."""
+    status = 1
+    try:
+        sys.argv = [path] + args
+        sys.path[0] = os.path.dirname(path)
+        exec(code, {"__name__": "__main__", "__file__": path, "__builtins__": __builtins__})
+        status = 0
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status & 0xFF)
+
+
+def _worker(paths):
+    # Replies go out on a copy of stdout; the hooks print to stderr
+    out = os.fdopen(os.dup(1), "wb", buffering=0)
+    os.dup2(2, 1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # the UI's Ctrl-C is not ours
+    # A child ending wakes the select() below through this pipe
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    codes = {}
+    for path in paths:
+        try:
+            codes[path] = _prepare(path)
+        except (OSError, SyntaxError) as e:
+            print("hooks: %s: %s" % (path, e), file=sys.stderr)
+
+    def reply(request_id, status, exit_code=None, started=None):
+        ms = None if started is None else round((time.monotonic() - started) * 1000, 1)
+        out.write(json.dumps({"id": request_id, "status": status, "exit_code": exit_code,
+                              "ms": ms}).encode("utf-8") + b"\n")
+
+    running = {}    # pid -> (request id, start time, deadline)
+    inbuf = b""
+    stdin_open = True
+    while stdin_open or running:
+        # Sleep until a request, a child ending or the next deadline
+        timeout = None
+        if running:
+            timeout = max(0, min(deadline for _, _, deadline in running.values()) - time.monotonic())
+        ready = select.select([wake_r, 0] if stdin_open else [wake_r], [], [], timeout)[0]
+        if wake_r in ready:
+            try:
+                os.read(wake_r, 4096)
+            except BlockingIOError:
+                pass
+        if 0 in ready:
+            data = os.read(0, 4096)
+            if not data:
+                stdin_open = False
+            inbuf += data
+        while b"\n" in inbuf:
+            line, inbuf = inbuf.split(b"\n", 1)
+            request = None
+            try:
+                request = json.loads(line)
+                path = request["hook"]
+                if path not in codes:
+                    codes[path] = _prepare(path)
+            except Exception as e:
+                print("hooks: bad request %r: %s" % (line, e), file=sys.stderr)
+                if isinstance(request, dict):
+                    reply(request.get("id"), "error")
+                continue
+            pid = os.fork()
+            if pid == 0:
+                out.close()
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _run_child(codes[path], path, request.get("args", []))
+            now = time.monotonic()
+            running[pid] = (request.get("id"), now, now + float(request.get("timeout", DEFAULT_TIMEOUT)))
+        # Reap the children that ended, kill those past their deadline
+        for pid, (request_id, started, deadline) in list(running.items()):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                del running[pid]
+                code = os.waitstatus_to_exitcode(status)
+                reply(request_id, "ok" if code == 0 else "failed", code, started)
+            elif time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                del running[pid]
+                reply(request_id, "timeout", None, started)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--worker"]:
+        _worker(argv[1:])
+        return 0
+    # Run hooks once through a worker, e.g. python3 hooks.py door.py
+    if not argv:
+        print("usage: hooks.py SCRIPT [SCRIPT ...]")
+        return 2
+    runner = HookRunner(argv)
+    calls = [runner.run(path) for path in argv]
+    failed = 0
+    for call in calls:
+        status = call.wait()
+        print("%s: %s (exit %s, %s ms)" % (call.hook, status, call.exit_code, call.ms))
+        failed += status != "ok"
+    runner.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# listview.py — virtualized scrolling list for menus of any length.
+#
+# A ListView shows a window of `rows` entries of a sequence or a lazy
+# iterator, with a cursor the window follows.  Only the visible entries
+# are ever looked at: an iterator is advanced just far enough to fill the
+# window, and each row is rasterized once into a small bitmap kept in an
+# LRU cache (keyed by label and selection), so moving the cursor blits two
+# cached rows.  render() draws into a PageBuffer only the rows that
+# changed since the last render into that buffer and returns the boxes it
+# changed, so show() sends just those.
+#
+#   menu = listview.ListView(["ARM", "FORMAT"], draw_row=draw_button)
+#   menu.move(+1)
+#   show(frame, menu.render(frame))
+#
+# Memory and per-keypress cost do not depend on the length of the list.
+
+import collections
+
+import pagebuf
+
+DEFAULT_CACHE_SIZE = 64
+
+
+class _LazyItems(object):
+    """Indexable view of an iterator; items are pulled only when needed and
+    kept once pulled, so the cursor can go back up."""
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self._items = []
+        self.exhausted = False
+
+    def get(self, index):
+        while len(self._items) <= index and not self.exhausted:
+            try:
+                self._items.append(next(self._it))
+            except StopIteration:
+                self.exhausted = True
+        return self._items[index] if index < len(self._items) else None
+
+    def known_len(self):
+        """Length if the iterator is exhausted, else None."""
+        return len(self._items) if self.exhausted else None
+
+
+class ListView(object):
+    """Scrolling list of rows drawn by draw_row(draw, x, y, w, h, label, selected).
+
+    Rows are w x h boxes (inclusive, like draw.rectangle) every `pitch`
+    pixels from (x, y).  With more entries than `rows`, a scroll bar is
+    drawn right of the rows.
+    """
+
+    def __init__(self, items, draw_row, x=10, y=20, width=108, row_height=15, pitch=20,
+                 rows=2, label=str, cache_size=DEFAULT_CACHE_SIZE):
+        if hasattr(items, "__len__") and hasattr(items, "__getitem__"):
+            self._seq = items
+            self._lazy = None
+        else:
+            self._seq = None
+            self._lazy = _LazyItems(items)
+        self.draw_row = draw_row
+        self.x = x
+        self.y = y
+        self.width = width
+        self.row_height = row_height
+        self.pitch = pitch
+        self.rows = rows
+        self.label = label
+        self.cache_size = cache_size
+        self.cursor = 0
+        self.top = 0
+        self._cache = collections.OrderedDict()     # (label, selected) -> bool rows
+        self._target = None     # buffer last rendered into
+        self._drawn = {}        # slot -> (label, selected) drawn there
+        self._bar = None        # scroll bar drawn: (thumb y0, thumb y1)
+        self._before = None     # render()'s copy of the buffer, reused
+
+    # -- entries ------------------------------------------------------------
+
+    def count(self):
+        """Number of entries, or None while a lazy iterator is not used up."""
+        if self._seq is not None:
+            return len(self._seq)
+        return self._lazy.known_len()
+
+    def _item(self, index):
+        if self._seq is not None:
+            return self._seq[index] if 0 <= index < len(self._seq) else None
+        return self._lazy.get(index)
+
+    def selected_item(self):
+        return self._item(self.cursor)
+
+    # -- cursor -------------------------------------------------------------
+
+    def select(self, index):
+        """Put the cursor on entry index (clamped to the list)."""
+        index = max(0, index)
+        if self._seq is not None:
+            index = max(0, min(index, len(self._seq) - 1))
+        else:
+            # A lazy list's end is only found by pulling up to index
+            while index > 0 and self._item(index) is None:
+                index -= 1
+        self.cursor = index
+        # Scroll just enough to keep the cursor in view
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.rows:
+            self.top = self.cursor - self.rows + 1
+        return self.cursor
+
+    def move(self, delta):
+        """Move the cursor by delta, wrapping around the ends; returns it."""
+        index = self.cursor + delta
+        if index < 0:
+            n = self.count()
+            index = 0 if n is None else n - 1   # the end of a lazy list may not be known yet
+        elif self._item(index) is None:
+            index = 0
+        return self.select(index)
+
+    # -- drawing ------------------------------------------------------------
+
+    def _row(self, label, selected):
+        key = (label, selected)
+        rows = self._cache.get(key)
+        if rows is not None:
+            self._cache.move_to_end(key)
+            return rows
+        w, h = self.width + 1, self.row_height + 1
+        scratch = pagebuf.PageBuffer(w, (h + 7) & ~7)
+        self.draw_row(pagebuf.Draw(scratch), 0, 0, self.width, self.row_height, label, selected)
+        rows = pagebuf.PageBuffer._unpack(scratch)[:h]
+        self._cache[key] = rows
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return rows
+
+    def invalidate(self):
+        """Redraw every row on the next render()."""
+        self._target = None
+
+    def render(self, buf):
+        """Draw the rows that changed into buf; returns the changed boxes."""
+        before = self._before
+        if before is None or before.shape != buf.pages.shape:
+            before = self._before = buf.pages.copy()
+        else:
+            before[:] = buf.pages
+        if buf is not self._target:
+            self._target = buf
+            self._drawn = {}
+            self._bar = None
+        drawn = False
+        for slot in range(self.rows):
+            index = self.top + slot
+            item = self._item(index)
+            state = None if item is None else (self.label(item), index == self.cursor)
+            if self._drawn.get(slot, False) == state:
+                continue
+            y = self.y + slot * self.pitch
+            if state is None:
+                buf.fill_rect(self.x, y, self.x + self.width, y + self.row_height, 1)
+            else:
+                buf.blit(self._row(*state), (self.x, y))
+            self._drawn[slot] = state
+            drawn = True
+        if self._draw_bar(buf):
+            drawn = True
+        return buf.diff(before) if drawn else []
+
+    def _draw_bar(self, buf):
+        n = self.count()
+        if n is None or n <= self.rows:
+            return False
+        # Track right of the rows, thumb proportional to the window
+        x = self.x + self.width + 3
+        y0 = self.y
+        y1 = self.y + (self.rows - 1) * self.pitch + self.row_height
+        span = y1 - y0 + 1
+        t0 = y0 + span * self.top // n
+        t1 = y0 + max(span * (self.top + self.rows) // n, t0 - y0 + 3) - 1
+        if self._bar == (t0, t1):
+            return False
+        buf.fill_rect(x, y0, x + 1, y1, 1)
+        buf.vline(x + 1, y0, y1, 0)
+        buf.fill_rect(x, t0, x + 1, t1, 0)
+        self._bar = (t0, t1)
+        return True
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# metrics.py — always-on per-frame instrumentation for the display path.
+#
+# Every frame pushed through FrameMetrics.show() records render, encode
+# (getbuffer) and transfer (ShowImage/ShowRegions) time together with the
+# bytes, bus transactions and GPIO toggles the RaspberryPi layer counted
+# while sending it.  Samples live in fixed-size ring buffers, so memory use
+# is constant.
+#
+# Export:
+#   stats.to_json()               -> JSON string, on demand
+#   stats.to_prometheus()         -> Prometheus text exposition format
+#   OLED_METRICS_PROM=/path.prom  -> textfile rewritten every
+#                                    OLED_METRICS_INTERVAL seconds (default 10)
+#   OLED_METRICS_JSON=/path.json  -> JSON dumped on SIGUSR1 and at exit
+
+import array
+import atexit
+import json
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+import pagebuf
+import tracing
+
+RING_SIZE = 256
+
+FIELDS = ("render_us", "encode_us", "transfer_us", "bytes", "transactions", "gpio_toggles")
+
+
+class RingBuffer(object):
+    """Fixed-size ring of signed 64-bit samples."""
+
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self._data = array.array('q', [0] * size)
+        self._next = 0
+        self.count = 0      # total samples ever written
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count += 1
+
+    def values(self):
+        """Samples currently held, oldest first."""
+        if self.count < self.size:
+            return self._data[:self._next].tolist()
+        return (self._data[self._next:] + self._data[:self._next]).tolist()
+
+    def summary(self):
+        vals = sorted(self.values())
+        if not vals:
+            return {"n": 0, "last": 0, "mean": 0, "p50": 0, "p95": 0, "max": 0}
+        n = len(vals)
+        return {
+            "n": n,
+            "last": self._data[(self._next - 1) % self.size],
+            "mean": round(sum(vals) / n, 1),
+            "p50": vals[n // 2],
+            "p95": vals[min(n - 1, (n * 95) // 100)],
+            "max": vals[-1],
+        }
+
+
+class FrameMetrics(object):
+    def __init__(self, rpi=None, size=RING_SIZE):
+        self.rpi = rpi
+        self.rings = dict((name, RingBuffer(size)) for name in FIELDS)
+        self.frames = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = ""
+        self._render_start = None
+        self._slept_start = 0
+        self._last_buf = None
+        self._last_img = None
+        self._start_line = 0        # Init() sets 0x40
+        # A PageBuffer is encoded into _buf, and the frame sent copied into
+        # _last_buf: both are reused, so a frame allocates no buffers
+        self._buf = None
+        self._buf_pages = None
+
+    def begin_frame(self):
+        """Mark the start of rendering; the next show() closes the frame.
+        Time spent in tracing.sleep() in between (key debounce, holds) is
+        not counted as rendering."""
+        self._render_start = time.perf_counter_ns()
+        self._slept_start = tracing.slept_ns
+
+    def _bus_counters(self):
+        rpi = self.rpi
+        if rpi is None:
+            return (0, 0, 0)
+        return (getattr(rpi, "bytes_sent", 0), getattr(rpi, "transactions", 0),
+                getattr(rpi, "gpio_toggles", 0))
+
+    def show(self, disp, img, dirty=None, start_line=0):
+        """Encode and send img (a PIL image or a PageBuffer), recording
+        timings and bus counters.
+
+        dirty lists the boxes that changed since img was last shown (from
+        sprites.Scene.render() or console.Console.update()); if img is the
+        frame sent last, only those are transferred.  start_line is the
+        display start line to show img with (console.Console scrolls with
+        it); it is only sent when it changes.  Returns False when the
+        encoded frame equals the last one sent and the transfer was skipped.
+        """
+        t0 = time.perf_counter_ns()
+        if hasattr(img, "pages"):
+            buf = self._encode(img)     # pagebuf.PageBuffer: already encoded
+        else:
+            buf = bytearray(disp.getbuffer(img))
+        t1 = time.perf_counter_ns()
+        render_ns = None
+        if self._render_start is not None:
+            render_ns = max(0, t0 - self._render_start - (tracing.slept_ns - self._slept_start))
+        self._render_start = None
+
+        if buf == self._last_buf and start_line == self._start_line:
+            self.skipped += 1
+            return False
+
+        before = self._bus_counters()
+        if start_line != self._start_line:
+            disp.SetStartLine(start_line)
+            self._start_line = start_line
+        if buf == self._last_buf:
+            disp.ShowRegions(buf, [])   # scrolled only: just mark the frame
+        elif dirty is not None and img is self._last_img and self._last_buf is not None:
+            disp.ShowRegions(buf, dirty)
+        else:
+            disp.ShowImage(buf)
+        t2 = time.perf_counter_ns()
+        after = self._bus_counters()
+        if self._last_buf is not None and len(self._last_buf) == len(buf):
+            self._last_buf[:] = buf
+        else:
+            self._last_buf = bytearray(buf)
+        self._last_img = img
+
+        self.record(render_ns, t1 - t0, t2 - t1,
+                    after[0] - before[0], after[1] - before[1], after[2] - before[2])
+        return True
+
+    def _encode(self, img):
+        pages = img.pages
+        if self._buf_pages is None or self._buf_pages.shape != pages.shape:
+            self._buf = bytearray(pages.size)
+            self._buf_pages = np.frombuffer(self._buf, dtype=np.uint8).reshape(pages.shape)
+        self._buf_pages[:] = pages
+        return self._buf
+
+    def record(self, render_ns, encode_ns, transfer_ns, nbytes=0, transactions=0, toggles=0):
+        rings = self.rings
+        if render_ns is not None:
+            rings["render_us"].append(render_ns // 1000)
+        rings["encode_us"].append(encode_ns // 1000)
+        rings["transfer_us"].append(transfer_ns // 1000)
+        rings["bytes"].append(nbytes)
+        rings["transactions"].append(transactions)
+        rings["gpio_toggles"].append(toggles)
+        self.frames += 1
+
+    def adopt(self, img):
+        """Continue from img (e.g. a compositor frame) if it holds the frame
+        sent last: boxes then drawn on it can be sent on their own."""
+        if self._last_buf is not None and img.tobytes() == self._last_buf:
+            self._last_img = img
+
+    def last_sent(self, width=128, height=64):
+        """(frame as a PageBuffer, start line) last sent, or None."""
+        if self._last_buf is None:
+            return None
+        return pagebuf.PageBuffer.frombytes(bytes(self._last_buf), width, height), self._start_line or 0
+
+    def invalidate(self):
+        """Forget the last sent frame, e.g. after the panel was cleared or
+        another program drew on it; the start line is sent again too."""
+        self._last_buf = None
+        self._last_img = None
+        self._start_line = None
+
+    def error(self, exc):
+        self.errors += 1
+        self.last_error = str(exc)
+
+    def snapshot(self):
+        bus = self._bus_counters()
+        return {
+            "time": time.time(),
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "bus": {"bytes": bus[0], "transactions": bus[1], "gpio_toggles": bus[2]},
+            "per_frame": dict((name, ring.summary()) for name, ring in self.rings.items()),
+        }
+
+    def to_json(self, samples=False):
+        snap = self.snapshot()
+        if samples:
+            snap["samples"] = dict((name, ring.values()) for name, ring in self.rings.items())
+        return json.dumps(snap)
+
+    def to_prometheus(self):
+        bus = self._bus_counters()
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append("# HELP oled_%s %s" % (name, help_text))
+            out.append("# TYPE oled_%s %s" % (name, kind))
+            for labels, value in samples:
+                out.append("oled_%s%s %s" % (name, labels, value))
+
+        metric("frames_total", "counter", "Frames sent to the panel", [("", self.frames)])
+        metric("frames_skipped_total", "counter", "Frames skipped because nothing changed",
+               [("", self.skipped)])
+        metric("display_errors_total", "counter", "Errors raised while displaying a frame",
+               [("", self.errors)])
+        metric("bus_bytes_total", "counter", "Bytes written to SPI/I2C", [("", bus[0])])
+        metric("bus_transactions_total", "counter", "SPI/I2C transactions", [("", bus[1])])
+        metric("gpio_toggles_total", "counter", "GPIO output writes", [("", bus[2])])
+        for name, ring in self.rings.items():
+            summ = ring.summary()
+            metric("frame_" + name, "gauge", "Per-frame %s over the last %d frames" % (name, summ["n"]),
+                   [('{stat="%s"}' % stat, summ[stat]) for stat in ("last", "mean", "p50", "p95", "max")])
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path):
+        # Write-then-rename so node_exporter never reads a partial file
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def write_json(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_json(samples=True))
+        os.replace(tmp, path)
+
+
+class PrometheusExporter(threading.Thread):
+    """Rewrite a Prometheus textfile from a FrameMetrics at a fixed interval."""
+
+    def __init__(self, stats, path, interval=10.0):
+        threading.Thread.__init__(self, name="oled-metrics", daemon=True)
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            try:
+                self.stats.write_prometheus(self.path)
+            except OSError as e:
+                print(f"Metrics export failed: {e}")
+
+    def stop(self):
+        self._halt.set()
+
+
+def from_env(rpi=None):
+    """Create a FrameMetrics and start the exporters configured in the environment."""
+    stats = FrameMetrics(rpi)
+
+    prom_path = os.environ.get("OLED_METRICS_PROM")
+    if prom_path:
+        interval = float(os.environ.get("OLED_METRICS_INTERVAL", "10"))
+        PrometheusExporter(stats, prom_path, interval).start()
+
+    json_path = os.environ.get("OLED_METRICS_JSON")
+    if json_path:
+        def dump(*_):
+            try:
+                stats.write_json(json_path)
+            except OSError as e:
+                print(f"Metrics dump failed: {e}")
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, dump)
+        atexit.register(dump)
+    return stats
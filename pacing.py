@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# pacing.py — deadline based frame pacing for the OLED main loops.
+#
+# Frames are scheduled against absolute deadlines on time.monotonic_ns()
+# instead of "sleep whatever is left of the frame".  When a frame overruns
+# its budget the missed deadlines are coalesced into one late frame and
+# counted as drops, so animations that advance by the value returned from
+# wait() keep their wall-clock speed under load.
+
+import time
+
+import tracing
+
+# Histogram bucket upper bounds, in microseconds (last bucket is open ended)
+HIST_BOUNDS_US = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+
+class Histogram(object):
+    """Fixed-bucket histogram of microsecond samples."""
+
+    def __init__(self, bounds=HIST_BOUNDS_US):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.count = 0
+        self.max = 0
+        self._sq = 0
+
+    def add(self, us):
+        i = 0
+        for bound in self.bounds:
+            if us <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += us
+        self._sq += us * us
+        if us > self.max:
+            self.max = us
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def stddev(self):
+        if not self.count:
+            return 0.0
+        mean = self.mean()
+        return max(0.0, self._sq / self.count - mean * mean) ** 0.5
+
+    def as_dict(self):
+        labels = ["<=%dus" % b for b in self.bounds] + [">%dus" % self.bounds[-1]]
+        return {
+            "count": self.count,
+            "mean_us": round(self.mean(), 1),
+            "stddev_us": round(self.stddev(), 1),
+            "max_us": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class FramePacer(object):
+    """Schedule frames on absolute monotonic deadlines.
+
+    Call wait() once per frame.  It sleeps until the next deadline and
+    returns how many frame periods have elapsed since the previous call:
+    1 when on time, more when frames had to be dropped to catch up.
+    """
+
+    def __init__(self, fps=20, max_catchup=None):
+        self.period_ns = int(1e9 / fps)
+        # None = drop as many frames as needed to stay on the wall clock
+        self.max_catchup = max_catchup
+        self.reset()
+
+    def reset(self):
+        """Restart the schedule from now and clear all statistics."""
+        now = time.monotonic_ns()
+        self._deadline = now + self.period_ns
+        self._frame_start = now
+        self.frames = 0
+        self.dropped = 0
+        self.frame_time = Histogram()    # work done between two wait() calls
+        self.lateness = Histogram()      # how far past the deadline we woke
+        self.interval = Histogram()      # deadline-to-deadline jitter
+
+    def set_fps(self, fps):
+        self.period_ns = int(1e9 / fps)
+        self._deadline = time.monotonic_ns() + self.period_ns
+
+    @tracing.traced("pacer.wait")
+    def wait(self):
+        now = time.monotonic_ns()
+        self.frame_time.add((now - self._frame_start) // 1000)
+
+        elapsed = 1
+        if now < self._deadline:
+            time.sleep((self._deadline - now) / 1e9)
+        else:
+            # Overran: coalesce every deadline we missed into this frame
+            missed = (now - self._deadline) // self.period_ns
+            if self.max_catchup is not None:
+                missed = min(missed, self.max_catchup)
+            self._deadline += missed * self.period_ns
+            elapsed += missed
+            self.dropped += missed
+
+        woke = time.monotonic_ns()
+        self.lateness.add(max(0, woke - self._deadline) // 1000)
+        self.interval.add((woke - self._frame_start) // 1000)
+        self._frame_start = woke
+        self.frames += 1
+
+        self._deadline += self.period_ns
+        if self._deadline <= woke:
+            # Still behind after max_catchup — re-anchor instead of spiralling
+            self._deadline = woke + self.period_ns
+        return elapsed
+
+    def hold(self, seconds):
+        """Wait out a fixed hold time in whole frames; returns frames elapsed."""
+        end = time.monotonic_ns() + int(seconds * 1e9)
+        frames = 0
+        while time.monotonic_ns() < end:
+            frames += self.wait()
+        return frames
+
+    def stats(self):
+        return {
+            "fps_target": round(1e9 / self.period_ns, 2),
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "frame_time": self.frame_time.as_dict(),
+            "lateness": self.lateness.as_dict(),
+            "interval": self.interval.as_dict(),
+        }
+
+    def summary(self):
+        return "%d frames, %d dropped, frame %.1f/%d us (mean/max), jitter %.1f us" % (
+            self.frames, self.dropped, self.frame_time.mean(),
+            self.frame_time.max, self.interval.stddev())
@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# pagebuf.py — 1-bit drawing straight into the SH1106 page buffer.
+#
+# A PageBuffer holds a frame in the layout SH1106.getbuffer() produces:
+# one byte per column per 8-row page, bit y % 8 = row y, bit set = PIL
+# pixel 1 (white).  It can be passed to ShowImage() as it is, so screens
+# drawn on it skip both the PIL image and the getbuffer() encode.
+#
+# The drawing methods follow ImageDraw (rectangle, line, polygon, point,
+# bitmap, text) and reproduce its pixels exactly, so draw_button() and
+# GlyphAtlas.text() work on either.  On top of that: hline/vline,
+# invert() (XOR a region) and blit() of 1-bit images with copy/or/and/xor.
+# Rows of a span become one mask byte per page and whole column ranges
+# are updated with one NumPy operation.
+
+import numpy as np
+
+from PIL import Image, ImageDraw
+
+
+def _round_up(f):
+    # ROUND_UP/ROUND_DOWN from libImaging/Draw.c
+    return int(np.floor(f + 0.5)) if f >= 0 else -int(np.floor(abs(f) + 0.5))
+
+
+def _round_down(f):
+    return int(np.ceil(f - 0.5)) if f >= 0 else -int(np.ceil(abs(f) - 0.5))
+
+
+def _f32(v):
+    return float(np.float32(v))
+
+
+class _Edge(object):
+    __slots__ = ("xmin", "xmax", "ymin", "ymax", "x0", "y0", "dx")
+
+    def __init__(self, x0, y0, x1, y1):
+        self.xmin, self.xmax = min(x0, x1), max(x0, x1)
+        self.ymin, self.ymax = min(y0, y1), max(y0, y1)
+        self.dx = 0.0 if y0 == y1 else _f32((x1 - x0) / (y1 - y0))
+        self.x0 = x0
+        self.y0 = y0
+
+    def x_at(self, y):
+        # float arithmetic of the C code, so .5 cases round the same way
+        return _f32(_f32((y - self.y0) * self.dx) + self.x0)
+
+
+def _flatten(xy):
+    """ImageDraw coordinates ([(x, y), ...] or [x, y, ...]) as int pairs."""
+    xy = list(xy)
+    if xy and not isinstance(xy[0], (list, tuple)):
+        xy = list(zip(xy[0::2], xy[1::2]))
+    return [(int(x), int(y)) for x, y in xy]
+
+
+class PageBuffer(object):
+    def __init__(self, width=128, height=64, fill=1):
+        self.width = width
+        self.height = height
+        self.pages = np.full((height // 8, width), 0xFF if fill else 0x00, dtype=np.uint8)
+
+    @classmethod
+    def from_image(cls, image):
+        """PageBuffer with the pixels of a landscape PIL image."""
+        pix = np.asarray(image.convert("1"), dtype=bool)
+        buf = cls(image.size[0], image.size[1], 0)
+        rows = pix.reshape(buf.height // 8, 8, buf.width)
+        buf.pages[:] = np.packbits(rows, axis=1, bitorder="little")[:, 0, :]
+        return buf
+
+    @classmethod
+    def frombytes(cls, data, width=128, height=64):
+        """PageBuffer holding a copy of data, as tobytes() returned it."""
+        buf = cls(width, height)
+        buf.pages[:] = np.frombuffer(data, dtype=np.uint8).reshape(buf.pages.shape)
+        return buf
+
+    def to_image(self):
+        rows = np.unpackbits(self.pages[:, None, :], axis=1, bitorder="little")
+        return Image.fromarray(rows.reshape(self.height, self.width).astype(bool))
+
+    def tolist(self):
+        """The frame as the list SH1106.getbuffer() would return."""
+        return self.pages.ravel().tolist()
+
+    def tobytes(self):
+        return self.pages.tobytes()
+
+    def copy(self):
+        buf = PageBuffer.__new__(PageBuffer)
+        buf.width, buf.height = self.width, self.height
+        buf.pages = self.pages.copy()
+        return buf
+
+    def clear(self, fill=1):
+        self.pages.fill(0xFF if fill else 0x00)
+
+    def diff(self, before):
+        """Boxes (x0, y0, x1, y1, end exclusive, page aligned) where this
+        frame differs from before (a PageBuffer or its pages array): one
+        per changed page, over the changed columns."""
+        if isinstance(before, PageBuffer):
+            before = before.pages
+        changed = before != self.pages
+        boxes = []
+        for page in np.nonzero(changed.any(axis=1))[0]:
+            cols = np.nonzero(changed[page])[0]
+            boxes.append((int(cols[0]), int(page) * 8, int(cols[-1]) + 1, int(page) * 8 + 8))
+        return boxes
+
+    # -- spans ------------------------------------------------------------
+
+    def _rows(self, y0, y1):
+        """(first page, per-page masks) for rows y0..y1, or None if empty."""
+        y0 = max(int(y0), 0)
+        y1 = min(int(y1), self.height - 1)
+        if y0 > y1:
+            return None
+        bits = ((1 << (y1 + 1)) - 1) ^ ((1 << y0) - 1)
+        p0, p1 = y0 >> 3, y1 >> 3
+        masks = np.frombuffer((bits >> (p0 * 8)).to_bytes(p1 - p0 + 1, "little"), dtype=np.uint8)
+        return p0, masks
+
+    def fill_rect(self, x0, y0, x1, y1, fill):
+        """Set rows y0..y1 of columns x0..x1 (inclusive, clipped) to fill."""
+        x0 = max(int(x0), 0)
+        x1 = min(int(x1), self.width - 1)
+        if x0 > x1:
+            return
+        rows = self._rows(y0, y1)
+        if rows is None:
+            return
+        p0, masks = rows
+        region = self.pages[p0:p0 + len(masks), x0:x1 + 1]
+        if fill:
+            region |= masks[:, None]
+        else:
+            region &= ~masks[:, None]
+
+    def hline(self, x0, x1, y, fill):
+        self.fill_rect(x0, y, x1, y, fill)
+
+    def vline(self, x, y0, y1, fill):
+        self.fill_rect(x, y0, x, y1, fill)
+
+    def invert(self, box=None):
+        """XOR the pixels inside box (x0, y0, x1, y1 inclusive; default all)."""
+        if box is None:
+            self.pages ^= 0xFF
+            return
+        x0, y0, x1, y1 = box
+        x0 = max(x0, 0)
+        x1 = min(x1, self.width - 1)
+        rows = self._rows(y0, y1)
+        if rows is None or x0 > x1:
+            return
+        p0, masks = rows
+        self.pages[p0:p0 + len(masks), x0:x1 + 1] ^= masks[:, None]
+
+    def _points(self, xs, ys, fill):
+        keep = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys = xs[keep], ys[keep]
+        bits = np.left_shift(1, ys & 7).astype(np.uint8)
+        if fill:
+            np.bitwise_or.at(self.pages, (ys >> 3, xs), bits)
+        else:
+            np.bitwise_and.at(self.pages, (ys >> 3, xs), ~bits)
+
+    # -- ImageDraw-compatible drawing ---------------------------------------
+
+    # As with ImageDraw on a "1" image, no colour at all means ink 0
+
+    def point(self, xy, fill=None):
+        pts = _flatten(xy)
+        if fill is None:
+            fill = 0
+        if not pts:
+            return
+        self._points(np.array([p[0] for p in pts]), np.array([p[1] for p in pts]), fill)
+
+    def _segment(self, x0, y0, x1, y1, fill):
+        # Bresenham as libImaging's line8(): the end point is not drawn
+        dx, dy = abs(x1 - x0), abs(y1 - y0)
+        xs = 1 if x1 >= x0 else -1
+        ys = 1 if y1 >= y0 else -1
+        n = max(dx, dy)
+        if n == 0:
+            return
+        i = np.arange(n)
+        if dx > dy:
+            px = x0 + xs * i
+            py = y0 + ys * ((2 * dy * i + dx) // (2 * dx))
+        else:
+            px = x0 + xs * ((2 * dx * i + dy) // (2 * dy))
+            py = y0 + ys * i
+        if dx == 0 or dy == 0:
+            self.fill_rect(min(px[0], px[-1]), min(py[0], py[-1]), max(px[0], px[-1]), max(py[0], py[-1]), fill)
+        else:
+            self._points(px, py, fill)
+
+    def line(self, xy, fill=None, width=1):
+        """Connected 1 px line segments through xy (width must be 1)."""
+        if fill is None:
+            fill = 0
+        if width != 1:
+            raise ValueError("PageBuffer.line only draws 1 px lines")
+        pts = _flatten(xy)
+        for (x0, y0), (x1, y1) in zip(pts, pts[1:]):
+            self._segment(x0, y0, x1, y1, fill)
+        if len(pts) > 1:
+            self.fill_rect(pts[-1][0], pts[-1][1], pts[-1][0], pts[-1][1], fill)
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        if isinstance(xy[0], (list, tuple)):
+            (x0, y0), (x1, y1) = xy
+        else:
+            x0, y0, x1, y1 = xy
+        if x1 < x0:
+            raise ValueError("x1 must be greater than or equal to x0")
+        if y1 < y0:
+            raise ValueError("y1 must be greater than or equal to y0")
+        if fill is None and outline is None:
+            outline = 0
+        if fill is not None:
+            self.fill_rect(x0, y0, x1, y1, fill)
+        if outline is not None and outline != fill and width:
+            for i in range(width):
+                self.fill_rect(x0, y0 + i, x1, y0 + i, outline)
+                self.fill_rect(x0, y1 - i, x1, y1 - i, outline)
+                self._segment(x1 - i, y0 + width, x1 - i, y1 - width + 1, outline)
+                self._segment(x0 + i, y0 + width, x0 + i, y1 - width + 1, outline)
+
+    def polygon(self, xy, fill=None, outline=None, width=1):
+        pts = _flatten(xy)
+        if not pts:
+            return
+        if fill is None and outline is None:
+            outline = 0
+        if fill is not None:
+            self._fill_polygon(pts, fill)
+        if outline is not None and outline != fill and width:
+            if width != 1:
+                raise ValueError("PageBuffer.polygon only draws 1 px outlines")
+            for (x0, y0), (x1, y1) in zip(pts, pts[1:] + pts[:1]):
+                self._segment(x0, y0, x1, y1, outline)
+
+    def _fill_polygon(self, pts, fill):
+        # Port of ImagingDrawPolygon()/polygon_generic() so the filled
+        # pixels match ImageDraw exactly
+        edges = []
+        for i in range(len(pts) - 1):
+            (x0, y0), (x1, y1) = pts[i], pts[i + 1]
+            if y0 == y1 and i != 0 and y0 == pts[i - 1][1]:
+                last = edges[-1]
+                if x1 > x0 > pts[i - 1][0]:
+                    last.xmax = x1
+                    continue
+                if x1 < x0 < pts[i - 1][0]:
+                    last.xmin = x1
+                    continue
+            edges.append(_Edge(x0, y0, x1, y1))
+        if pts[-1] != pts[0]:
+            edges.append(_Edge(pts[-1][0], pts[-1][1], pts[0][0], pts[0][1]))
+
+        ymin = self.height - 1
+        ymax = 0
+        table = []
+        for e in edges:
+            ymin = min(ymin, e.ymin)
+            ymax = max(ymax, e.ymax)
+            if e.ymin == e.ymax:
+                self.fill_rect(e.xmin, e.ymin, e.xmax, e.ymin, fill)
+            else:
+                table.append(e)
+        ymin = max(ymin, 0)
+        ymax = min(ymax, self.height)
+
+        for y in range(ymin, ymax + 1):
+            xx = []
+            for i, cur in enumerate(table):
+                if not cur.ymin <= y <= cur.ymax:
+                    continue
+                xx.append(cur.x_at(y))
+                if y == cur.ymax and y < ymax:
+                    xx.append(xx[-1])
+                elif (y == cur.ymin or y == cur.ymax) and cur.dx != 0:
+                    # Connect discontiguous corners
+                    for other in table[:i]:
+                        if (y != other.ymin and y != other.ymax) or other.dx == 0:
+                            continue
+                        if round(xx[-1]) != round(other.x_at(y)):
+                            continue
+                        offset = -1 if y == cur.ymax else 1
+                        adjacent = cur.x_at(y + offset)
+                        if other.ymin <= y + offset <= other.ymax:
+                            adjacent_other = other.x_at(y + offset)
+                            if xx[-1] > adjacent + 1 and xx[-1] > adjacent_other + 1:
+                                xx[-1] = float(_round_up(max(adjacent, adjacent_other)) + 1)
+                            elif xx[-1] < adjacent - 1 and xx[-1] < adjacent_other - 1:
+                                xx[-1] = float(_round_up(min(adjacent, adjacent_other)) - 1)
+                            break
+            xx.sort()
+            for i in range(1, len(xx), 2):
+                self.fill_rect(_round_up(xx[i - 1]), y, _round_down(xx[i]), y, fill)
+
+    def bitmap(self, xy, bitmap, fill=None):
+        """Set the pixels of a "1"/"L" mask image (or bool array) to fill, like ImageDraw.bitmap."""
+        if fill is None:
+            return
+        mask = self._unpack(bitmap)
+        self._apply(xy, mask, "or" if fill else "clear")
+
+    def text(self, xy, text, font=None, fill=None):
+        """ImageDraw.text() through a scratch image; GlyphAtlas.text() only
+        lands here for glyphs it cannot blit itself."""
+        if fill is None:
+            fill = 0
+        mask = Image.new("1", (self.width, self.height), 0)
+        ImageDraw.Draw(mask).text(xy, text, font=font, fill=1)
+        self.bitmap((0, 0), mask, fill)
+
+    # -- blits --------------------------------------------------------------
+
+    @staticmethod
+    def _unpack(src):
+        if isinstance(src, PageBuffer):
+            rows = np.unpackbits(src.pages[:, None, :], axis=1, bitorder="little")
+            return rows.reshape(src.height, src.width).astype(bool)
+        if isinstance(src, np.ndarray):
+            return src.astype(bool, copy=False)
+        return np.asarray(src) != 0
+
+    def blit(self, src, xy, op="copy"):
+        """Draw a 1-bit image (PIL "1", bool array or PageBuffer) at xy.
+
+        op: "copy" replaces the pixels, "or" sets where src is 1, "and"
+        clears where src is 0, "xor" inverts where src is 1.
+        """
+        self._apply(xy, self._unpack(src), op)
+
+    def _apply(self, xy, mask, op):
+        x, y = int(xy[0]), int(xy[1])
+        h, w = mask.shape
+        # Clip to the buffer
+        cx0, cy0 = max(0, -x), max(0, -y)
+        cx1, cy1 = min(w, self.width - x), min(h, self.height - y)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        mask = mask[cy0:cy1, cx0:cx1]
+        x += cx0
+        y += cy0
+        h, w = mask.shape
+        # Align the rows to page boundaries and pack them like the buffer
+        top = y & 7
+        pages = (top + h + 7) >> 3
+        rows = np.zeros((pages * 8, w), dtype=bool)
+        rows[top:top + h] = mask
+        bits = np.packbits(rows.reshape(pages, 8, w), axis=1, bitorder="little")[:, 0, :]
+        region = self.pages[y >> 3:(y >> 3) + pages, x:x + w]
+        if op == "or":
+            region |= bits
+        elif op == "clear":
+            region &= ~bits
+        elif op == "xor":
+            region ^= bits
+        elif op in ("and", "copy"):
+            inside = np.zeros_like(rows)
+            inside[top:top + h] = True
+            area = np.packbits(inside.reshape(pages, 8, w), axis=1, bitorder="little")[:, 0, :]
+            region &= ~area | bits
+            if op == "copy":
+                region |= bits
+        else:
+            raise ValueError("unknown blit op %r" % op)
+
+
+def Draw(buf):
+    """ImageDraw.Draw() counterpart: a PageBuffer is its own drawing context."""
+    return buf
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# playback.py — clip playback with background decode and frame dropping.
+#
+# A Decoder thread reads a clip, scales each frame to the panel, converts
+# it to 1 bit with NumPy (threshold or 8x8 ordered dither) and packs it
+# into a PageBuffer, one frame ahead of the player at most `depth` frames:
+# memory stays the same however long the clip is.  A `convert` function
+# can take the place of scaling and conversion, e.g. to keep the look of
+# frames converted with PIL (Floyd-Steinberg).
+#
+# play() presents the frames against their source timestamps.  A frame
+# whose display time has already passed when it comes out of the queue is
+# dropped (and the decoder skips converting frames that are already too
+# late), so a clip runs at its native rate even when decoding or the bus
+# cannot keep up.  Frames go to show(frame, dirty) through one reused
+# buffer with the boxes that changed, so unchanged regions are not resent.
+#
+# Sources:
+#   "clip.gif", "clip.png"      animated GIF / APNG (frame durations kept)
+#   "images/nite*.bmp", [paths] image sequence at `fps`
+#   RawVideo(f, w, h, fps)      8-bit grey frames, e.g. from
+#                               ffmpeg -f rawvideo -pix_fmt gray -
+#
+#   stats = playback.play(show, "images/nite*.bmp", fps=20, position=(0, 5), invert=True)
+
+import glob
+import queue
+import threading
+import time
+
+import numpy as np
+
+from PIL import Image, ImageSequence
+
+import pagebuf
+import tracing
+
+DEFAULT_FPS = 20
+DEFAULT_DEPTH = 8
+
+
+def _bayer(n):
+    """n x n ordered-dither thresholds 0..n*n-1 (n a power of two)."""
+    m = np.zeros((1, 1), dtype=np.int32)
+    while len(m) < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+# Thresholds on the 0..255 scale, centred in their step
+_DITHER = (_bayer(8) * 4 + 2).astype(np.uint8)
+
+
+class RawVideo(object):
+    """Raw 8-bit grey frames of width x height, read from a path or a
+    binary file object (e.g. a pipe from ffmpeg)."""
+
+    def __init__(self, source, width, height, fps=DEFAULT_FPS):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def frames(self):
+        f = open(self.source, "rb") if isinstance(self.source, str) else self.source
+        size = self.width * self.height
+        try:
+            while True:
+                data = f.read(size)
+                if len(data) < size:
+                    return
+                grey = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width)
+                yield Image.fromarray(grey, "L"), 1.0 / self.fps
+        finally:
+            if f is not self.source:
+                f.close()
+
+
+def frames(source, fps=DEFAULT_FPS):
+    """(PIL image, duration in seconds) of each frame of a source."""
+    if isinstance(source, RawVideo):
+        yield from source.frames()
+        return
+    if isinstance(source, str) and glob.has_magic(source):
+        source = sorted(glob.glob(source))
+    if isinstance(source, (list, tuple)):
+        for path in source:
+            with Image.open(path) as im:
+                im.load()
+                yield im, 1.0 / fps
+        return
+    with Image.open(source) as im:
+        if not getattr(im, "is_animated", False):
+            yield im, 1.0 / fps
+            return
+        for frame in ImageSequence.Iterator(im):
+            duration = frame.info.get("duration") or 1000.0 / fps
+            yield frame, duration / 1000.0
+
+
+def to_pages(grey, out, dither=True, invert=False):
+    """Pack a height x width uint8 grey array into the pages of out, white
+    (>= threshold) as 1."""
+    h, w = grey.shape
+    if dither:
+        bits = grey > _DITHER[np.arange(h)[:, None] % 8, np.arange(w)[None, :] % 8]
+    else:
+        bits = grey >= 128
+    if invert:
+        bits = ~bits
+    out[:] = np.packbits(bits.reshape(h // 8, 8, w), axis=1, bitorder="little")[:, 0, :]
+    return out
+
+
+class Decoder(threading.Thread):
+    """Decode a source into a bounded queue of (time, duration, PageBuffer).
+
+    Frames are scaled to `size`, drawn at `position` on a white frame of
+    the panel size, and converted with to_pages(), or handed to
+    convert(image), which returns the PageBuffer.  Once the player sets
+    start_time (the time.monotonic() of frame 0, played at `speed`),
+    frames that would already be over are passed on without being
+    converted.  The queue ends with None, or
+    with the exception that stopped decoding.
+    """
+
+    def __init__(self, source, width=128, height=64, size=None, position=(0, 0), fps=DEFAULT_FPS,
+                 dither=True, invert=False, depth=DEFAULT_DEPTH, convert=None):
+        threading.Thread.__init__(self, name="oled-decode", daemon=True)
+        self.source = source
+        self.width = width
+        self.height = height
+        self.size = size or (width, height)
+        self.position = position
+        self.fps = fps
+        self.dither = dither
+        self.invert = invert
+        self.convert = convert
+        self.queue = queue.Queue(maxsize=depth)
+        self.start_time = None
+        self.speed = 1.0
+        self._halt = threading.Event()
+        # White panel-sized canvas the scaled frame is pasted into
+        self._canvas = np.full((height, width), 0 if invert else 255, dtype=np.uint8)
+
+    def _convert(self, image):
+        if self.convert is not None:
+            return self.convert(image)
+        # reducing_gap box-reduces large sources first: ~4x faster for
+        # the 1280x640 frames, no visible difference at panel size
+        grey = np.asarray(image.convert("L").resize(self.size, Image.BILINEAR, reducing_gap=2.0))
+        canvas = self._canvas.copy()
+        x, y = self.position
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + grey.shape[1]), min(self.height, y + grey.shape[0])
+        if x0 < x1 and y0 < y1:
+            canvas[y0:y1, x0:x1] = grey[y0 - y:y1 - y, x0 - x:x1 - x]
+        buf = pagebuf.PageBuffer(self.width, self.height)
+        to_pages(canvas, buf.pages, self.dither, self.invert)
+        return buf
+
+    def run(self):
+        t = 0.0
+        try:
+            for image, duration in frames(self.source, self.fps):
+                if self._halt.is_set():
+                    return
+                start = self.start_time
+                if start is not None and time.monotonic() >= start + (t + duration) / self.speed:
+                    frame = None    # too late to be shown: skip the conversion
+                else:
+                    frame = self._convert(image)
+                self._put((t, duration, frame))
+                t += duration
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._halt.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def stop(self):
+        self._halt.set()
+
+
+def play(show, source, speed=1.0, **options):
+    """Play a source through show(frame, dirty) at its own rate.
+
+    options go to Decoder (width, height, size, position, fps, dither,
+    invert, depth, convert).  Returns counts of frames shown and dropped.
+    """
+    decoder = Decoder(source, **options)
+    decoder.speed = speed
+    decoder.start()
+    out = pagebuf.PageBuffer(decoder.width, decoder.height)
+    before = np.empty_like(out.pages)
+    shown = dropped = 0
+    end = None
+    try:
+        # The clock starts with the first frame, not while the decoder warms up
+        item = decoder.queue.get()
+        start = decoder.start_time = time.monotonic()
+        while item is not None:
+            if isinstance(item, Exception):
+                raise item
+            t, duration, frame = item
+            due = start + t / speed
+            end = due + duration / speed
+            now = time.monotonic()
+            if frame is None or now >= end:
+                dropped += 1
+            else:
+                if now < due:
+                    tracing.sleep(due - now, "playback.wait")
+                before[:] = out.pages
+                out.pages[:] = frame.pages
+                show(out, out.diff(before))
+                shown += 1
+            item = decoder.queue.get()
+        # The last frame stays up for its duration too
+        if end is not None and time.monotonic() < end:
+            tracing.sleep(end - time.monotonic(), "playback.wait")
+    finally:
+        decoder.stop()
+    return {"shown": shown, "dropped": dropped}
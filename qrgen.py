@@ -0,0 +1,399 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# qrgen.py — QR code encoder that draws straight into page buffers.
+#
+# encode() turns a payload into the QR module matrix (ISO/IEC 18004,
+# versions 1-10: up to 57x57 modules, which is what fits on 64 rows).  The
+# layout of each version (function patterns, the order data modules are
+# filled in, the eight masks) is computed once and cached, so encoding is
+# a Reed-Solomon pass over a few hundred bytes plus some NumPy operations:
+# a few milliseconds for any payload.
+#
+# page() draws the code centered on a PageBuffer at the largest integer
+# module scale that fits, so every module is a crisp square of pixels:
+#
+#   show(qrgen.page("https://example.com"))
+#
+# Dark modules are drawn with 0 (lit on the panel, like the rest of the
+# UI's ink); pages are cached by payload.
+
+import numpy as np
+
+import pagebuf
+
+MAX_VERSION = 10
+
+# Error correction: the format bits of each level
+ECC_FORMAT_BITS = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+# version -> level -> (EC codewords per block, ((blocks, data codewords), ...))
+_BLOCKS = {
+    1: {"L": (7, ((1, 19),)), "M": (10, ((1, 16),)), "Q": (13, ((1, 13),)), "H": (17, ((1, 9),))},
+    2: {"L": (10, ((1, 34),)), "M": (16, ((1, 28),)), "Q": (22, ((1, 22),)), "H": (28, ((1, 16),))},
+    3: {"L": (15, ((1, 55),)), "M": (26, ((1, 44),)), "Q": (18, ((2, 17),)), "H": (22, ((2, 13),))},
+    4: {"L": (20, ((1, 80),)), "M": (18, ((2, 32),)), "Q": (26, ((2, 24),)), "H": (16, ((4, 9),))},
+    5: {"L": (26, ((1, 108),)), "M": (24, ((2, 43),)), "Q": (18, ((2, 15), (2, 16))),
+        "H": (22, ((2, 11), (2, 12)))},
+    6: {"L": (18, ((2, 68),)), "M": (16, ((4, 27),)), "Q": (24, ((4, 19),)), "H": (28, ((4, 15),))},
+    7: {"L": (20, ((2, 78),)), "M": (18, ((4, 31),)), "Q": (18, ((2, 14), (4, 15))),
+        "H": (26, ((4, 13), (1, 14)))},
+    8: {"L": (24, ((2, 97),)), "M": (22, ((2, 38), (2, 39))), "Q": (22, ((4, 18), (2, 19))),
+        "H": (26, ((4, 14), (2, 15)))},
+    9: {"L": (30, ((2, 116),)), "M": (22, ((3, 36), (2, 37))), "Q": (20, ((4, 16), (4, 17))),
+        "H": (24, ((4, 12), (4, 13)))},
+    10: {"L": (18, ((2, 68), (2, 69))), "M": (26, ((4, 43), (1, 44))), "Q": (24, ((6, 19), (2, 20))),
+         "H": (28, ((6, 15), (2, 16)))},
+}
+
+_ALPHANUMERIC = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+# mode -> (mode indicator, character count bits for versions 1-9)
+_MODES = {"numeric": (0x1, 10), "alphanumeric": (0x2, 9), "byte": (0x4, 8)}
+
+
+# -- Reed-Solomon over GF(256), polynomial 0x11D -----------------------------
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _EXP[_i] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+del _x, _i
+
+_remainders = {}
+
+
+def _remainder_table(degree):
+    """For each byte f, f * g(x) as an integer (one byte per coefficient),
+    where g = prod(x - a^i), i < degree, without its leading term."""
+    table = _remainders.get(degree)
+    if table is None:
+        gen = [1]
+        for i in range(degree):
+            nxt = [0] * (len(gen) + 1)
+            for j, c in enumerate(gen):
+                nxt[j] ^= c
+                if c:
+                    nxt[j + 1] ^= _EXP[_LOG[c] + i]
+            gen = nxt
+        table = [0]
+        for f in range(1, 256):
+            coeffs = bytes(_EXP[_LOG[g] + _LOG[f]] if g else 0 for g in gen[1:])
+            table.append(int.from_bytes(coeffs, "big"))
+        _remainders[degree] = table
+    return table
+
+
+def _ec_codewords(data, degree):
+    # Polynomial division with the remainder held in one integer
+    table = _remainder_table(degree)
+    shift = 8 * (degree - 1)
+    keep = (1 << shift) - 1
+    rem = 0
+    for byte in data:
+        rem = ((rem & keep) << 8) ^ table[byte ^ (rem >> shift)]
+    return list(rem.to_bytes(degree, "big"))
+
+
+# -- Version layout ----------------------------------------------------------
+
+def _alignment_positions(version):
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    size = version * 4 + 17
+    step = (version * 8 + count * 3 + 5) // (count * 4 - 4) * 2
+    return [6] + sorted(size - 7 - i * step for i in range(count - 1))
+
+
+def _format_bits(ecc, mask):
+    data = ECC_FORMAT_BITS[ecc] << 3 | mask
+    rem = data
+    for _ in range(10):
+        rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+    return (data << 10 | rem) ^ 0x5412
+
+
+def _version_bits(version):
+    rem = version
+    for _ in range(12):
+        rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+    return version << 12 | rem
+
+
+class _Layout(object):
+    """Everything about a version that does not depend on the payload."""
+
+    def __init__(self, version):
+        self.version = version
+        size = self.size = version * 4 + 17
+        dark = self.base = np.zeros((size, size), dtype=bool)
+        used = self.function = np.zeros((size, size), dtype=bool)
+
+        # Timing patterns
+        dark[6, ::2] = True
+        dark[::2, 6] = True
+        used[6, :] = True
+        used[:, 6] = True
+        # Finder patterns with their separators
+        ring = np.maximum(*np.abs(np.mgrid[-4:5, -4:5]))
+        finder = (ring != 2) & (ring != 4)
+        for cy, cx in ((3, 3), (3, size - 4), (size - 4, 3)):
+            y0, x0 = cy - 4, cx - 4
+            ys = slice(max(0, y0), min(size, y0 + 9))
+            xs = slice(max(0, x0), min(size, x0 + 9))
+            dark[ys, xs] = finder[ys.start - y0:ys.stop - y0, xs.start - x0:xs.stop - x0]
+            used[ys, xs] = True
+        # Alignment patterns, except where they would overlap the finders
+        align = np.maximum(*np.abs(np.mgrid[-2:3, -2:3])) != 1
+        pos = _alignment_positions(version)
+        last = len(pos) - 1
+        for i, cy in enumerate(pos):
+            for j, cx in enumerate(pos):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                dark[cy - 2:cy + 3, cx - 2:cx + 3] = align
+                used[cy - 2:cy + 3, cx - 2:cx + 3] = True
+        # Format information (written per mask) and the dark module
+        used[8, :9] = used[:9, 8] = True
+        used[8, size - 8:] = used[size - 8:, 8] = True
+        dark[size - 8, 8] = True
+        # Version information
+        if version >= 7:
+            bits = _version_bits(version)
+            for i in range(18):
+                a, b = size - 11 + i % 3, i // 3
+                dark[b, a] = dark[a, b] = (bits >> i) & 1
+                used[b, a] = used[a, b] = True
+
+        # Data modules in placement order: two-column zigzag from the right
+        ys, xs = [], []
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = (right + 1) & 2 == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not used[y, x]:
+                        ys.append(y)
+                        xs.append(x)
+            right -= 2
+        self.order = (np.array(ys), np.array(xs))
+        self.capacity = len(ys) // 8     # total codewords
+
+        i, j = np.mgrid[:size, :size]
+        patterns = (
+            (i + j) % 2 == 0,
+            i % 2 == 0,
+            j % 3 == 0,
+            (i + j) % 3 == 0,
+            (i // 2 + j // 3) % 2 == 0,
+            (i * j) % 2 + (i * j) % 3 == 0,
+            ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+            ((i + j) % 2 + (i * j) % 3) % 2 == 0,
+        )
+        self.masks = [p & ~used for p in patterns]
+
+        # Format information module coordinates, bit i at index i
+        first = [(i, 8) for i in range(6)] + [(7, 8), (8, 8), (8, 7)] + [(8, 14 - i) for i in range(9, 15)]
+        second = [(8, size - 1 - i) for i in range(8)] + [(size - 15 + i, 8) for i in range(8, 15)]
+        self.format_cells = tuple(np.array(c).T for c in (first, second))
+
+    def draw_format(self, matrix, ecc, mask):
+        bits = _format_bits(ecc, mask)
+        values = np.array([(bits >> i) & 1 for i in range(15)], dtype=bool)
+        for ys, xs in self.format_cells:
+            matrix[ys, xs] = values
+
+
+_layouts = {}
+
+
+def _layout(version):
+    layout = _layouts.get(version)
+    if layout is None:
+        layout = _layouts[version] = _Layout(version)
+    return layout
+
+
+# -- Data encoding -----------------------------------------------------------
+
+def _segment(data):
+    """(mode, raw) for the most compact single mode that holds data."""
+    if isinstance(data, (bytes, bytearray)):
+        return "byte", bytes(data)
+    if data and all("0" <= c <= "9" for c in data):
+        return "numeric", data
+    if data and all(c in _ALPHANUMERIC for c in data):
+        return "alphanumeric", data
+    return "byte", data.encode("utf-8")
+
+
+def _count_bits(mode, version):
+    bits = _MODES[mode][1]
+    if version >= 10:
+        bits += 8 if mode == "byte" else 2
+    return bits
+
+
+def _payload_bits(mode, raw):
+    """(value, width) pairs of the encoded characters."""
+    if mode == "numeric":
+        return [(int(raw[i:i + 3]), (1 + 3 * len(raw[i:i + 3]))) for i in range(0, len(raw), 3)]
+    if mode == "alphanumeric":
+        out = []
+        for i in range(0, len(raw) - 1, 2):
+            out.append((_ALPHANUMERIC.index(raw[i]) * 45 + _ALPHANUMERIC.index(raw[i + 1]), 11))
+        if len(raw) % 2:
+            out.append((_ALPHANUMERIC.index(raw[-1]), 6))
+        return out
+    return [(b, 8) for b in raw]
+
+
+def _codewords(mode, raw, version, ecc):
+    ec_len, groups = _BLOCKS[version][ecc]
+    capacity = sum(n * k for n, k in groups)
+    payload = _payload_bits(mode, raw)
+    bits = [(_MODES[mode][0], 4), (len(raw), _count_bits(mode, version))] + payload
+    used = sum(w for _, w in bits)
+    if used > capacity * 8:
+        return None
+    # Terminator, then pad to a byte boundary
+    bits.append((0, min(4, capacity * 8 - used)))
+    value, width = 0, 0
+    for v, w in bits:
+        value = value << w | v
+        width += w
+    pad = -width % 8
+    value <<= pad
+    width += pad
+    data = list(value.to_bytes(width // 8, "big")) if width else []
+    data += [0xEC, 0x11] * ((capacity - len(data)) // 2) + [0xEC] * ((capacity - len(data)) % 2)
+
+    # Split into blocks, add error correction and interleave
+    blocks, pos = [], 0
+    for n, k in groups:
+        for _ in range(n):
+            blocks.append(data[pos:pos + k])
+            pos += k
+    out = []
+    for i in range(max(len(b) for b in blocks)):
+        out += [b[i] for b in blocks if i < len(b)]
+    ecs = [_ec_codewords(b, ec_len) for b in blocks]
+    for i in range(ec_len):
+        out += [e[i] for e in ecs]
+    return out
+
+
+# -- Mask selection ----------------------------------------------------------
+
+# 1:1:3:1:1 with four light modules on one side, as 11-bit window codes
+# (module k of the window is bit k)
+_FINDER_LIKE = tuple(sum(bit << k for k, bit in enumerate(p))
+                     for p in ((1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0), (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1)))
+
+
+def _penalties(stack):
+    """Mask penalty score of each matrix in a stack (masks x size x size)."""
+    count, size = stack.shape[:2]
+    score = np.zeros(count, dtype=np.int64)
+    for grid in (stack, stack.transpose(0, 2, 1)):
+        # N1: runs of five or more modules of one color.  Rows are cut at
+        # both ends, so runs never span rows (or matrices).
+        edges = np.ones((count, size, 1), dtype=bool)
+        change = np.concatenate((edges, grid[:, :, 1:] != grid[:, :, :-1], edges), axis=2)
+        pos = np.flatnonzero(change)
+        runs = np.diff(pos)
+        long = runs >= 5
+        owner = pos[:-1][long] // (size * (size + 1))
+        score += np.bincount(owner, weights=runs[long] - 2, minlength=count).astype(np.int64)
+        # N3: 1:1:3:1:1 finder-like patterns next to four light modules
+        padded = np.pad(grid, ((0, 0), (0, 0), (4, 4))).astype(np.int16)
+        codes = padded[:, :, :size - 2].copy()
+        for k in range(1, 11):
+            codes |= padded[:, :, k:k + size - 2] << k
+        for pattern in _FINDER_LIKE:
+            score += 40 * (codes == pattern).sum(axis=(1, 2))
+    # N2: 2x2 blocks of one color
+    top = stack[:, :-1, :-1]
+    block = (top == stack[:, 1:, :-1]) & (top == stack[:, :-1, 1:]) & (top == stack[:, 1:, 1:])
+    score += 3 * block.sum(axis=(1, 2))
+    # N4: balance of dark and light modules
+    total = size * size
+    dark = stack.sum(axis=(1, 2)) * 20
+    score += 10 * (np.abs(dark - total * 10) // total)
+    return score
+
+
+# -- Public API --------------------------------------------------------------
+
+def encode(data, ecc="M", mask=None):
+    """Module matrix of the smallest QR code that holds data (a str or
+    bytes): a square bool array, True for dark modules.  ecc is "L", "M",
+    "Q" or "H"; mask=None picks the mask with the lowest penalty."""
+    if ecc not in ECC_FORMAT_BITS:
+        raise ValueError("unknown error correction level %r" % ecc)
+    mode, raw = _segment(data)
+    for version in range(1, MAX_VERSION + 1):
+        codewords = _codewords(mode, raw, version, ecc)
+        if codewords is not None:
+            break
+    else:
+        raise ValueError("payload too long for a version %d QR code" % MAX_VERSION)
+
+    layout = _layout(version)
+    bits = np.unpackbits(np.array(codewords, dtype=np.uint8))
+    matrix = layout.base.copy()
+    ys, xs = layout.order
+    matrix[ys[:len(bits)], xs[:len(bits)]] = bits.astype(bool)
+    masks = range(8) if mask is None else (mask,)
+    stack = np.stack([matrix ^ layout.masks[m] for m in masks])
+    for candidate, m in zip(stack, masks):
+        layout.draw_format(candidate, ecc, m)
+    if mask is not None:
+        return stack[0]
+    return stack[int(np.argmin(_penalties(stack)))]
+
+
+def draw(buf, modules, xy=None, scale=None):
+    """Draw a module matrix into buf at an integer scale (the largest that
+    leaves a one-module margin, by default), centered unless xy is given.
+    Returns the box drawn, (x0, y0, x1, y1) end exclusive."""
+    size = len(modules)
+    if scale is None:
+        scale = max(1, min(buf.width, buf.height) // (size + 2))
+    side = size * scale
+    if xy is None:
+        xy = ((buf.width - side) // 2, (buf.height - side) // 2)
+    pixels = np.repeat(np.repeat(~modules, scale, axis=0), scale, axis=1)
+    buf.blit(pixels, xy)
+    return (xy[0], xy[1], xy[0] + side, xy[1] + side)
+
+
+_pages = {}
+PAGE_CACHE_SIZE = 16
+
+
+def page(data, ecc="M", width=128, height=64):
+    """PageBuffer with the QR code of data centered on a white frame.
+
+    Pages are cached by payload and shared: copy() one before drawing on it.
+    """
+    key = (data, ecc, width, height)
+    buf = _pages.get(key)
+    if buf is None:
+        buf = pagebuf.PageBuffer(width, height)
+        draw(buf, encode(data, ecc))
+        if len(_pages) >= PAGE_CACHE_SIZE:
+            del _pages[next(iter(_pages))]
+        _pages[key] = buf
+    return buf
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# recorder.py — bus-level frame recorder and deterministic replay.
+#
+# Recording: set OLED_RECORD=/path/session.bin (or wrap a backend yourself
+# with BusRecorder(rpi, path)) and every command and data byte the SH1106
+# driver sends is logged with its D/C state and a timestamp.
+#
+# Replay:
+#   python3 recorder.py replay session.bin outdir/   # PNG per frame + stats
+#   python3 recorder.py stats session.bin            # timing/byte statistics
+#   python3 recorder.py compare before.bin after.bin # frames + bus efficiency
+#
+# Log format (little endian):
+#   header  b"SH1106R2", u16 width, u16 height, u8 device, u64 start (ns, epoch),
+#           16s controller name (NUL padded; R1 logs have none and are sh1106)
+#   record  u8 kind, varint dt_us (since previous record start), then
+#           CMD/DATA: varint count, varint duration_us, count bytes
+#           FRAME/RESET: nothing
+# Consecutive bytes with the same D/C state are stored as one run.
+
+import json
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"SH1106R2"
+HEADER = struct.Struct("<8sHHBQ16s")
+MAGIC_R1 = b"SH1106R1"
+HEADER_R1 = struct.Struct("<8sHHBQ")
+
+KIND_CMD = 0
+KIND_DATA = 1
+KIND_FRAME = 2
+KIND_RESET = 3
+
+# A run is closed when the bus has been idle this long (us)
+RUN_GAP_US = 1000
+MAX_RUN = 4096
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class BusRecorder(object):
+    """Transparent proxy around a RaspberryPi backend that logs bus traffic."""
+
+    def __init__(self, rpi, path, width=128, height=64, controller="sh1106"):
+        self._rpi = rpi
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, width, height, rpi.Device, time.time_ns(),
+                                     controller.encode("ascii")))
+        self._last_ns = time.monotonic_ns()
+        self._run_kind = None
+        self._run = bytearray()
+        self._run_start = self._run_end = 0
+
+    def __getattr__(self, name):
+        # Pins, Device, counters and everything else come from the real backend
+        return getattr(self._rpi, name)
+
+    def _record(self, kind, start_ns, payload=b"", end_ns=None):
+        dt_us = max(0, start_ns - self._last_ns) // 1000
+        self._last_ns = start_ns
+        rec = bytes((kind,)) + _varint(dt_us)
+        if kind in (KIND_CMD, KIND_DATA):
+            dur_us = max(0, end_ns - start_ns) // 1000
+            rec += _varint(len(payload)) + _varint(dur_us) + bytes(payload)
+        self._file.write(rec)
+
+    def _flush_run(self):
+        if self._run_kind is not None:
+            self._record(self._run_kind, self._run_start, self._run, self._run_end)
+            self._run_kind = None
+            self._run = bytearray()
+
+    def _byte(self, kind, value):
+        now = time.monotonic_ns()
+        if (kind != self._run_kind or len(self._run) >= MAX_RUN
+                or (now - self._run_end) // 1000 > RUN_GAP_US):
+            self._flush_run()
+            self._run_kind = kind
+            self._run_start = now
+        self._run.append(value & 0xFF)
+        self._run_end = now
+
+    def digital_write(self, Pin, value):
+        rpi = self._rpi
+        if Pin is rpi.GPIO_RST_PIN and not value:
+            self._flush_run()
+            self._record(KIND_RESET, time.monotonic_ns())
+        rpi.digital_write(Pin, value)
+
+    def spi_writebyte(self, data):
+        dc = self._rpi.digital_read(self._rpi.GPIO_DC_PIN)
+        self._rpi.spi_writebyte(data)
+        self._byte(KIND_DATA if dc else KIND_CMD, data[0])
+
+    def i2c_writebyte(self, reg, value):
+        self._rpi.i2c_writebyte(reg, value)
+        self._byte(KIND_DATA if reg == 0x40 else KIND_CMD, value)
+
+    def mark_frame(self):
+        self._flush_run()
+        self._record(KIND_FRAME, time.monotonic_ns())
+        mark = getattr(self._rpi, "mark_frame", None)
+        if mark:
+            mark()
+
+    def flush(self):
+        self._flush_run()
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def module_exit(self):
+        self._rpi.module_exit()
+        self.close()
+
+
+def read_log(path):
+    """Parse a log into (header dict, list of (t_us, kind, payload, dur_us))."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:8] == MAGIC_R1:
+        magic, width, height, device, start_ns = HEADER_R1.unpack_from(data, 0)
+        controller, pos = "sh1106", HEADER_R1.size
+    else:
+        magic, width, height, device, start_ns, name = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not an SH1106 bus log" % path)
+        controller, pos = name.rstrip(b"\0").decode("ascii"), HEADER.size
+    header = {"width": width, "height": height, "device": device, "start_ns": start_ns,
+              "controller": controller}
+    records = []
+    t_us = 0
+    while pos < len(data):
+        kind = data[pos]
+        dt, pos = _read_varint(data, pos + 1)
+        t_us += dt
+        payload, dur = b"", 0
+        if kind in (KIND_CMD, KIND_DATA):
+            n, pos = _read_varint(data, pos)
+            dur, pos = _read_varint(data, pos)
+            payload = data[pos:pos + n]
+            pos += n
+        records.append((t_us, kind, payload, dur))
+    return header, records
+
+
+def replay(path, outdir=None):
+    """Feed a log through SH1106Emulator; returns (frames, stats).
+
+    frames is a list of displayed images as packed bytes; when outdir is
+    given each frame is also written as frame_NNNN.png.
+    """
+    import controllers
+    import emulator
+
+    header, records = read_log(path)
+    # Replay on the controller that was recorded: RAM layout, column offset
+    # and command arguments differ between them
+    controller = controllers.get(header["controller"])
+    controller.width, controller.height = header["width"], header["height"]
+    panel = emulator.SH1106Emulator(controller=controller)
+    frames = []
+    frame_t = []
+    frame_cmd = frame_data = 0
+    per_frame = []
+    cmd_total = data_total = bus_us = runs = 0
+    for t_us, kind, payload, dur in records:
+        if kind == KIND_CMD:
+            for b in payload:
+                panel.command(b)
+            frame_cmd += len(payload)
+            cmd_total += len(payload)
+            bus_us += dur
+            runs += 1
+        elif kind == KIND_DATA:
+            for b in payload:
+                panel.data(b)
+            frame_data += len(payload)
+            data_total += len(payload)
+            bus_us += dur
+            runs += 1
+        elif kind == KIND_RESET:
+            panel.reset()
+        elif kind == KIND_FRAME:
+            frames.append(panel.panel_bytes())
+            frame_t.append(t_us)
+            per_frame.append((frame_cmd, frame_data))
+            frame_cmd = frame_data = 0
+
+    if outdir:
+        from PIL import Image
+        os.makedirs(outdir, exist_ok=True)
+        for i, frame in enumerate(frames):
+            Image.frombytes("1", (header["width"], header["height"]), frame).save(
+                os.path.join(outdir, "frame_%04d.png" % i))
+
+    intervals = [b - a for a, b in zip(frame_t, frame_t[1:])]
+    stats = {
+        "frames": len(frames),
+        "unique_frames": len(set(frames)),
+        "duration_ms": round((records[-1][0] if records else 0) / 1000.0, 1),
+        "command_bytes": cmd_total,
+        "data_bytes": data_total,
+        "runs": runs,
+        "bus_time_ms": round(bus_us / 1000.0, 1),
+        "bytes_per_frame": round((cmd_total + data_total) / len(frames), 1) if frames else 0,
+        "mean_frame_interval_ms": round(sum(intervals) / len(intervals) / 1000.0, 2) if intervals else 0,
+        "max_frame_interval_ms": round(max(intervals) / 1000.0, 2) if intervals else 0,
+        "per_frame_bytes": per_frame,
+    }
+    return frames, stats
+
+
+def compare(path_a, path_b):
+    frames_a, stats_a = replay(path_a)
+    frames_b, stats_b = replay(path_b)
+    # Compare what was shown, ignoring frames that repeat the previous one
+    def distinct(frames):
+        return [f for i, f in enumerate(frames) if i == 0 or f != frames[i - 1]]
+    seq_a, seq_b = distinct(frames_a), distinct(frames_b)
+    keys = ("frames", "command_bytes", "data_bytes", "runs", "bus_time_ms", "bytes_per_frame")
+    return {
+        "identical_output": seq_a == seq_b,
+        "distinct_frames": [len(seq_a), len(seq_b)],
+        "a": dict((k, stats_a[k]) for k in keys),
+        "b": dict((k, stats_b[k]) for k in keys),
+    }
+
+
+def wrap_from_env(rpi, width=128, height=64, controller="sh1106"):
+    """Wrap rpi in a BusRecorder when OLED_RECORD is set."""
+    path = os.environ.get("OLED_RECORD")
+    if not path:
+        return rpi
+    import atexit
+    rec = BusRecorder(rpi, path, width, height, controller)
+    atexit.register(rec.close)
+    return rec
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] not in ("replay", "stats", "compare") \
+            or (argv[1] == "compare" and len(argv) < 4):
+        print("usage: recorder.py replay LOG [OUTDIR] | stats LOG | compare LOG_A LOG_B")
+        return 2
+    if argv[1] == "compare":
+        print(json.dumps(compare(argv[2], argv[3]), indent=2))
+        return 0
+    outdir = argv[3] if argv[1] == "replay" and len(argv) > 3 else None
+    frames, stats = replay(argv[2], outdir)
+    stats.pop("per_frame_bytes")
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# snapshot.py — warm start: the screen and state of a UI, kept on disk.
+#
+# A restarted UI shows a blank panel until it has imported everything,
+# loaded its assets and rendered its first screen.  A snapshot is what it
+# needs to look as it did at once: one JSON file holding
+#
+#   state         the UI's own values (screen state id, selection)
+#   frame         the page buffer last sent to the panel, and its start line
+#   caches        named page buffers the UI renders once (menu frames)
+#   fingerprint   what the caches were rendered from (see fingerprint())
+#
+# At boot a UI loads its snapshot right after Init(), shows frame instead
+# of clearing the panel, restores its state, and takes the caches if the
+# fingerprint still matches.  The frame is checked by the first render:
+# metrics.FrameMetrics remembers it as the frame on the panel, so an
+# identical first frame sends nothing and a different one is sent as usual.
+#
+# save() writes a new file and renames it over the old one, so a crash
+# leaves the previous snapshot; a file of another SNAPSHOT_VERSION, or
+# unreadable, is ignored.  The UIs save every AUTOSAVE_INTERVAL seconds
+# (only when something changed) and on a clean shutdown.
+#
+# Snapshots live in OLED_SNAPSHOT_DIR (default ~/.cache/oled-snapshots),
+# one per UI script; OLED_SNAPSHOT=off turns them off.
+#
+# A snapshot brings back the screen, not the boot sequence: a UI with an
+# intro still plays it unless started with OLED_WARM_START=1 (e.g. set by
+# the service that restarts it after a crash), see warm_start().
+
+import base64
+import hashlib
+import json
+import os
+import time
+
+import PIL
+
+import pagebuf
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = os.environ.get("OLED_SNAPSHOT_DIR",
+                              os.path.join(os.path.expanduser("~"), ".cache", "oled-snapshots"))
+AUTOSAVE_INTERVAL = 30.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Modules whose code decides what cached frames look like
+RENDER_MODULES = ("config.py", "glyphs.py", "listview.py", "pagebuf.py", "qrgen.py",
+                  "sprites.py", "transitions.py")
+
+
+def enabled():
+    return os.environ.get("OLED_SNAPSHOT", "on").lower() not in ("off", "0", "no")
+
+
+def warm_start():
+    """True when the UI should resume at once, skipping its intro."""
+    return os.environ.get("OLED_WARM_START", "").lower() in ("1", "on", "yes")
+
+
+def path_for(script):
+    """Snapshot file of the UI script at path script."""
+    name = os.path.splitext(os.path.basename(script))[0]
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return os.path.join(SNAPSHOT_DIR, safe + ".json")
+
+
+def fingerprint(*paths, display=None):
+    """Identifies what caches were rendered from: the content of the files
+    at paths and of RENDER_MODULES, the Pillow version (the default font's
+    glyphs) and, given display, its controller and geometry."""
+    parts = ["pillow-%s" % PIL.__version__]
+    if display is not None:
+        controller = getattr(display, "controller", None)
+        parts.append("%s-%dx%d" % (controller.name if controller else "panel",
+                                   display.width, display.height))
+    digest = hashlib.sha1()
+    for path in paths + tuple(os.path.join(HERE, name) for name in RENDER_MODULES):
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"missing")
+        digest.update(b"\0")
+    parts.append(digest.hexdigest()[:16])
+    return " ".join(parts)
+
+
+def _encode(buf):
+    return {"size": [buf.width, buf.height], "pages": base64.b64encode(buf.tobytes()).decode("ascii")}
+
+
+def _decode(entry):
+    width, height = entry["size"]
+    return pagebuf.PageBuffer.frombytes(base64.b64decode(entry["pages"]), width, height)
+
+
+class Snapshot(object):
+    def __init__(self, state=None, frame=None, start_line=0, caches=None, fingerprint=None):
+        self.state = dict(state or {})
+        self.frame = frame
+        self.start_line = start_line
+        self.caches = dict(caches or {})
+        self.fingerprint = fingerprint
+
+    def to_json(self):
+        data = {"version": SNAPSHOT_VERSION, "saved": time.time(), "state": self.state,
+                "start_line": self.start_line, "fingerprint": self.fingerprint,
+                "caches": dict((name, _encode(buf)) for name, buf in self.caches.items())}
+        if self.frame is not None:
+            data["frame"] = _encode(self.frame)
+        return data
+
+    def save(self, path):
+        _write(path, self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("unsupported snapshot version in %s" % path)
+        frame = _decode(data["frame"]) if "frame" in data else None
+        caches = dict((name, _decode(entry)) for name, entry in data.get("caches", {}).items())
+        return cls(data.get("state"), frame, data.get("start_line", 0), caches, data.get("fingerprint"))
+
+
+def _write(path, data):
+    """Write data to path atomically: a crash leaves the old file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load(path):
+    """The snapshot at path, or None if there is none usable."""
+    if not enabled():
+        return None
+    try:
+        return Snapshot.load(path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class Autosave(object):
+    """Saves make_snapshot() to path every interval seconds if it changed."""
+
+    def __init__(self, path, make_snapshot, interval=AUTOSAVE_INTERVAL):
+        self.path = path
+        self.make_snapshot = make_snapshot
+        self.interval = interval
+        self._next = time.monotonic() + interval
+        self._last = None
+
+    def tick(self):
+        """Call once per frame; saves when the interval is up."""
+        now = time.monotonic()
+        if now < self._next:
+            return
+        self._next = now + self.interval
+        self.save()
+
+    def save(self):
+        """Save now (if anything changed since the last save)."""
+        if not enabled():
+            return False
+        data = self.make_snapshot().to_json()
+        saved = data.pop("saved")
+        if data == self._last:
+            return False
+        try:
+            _write(self.path, dict(data, saved=saved))
+        except OSError:
+            return False    # read-only home: no warm start next time
+        self._last = data
+        return True
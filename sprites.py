@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# sprites.py — pre-shifted 1-bit sprites and dirty-rectangle tracking.
+#
+# A Sprite is compiled once into page-aligned bitmaps: for each of the 8
+# possible vertical bit offsets inside a page it keeps the packed pixels
+# and the packed mask of the pixels it covers.  Drawing one is then an
+# AND and an OR of byte arrays, with no unpacking or bit shifting.
+#
+# A Scene keeps sprites over a background PageBuffer.  Moving, swapping or
+# removing a sprite marks its old and new boxes dirty; render() repaints
+# only those boxes and returns them, page aligned, so the transport can
+# send just those bytes (FrameMetrics.show(disp, frame, dirty) ->
+# SH1106.ShowRegions).  A moving object costs in proportion to its size,
+# not to the size of the screen.
+#
+#   scene = sprites.Scene(pagebuf.PageBuffer(128, 64))
+#   actor = scene.add(sprites.Sprite(bmp), 10, 10)
+#   scene.move(actor, 12, 11)
+#   show(scene.frame, scene.render())
+#
+# The same Scene composites overlays (status bars, toasts, modal boxes)
+# over a screen: each actor is a layer with a z order and an op that
+# combines it with what is below (copy, or, and, xor).  Showing, hiding
+# or restacking a layer only recomposes, and sends, the layer's box.
+
+import numpy as np
+
+import pagebuf
+
+
+class Sprite(object):
+    """A 1-bit image compiled for drawing on a PageBuffer.
+
+    image is a PIL "1" image, bool array or PageBuffer; mask selects the
+    pixels the sprite covers (default: all of them, like paste()).
+    """
+
+    def __init__(self, image, mask=None):
+        pix = pagebuf.PageBuffer._unpack(image)
+        if mask is None:
+            mask = np.ones_like(pix)
+        else:
+            mask = pagebuf.PageBuffer._unpack(mask)
+        self.height, self.width = pix.shape
+        self.bits = []      # [shift] -> pages x width, pixels that are 1
+        self.keep = []      # [shift] -> pages x width, ~mask (AND to clear)
+        for shift in range(8):
+            pages = (shift + self.height + 7) >> 3
+            self.bits.append(self._pack(pix & mask, shift, pages))
+            self.keep.append(~self._pack(mask, shift, pages))
+
+    @staticmethod
+    def _pack(rows, shift, pages):
+        h, w = rows.shape
+        padded = np.zeros((pages * 8, w), dtype=bool)
+        padded[shift:shift + h] = rows
+        return np.packbits(padded.reshape(pages, 8, w), axis=1, bitorder="little")[:, 0, :]
+
+    @classmethod
+    def from_ink(cls, image, ink=0):
+        """Sprite of the pixels of image that equal ink; the rest is transparent."""
+        pix = pagebuf.PageBuffer._unpack(image)
+        return cls(pix, pix if ink else ~pix)
+
+    def draw(self, buf, x, y, clip=None, op="copy"):
+        """Draw on buf with the top-left corner at (x, y).
+
+        clip is a page-aligned (x0, y0, x1, y1) box (end exclusive) the
+        drawing is limited to; default the whole buffer.  op combines the
+        masked pixels with buf: "copy" (replace), "or", "and" or "xor".
+        """
+        shift = y & 7
+        page = y >> 3
+        bits = self.bits[shift]
+        if clip is None:
+            clip = (0, 0, buf.width, buf.height)
+        # Clip in pages and columns of the shifted bitmap
+        p0 = max(0, (clip[1] >> 3) - page)
+        p1 = min(bits.shape[0], (clip[3] >> 3) - page)
+        c0 = max(0, clip[0] - x)
+        c1 = min(self.width, clip[2] - x)
+        if p0 >= p1 or c0 >= c1:
+            return
+        region = buf.pages[page + p0:page + p1, x + c0:x + c1]
+        if op == "copy":
+            region &= self.keep[shift][p0:p1, c0:c1]
+            region |= bits[p0:p1, c0:c1]
+        elif op == "or":
+            region |= bits[p0:p1, c0:c1]
+        elif op == "and":
+            region &= bits[p0:p1, c0:c1] | self.keep[shift][p0:p1, c0:c1]
+        elif op == "xor":
+            region ^= bits[p0:p1, c0:c1]
+        else:
+            raise ValueError("unknown op %r" % op)
+
+
+class Actor(object):
+    """A sprite placed in a Scene: a layer at depth z, combined with op."""
+
+    __slots__ = ("sprite", "x", "y", "z", "op", "visible")
+
+    def __init__(self, sprite, x, y, z=0, op="copy"):
+        self.sprite = sprite
+        self.x = x
+        self.y = y
+        self.z = z
+        self.op = op
+        self.visible = True
+
+    @property
+    def box(self):
+        return (self.x, self.y, self.x + self.sprite.width, self.y + self.sprite.height)
+
+
+def _page_align(box, width, height):
+    """Clip (x0, y0, x1, y1) to the screen and round its rows out to pages."""
+    x0, y0 = max(0, box[0]), max(0, box[1])
+    x1, y1 = min(width, box[2]), min(height, box[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0 & ~7, x1, min(height, (y1 + 7) & ~7))
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class Scene(object):
+    """Sprites over a background; only the changed boxes are redrawn."""
+
+    def __init__(self, background):
+        self.background = background
+        self.frame = background.copy()
+        self.actors = []
+        self._dirty = [(0, 0, background.width, background.height)]
+
+    def add(self, sprite, x, y, z=0, op="copy"):
+        """Place sprite at (x, y) on top of the others of the same z (and
+        below those of a higher z); returns its Actor."""
+        actor = Actor(sprite, x, y, z, op)
+        self.actors.append(actor)
+        self._restack()
+        self.invalidate(actor.box)
+        return actor
+
+    def _restack(self):
+        # Stable: actors of equal z keep the order they were added in
+        self.actors.sort(key=lambda a: a.z)
+
+    def move(self, actor, x, y, sprite=None):
+        """Move actor to (x, y), optionally showing another sprite."""
+        if sprite is None:
+            sprite = actor.sprite
+        if (x, y) == (actor.x, actor.y) and sprite is actor.sprite:
+            return
+        self.invalidate(actor.box)
+        actor.sprite, actor.x, actor.y = sprite, x, y
+        self.invalidate(actor.box)
+
+    def remove(self, actor):
+        self.actors.remove(actor)
+        self.invalidate(actor.box)
+
+    def set_visible(self, actor, visible):
+        """Show or hide actor without removing it."""
+        if actor.visible != visible:
+            actor.visible = visible
+            self.invalidate(actor.box)
+
+    def restack(self, actor, z=None, op=None):
+        """Move actor to depth z and/or combine it with op from now on."""
+        if z is not None:
+            actor.z = z
+            self._restack()
+        if op is not None:
+            actor.op = op
+        self.invalidate(actor.box)
+
+    def set_background(self, background):
+        """Put the sprites over another background; all of it is redrawn."""
+        self.background = background
+        self.invalidate()
+
+    def invalidate(self, box=None):
+        """Mark box (x0, y0, x1, y1, end exclusive; default all) for redrawing,
+        e.g. after drawing on the background."""
+        if box is None:
+            box = (0, 0, self.background.width, self.background.height)
+        box = _page_align(box, self.background.width, self.background.height)
+        if box is None:
+            return
+        # Merge with the boxes it touches so no pixel is repainted twice
+        merged = True
+        while merged:
+            merged = False
+            for other in self._dirty:
+                if _overlaps(box, other):
+                    self._dirty.remove(other)
+                    box = (min(box[0], other[0]), min(box[1], other[1]),
+                           max(box[2], other[2]), max(box[3], other[3]))
+                    merged = True
+                    break
+        self._dirty.append(box)
+
+    def render(self):
+        """Repaint the dirty boxes of frame; returns them (page aligned)."""
+        dirty = self._dirty
+        self._dirty = []
+        frame = self.frame.pages
+        background = self.background.pages
+        for box in dirty:
+            x0, y0, x1, y1 = box
+            frame[y0 >> 3:y1 >> 3, x0:x1] = background[y0 >> 3:y1 >> 3, x0:x1]
+            for actor in self.actors:
+                if actor.visible and _overlaps(box, actor.box):
+                    actor.sprite.draw(self.frame, actor.x, actor.y, box, actor.op)
+        return dirty
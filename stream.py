@@ -0,0 +1,461 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# stream.py — mirror frames to the panel over a UDP or Unix datagram socket.
+#
+# A Sender (e.g. on a laptop) sends page buffers, one datagram per frame:
+#
+#   header      magic "OF", version, kind, seq (u32), sent_ns (u64),
+#               width (u16), pages (u8), little endian
+#   keyframe    the raw page buffer, width * pages bytes (1 KiB)
+#   delta       seq of the frame it applies to (u32), then spans:
+#               page (u8), x0 (u16), length (u16), RLE bytes
+#
+# Spans cover the changed columns of a page; changed runs closer than a
+# span header are merged.  The RLE is PackBits-like: a control byte
+# 0-127 is followed by that many + 1 literal bytes, 128-255 by one byte
+# repeated control - 125 times (3-130).  A delta is only sent when it is
+# smaller than a keyframe, and every keyframe_interval frames a keyframe
+# is sent anyway.
+#
+# The Receiver keeps the frame the stream describes.  A delta whose base
+# is not that frame (a datagram was lost) is dropped, and the receiver
+# answers the sender with a NACK so the next frame is a keyframe.
+# Datagrams that arrive together are applied together and only what
+# changed on the frame is sent to the panel, through show(frame, dirty).
+#
+#   python3 stream.py receive --listen 127.0.0.1:5005      # on the Pi
+#   python3 stream.py send 192.168.1.20:5005 "images/nite*.bmp"
+#   python3 stream.py loopback                             # benchmark
+#
+# Addresses are HOST:PORT (UDP) or a path (Unix datagram socket).
+
+import argparse
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+import metrics
+import pagebuf
+
+MAGIC = b"OF"
+VERSION = 1
+KEYFRAME, DELTA, NACK = 0, 1, 2
+
+_HEADER = struct.Struct("<2sBBIQHB")
+_BASE = struct.Struct("<I")
+_SPAN = struct.Struct("<BHH")
+
+DEFAULT_ADDRESS = "127.0.0.1:5005"
+DEFAULT_KEYFRAME_INTERVAL = 64
+
+
+# -- RLE ---------------------------------------------------------------------
+
+def rle_encode(data):
+    """PackBits-like encoding of bytes (see the header)."""
+    a = np.frombuffer(bytes(data), dtype=np.uint8)
+    n = len(a)
+    out = bytearray()
+    if not n:
+        return bytes(out)
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]).tolist()
+    lengths = np.diff(np.r_[starts, n]).tolist()
+    raw = a.tobytes()
+    literal = None      # start of the pending literal bytes
+
+    def flush(end):
+        for i in range(literal, end, 128):
+            chunk = raw[i:min(end, i + 128)]
+            out.append(len(chunk) - 1)
+            out.extend(chunk)
+
+    for start, length in zip(starts, lengths):
+        if length < 3:
+            if literal is None:
+                literal = start
+            continue
+        if literal is not None:
+            flush(start)
+            literal = None
+        while length >= 3:
+            k = min(length, 130)
+            out.append(k + 125)
+            out.append(raw[start])
+            start += k
+            length -= k
+        if length:
+            literal = start
+    if literal is not None:
+        flush(n)
+    return bytes(out)
+
+
+def rle_decode(buf, pos, n):
+    """Decode n bytes from buf at pos; returns (bytes, position after)."""
+    out = bytearray()
+    while len(out) < n:
+        c = buf[pos]
+        if c < 128:
+            out += buf[pos + 1:pos + c + 2]
+            pos += c + 2
+        else:
+            out += bytes((buf[pos + 1],)) * (c - 125)
+            pos += 2
+    if len(out) != n:
+        raise ValueError("RLE data overruns its span")
+    return bytes(out), pos
+
+
+# -- Packets -----------------------------------------------------------------
+
+def _spans(before, after):
+    """(page, x0, x1) runs of changed columns; runs whose gap costs less
+    than a span header are merged."""
+    changed = before != after
+    for page in np.flatnonzero(changed.any(axis=1)).tolist():
+        cols = np.flatnonzero(changed[page])
+        breaks = np.flatnonzero(np.diff(cols) > _SPAN.size + 1)
+        starts = np.r_[cols[0], cols[breaks + 1]].tolist()
+        ends = (np.r_[cols[breaks], cols[-1]] + 1).tolist()
+        for x0, x1 in zip(starts, ends):
+            yield page, x0, x1
+
+
+def encode_keyframe(pages, seq, sent_ns=0):
+    height, width = pages.shape
+    return _HEADER.pack(MAGIC, VERSION, KEYFRAME, seq, sent_ns, width, height) + pages.tobytes()
+
+
+def encode_delta(before, pages, seq, sent_ns=0):
+    height, width = pages.shape
+    parts = [_HEADER.pack(MAGIC, VERSION, DELTA, seq, sent_ns, width, height),
+             _BASE.pack((seq - 1) & 0xFFFFFFFF)]
+    for page, x0, x1 in _spans(before, pages):
+        parts.append(_SPAN.pack(page, x0, x1 - x0))
+        parts.append(rle_encode(pages[page, x0:x1]))
+    return b"".join(parts)
+
+
+def apply_delta(pages, packet):
+    """Write the spans of a delta packet into pages (its base frame)."""
+    pos = _HEADER.size + _BASE.size
+    while pos < len(packet):
+        page, x0, n = _SPAN.unpack_from(packet, pos)
+        if page >= pages.shape[0] or x0 + n > pages.shape[1]:
+            raise ValueError("span outside the frame")
+        raw, pos = rle_decode(packet, pos + _SPAN.size, n)
+        pages[page, x0:x0 + n] = np.frombuffer(raw, dtype=np.uint8)
+
+
+def parse_address(text):
+    """"HOST:PORT" -> (AF_INET, (host, port)); anything else is a Unix path."""
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or "0.0.0.0", int(port))
+    return socket.AF_UNIX, text
+
+
+# -- Sender ------------------------------------------------------------------
+
+class Sender(object):
+    """Send frames (PageBuffers or page arrays) to a Receiver."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        family, self.address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        if family == socket.AF_UNIX:
+            try:
+                self.sock.bind("")      # autobind, so NACKs can come back
+            except OSError:
+                pass
+        self.sock.setblocking(False)
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self._last = None
+        self._since_key = 0
+        self.keyframes = 0
+        self.deltas = 0
+        self.nacks = 0
+        self.bytes_sent = 0
+
+    def _poll_nacks(self):
+        nacked = False
+        while True:
+            try:
+                data = self.sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return nacked
+            except OSError:
+                return True     # e.g. ICMP port unreachable: start over
+            if len(data) >= _HEADER.size and data[:2] == MAGIC and data[3] == NACK:
+                self.nacks += 1
+                nacked = True
+
+    def send(self, frame, keyframe=False):
+        """Send one frame; returns the datagram size, or 0 if nobody is
+        listening (the next frame is then a keyframe)."""
+        pages = getattr(frame, "pages", frame)
+        if self._poll_nacks():
+            keyframe = True
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        now = time.monotonic_ns()
+        packet = None
+        if (not keyframe and self._last is not None and self._last.shape == pages.shape
+                and self._since_key < self.keyframe_interval):
+            packet = encode_delta(self._last, pages, self.seq, now)
+            if len(packet) >= _HEADER.size + pages.size:
+                packet = None
+        if packet is None:
+            packet = encode_keyframe(pages, self.seq, now)
+            self._since_key = 0
+            self.keyframes += 1
+        else:
+            self._since_key += 1
+            self.deltas += 1
+        try:
+            self.sock.sendto(packet, self.address)
+        except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+            self._last = None
+            return 0
+        self.bytes_sent += len(packet)
+        if self._last is None or self._last.shape != pages.shape:
+            self._last = pages.copy()
+        else:
+            self._last[:] = pages
+        return len(packet)
+
+    def close(self):
+        self.sock.close()
+
+
+# -- Receiver ----------------------------------------------------------------
+
+class Receiver(object):
+    """Listen for a stream and present it through show(frame, dirty)."""
+
+    def __init__(self, show, address=DEFAULT_ADDRESS, width=128, height=64):
+        self.show = show
+        family, self.address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind(self.address)
+        self.frame = pagebuf.PageBuffer(width, height)
+        self._before = self.frame.pages.copy()
+        self.seq = None     # seq of the frame held, None until a keyframe
+        self.frames = 0     # frames presented
+        self.applied = 0
+        self.dropped = 0    # deltas whose base was missing
+        self.bad = 0
+        self.latency_us = metrics.RingBuffer()
+        self.running = False
+
+    def poll(self, timeout=None):
+        """Wait up to timeout for datagrams, apply all that are queued and
+        present the result; returns True if a frame was presented."""
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return False
+        self._before[:] = self.frame.pages
+        newest = None
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(65536, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            sent_ns = self._apply(data, addr)
+            if sent_ns is not None:
+                newest = sent_ns
+        if newest is None:
+            return False
+        self.show(self.frame, self.frame.diff(self._before))
+        self.frames += 1
+        self.latency_us.append((time.monotonic_ns() - newest) // 1000)
+        return True
+
+    def _apply(self, data, addr):
+        """Apply one datagram; returns its sent_ns if it was applied."""
+        pages = self.frame.pages
+        try:
+            magic, version, kind, seq, sent_ns, width, height = _HEADER.unpack_from(data)
+        except struct.error:
+            self.bad += 1
+            return None
+        if magic != MAGIC or version != VERSION or (width, height) != (pages.shape[1], pages.shape[0]):
+            self.bad += 1
+            return None
+        try:
+            if kind == KEYFRAME:
+                if len(data) != _HEADER.size + pages.size:
+                    raise ValueError("short keyframe")
+                pages[:] = np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size).reshape(pages.shape)
+            elif kind == DELTA:
+                base, = _BASE.unpack_from(data, _HEADER.size)
+                if base != self.seq:
+                    self.dropped += 1
+                    self._nack(addr)
+                    return None
+                apply_delta(pages, data)
+            else:
+                self.bad += 1
+                return None
+        except (ValueError, IndexError, struct.error):
+            # A broken delta may be half applied: wait for a keyframe
+            self.bad += 1
+            self.seq = None
+            self._nack(addr)
+            return None
+        self.seq = seq
+        self.applied += 1
+        return sent_ns
+
+    def _nack(self, addr):
+        if not addr:
+            return
+        try:
+            self.sock.sendto(_HEADER.pack(MAGIC, VERSION, NACK, self.seq or 0, 0, 0, 0), addr)
+        except OSError:
+            pass
+
+    def serve(self):
+        self.running = True
+        while self.running:
+            self.poll(0.5)
+
+    def stop(self, *_):
+        self.running = False
+
+    def close(self):
+        self.sock.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+# -- Command line ------------------------------------------------------------
+
+def _receive(args):
+    import displayd
+    disp = displayd.open_display()
+    if disp.Init() == -1:
+        print("Error initializing display")
+        return 1
+    disp.clear()
+    stats = metrics.from_env(disp.RPI)
+    receiver = Receiver(lambda frame, dirty: stats.show(disp, frame, dirty), args.listen)
+    print("Listening on %s" % args.listen)
+    try:
+        receiver.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+        disp.clear()
+        disp.RPI.module_exit()
+    return 0
+
+
+def _send(args):
+    import playback
+    sender = Sender(args.target, args.keyframe_interval)
+    try:
+        result = playback.play(lambda frame, dirty: sender.send(frame), args.source,
+                               fps=args.fps, invert=args.invert)
+    finally:
+        sender.close()
+    print("%d frames sent (%d dropped), %d keyframes, %.0f bytes/frame" % (
+        result["shown"], result["dropped"], sender.keyframes, sender.bytes_sent / max(1, result["shown"])))
+    return 0
+
+
+def _loopback(args):
+    """Sender and receiver on this machine, the receiver driving an
+    emulated panel: end-to-end frames/s, latency and bytes."""
+    import SH1106
+    import emulator
+    import tempfile
+
+    if args.unix:
+        address = os.path.join(tempfile.gettempdir(), "oled-stream-%d.sock" % os.getpid())
+    else:
+        address = "127.0.0.1:%d" % args.port
+    disp = SH1106.SH1106(emulator.EmulatedRaspberryPi())
+    disp.Init()
+    stats = metrics.FrameMetrics(disp.RPI)
+    receiver = Receiver(lambda frame, dirty: stats.show(disp, frame, dirty), address)
+    thread = threading.Thread(target=receiver.serve, daemon=True)
+    thread.start()
+    sender = Sender(address, args.keyframe_interval)
+
+    # A box bouncing over a dithered background, and a frame counter
+    frame = pagebuf.PageBuffer()
+    background = np.where((np.arange(8)[:, None] + np.arange(128)[None, :]) % 2, 0xAA, 0x55).astype(np.uint8)
+    draw = pagebuf.Draw(frame)
+    x, y, dx, dy = 0, 0, 3, 2
+    interval = 1.0 / args.fps if args.fps else 0
+    t0 = next_t = time.monotonic()
+    for i in range(args.frames):
+        frame.pages[:] = background
+        draw.rectangle((x, y, x + 23, y + 15), fill=0)
+        draw.text((90, 54), "%5d" % i, fill=1)
+        sender.send(frame)
+        x, y = x + dx, y + dy
+        if not 0 <= x <= 104:
+            dx = -dx
+            x += 2 * dx
+        if not 0 <= y <= 48:
+            dy = -dy
+            y += 2 * dy
+        if interval:
+            next_t += interval
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = time.monotonic() - t0
+    time.sleep(0.2)
+    receiver.stop()
+    thread.join()
+    sender.close()
+    receiver.close()
+
+    latency = receiver.latency_us.summary()
+    bus = stats.rings["bytes"].summary()
+    print("%s loopback, %d frames in %.2f s" % ("unix" if args.unix else "udp", args.frames, elapsed))
+    print("  sent      %.1f frames/s, %d keyframes, %d deltas, %d NACKs, %.0f bytes/frame on the wire" % (
+        args.frames / elapsed, sender.keyframes, sender.deltas, sender.nacks, sender.bytes_sent / args.frames))
+    print("  shown     %d frames (%.1f/s), %d datagrams applied, %d deltas dropped" % (
+        receiver.frames, receiver.frames / elapsed, receiver.applied, receiver.dropped))
+    print("  latency   p50 %d us, p95 %d us, max %d us (send to on the panel)" % (
+        latency["p50"], latency["p95"], latency["max"]))
+    print("  bus       %.0f bytes/frame mean, %d max" % (bus["mean"], bus["max"]))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream frames to the OLED over a socket")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("receive", help="show a stream on the panel")
+    p.add_argument("--listen", default=DEFAULT_ADDRESS, help="HOST:PORT or socket path (default %(default)s)")
+    p = sub.add_parser("send", help="stream a clip or images (see playback.py)")
+    p.add_argument("target", help="receiver HOST:PORT or socket path")
+    p.add_argument("source")
+    p.add_argument("--fps", type=float, default=20)
+    p.add_argument("--invert", action="store_true")
+    p.add_argument("--keyframe-interval", type=int, default=DEFAULT_KEYFRAME_INTERVAL)
+    p = sub.add_parser("loopback", help="benchmark sender -> receiver -> emulated panel")
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("--fps", type=float, default=60, help="0 = as fast as possible")
+    p.add_argument("--port", type=int, default=5005)
+    p.add_argument("--unix", action="store_true", help="Unix datagram socket instead of UDP")
+    p.add_argument("--keyframe-interval", type=int, default=DEFAULT_KEYFRAME_INTERVAL)
+    args = parser.parse_args(argv)
+    return {"receive": _receive, "send": _send, "loopback": _loopback}[args.command](args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
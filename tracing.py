@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# tracing.py — opt-in Chrome trace-event / Perfetto span export.
+#
+# Set OLED_TRACE=/path/trace.json before starting a UI and every traced
+# span (main-loop ticks, screen handlers, getbuffer, ShowImage, command,
+# sleeps) is written to that file at exit.  Open it in chrome://tracing or
+# https://ui.perfetto.dev.
+#
+# With OLED_TRACE unset, traced() returns the function unchanged and span()
+# returns a shared no-op context, so the hot paths pay nothing.
+
+import atexit
+import json
+import os
+import threading
+import time
+
+TRACE_PATH = os.environ.get("OLED_TRACE")
+enabled = bool(TRACE_PATH)
+
+# Hard cap so a forgotten trace cannot eat all memory (~100 B per event)
+MAX_EVENTS = int(os.environ.get("OLED_TRACE_MAX_EVENTS", "1000000"))
+
+_events = []
+_pid = os.getpid()
+_clock = time.perf_counter_ns
+_tick_start = None
+
+# Time spent in sleep() so far, ns, tracing or not: metrics.FrameMetrics
+# leaves the UIs' debounce and hold sleeps out of the render time
+slept_ns = 0
+
+
+def _emit(name, start_ns, end_ns, args=None):
+    if len(_events) >= MAX_EVENTS:
+        return
+    event = {"name": name, "ph": "X", "pid": _pid, "tid": threading.get_ident(),
+             "ts": start_ns / 1000.0, "dur": (end_ns - start_ns) / 1000.0}
+    if args:
+        event["args"] = args
+    _events.append(event)
+
+
+class _Span(object):
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        _emit(self.name, self.start, _clock(), self.args)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """Context manager timing a block as one span."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, args or None)
+
+
+def traced(name_or_fn=None):
+    """Decorator wrapping a function in a span; a no-op when tracing is off.
+
+    Usable bare (@traced) or with an explicit span name (@traced("name")).
+    """
+    def decorate(fn, name=None):
+        if not enabled:
+            return fn
+        label = name or fn.__qualname__
+
+        def wrapper(*args, **kwargs):
+            start = _clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _emit(label, start, _clock())
+        wrapper.__name__ = fn.__name__
+        wrapper.__qualname__ = fn.__qualname__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    if callable(name_or_fn):
+        return decorate(name_or_fn)
+    return lambda fn: decorate(fn, name_or_fn)
+
+
+def tick(name="tick"):
+    """Close the previous main-loop tick span and open the next one."""
+    global _tick_start
+    if not enabled:
+        return
+    now = _clock()
+    if _tick_start is not None:
+        _emit(name, _tick_start, now)
+    _tick_start = now
+
+
+def sleep(seconds, name="sleep"):
+    """time.sleep() that shows up on the timeline when tracing, and is
+    added to slept_ns."""
+    global slept_ns
+    start = _clock()
+    time.sleep(seconds)
+    end = _clock()
+    slept_ns += end - start
+    if enabled:
+        _emit(name, start, end, {"seconds": seconds})
+
+
+def instant(name, **args):
+    """Zero-duration marker (state changes, key presses)."""
+    if not enabled or len(_events) >= MAX_EVENTS:
+        return
+    event = {"name": name, "ph": "i", "s": "t", "pid": _pid,
+             "tid": threading.get_ident(), "ts": _clock() / 1000.0}
+    if args:
+        event["args"] = args
+    _events.append(event)
+
+
+def flush(path=None):
+    """Write all events collected so far as Chrome trace-event JSON."""
+    path = path or TRACE_PATH
+    if not path:
+        return
+    meta = [{"name": "thread_name", "ph": "M", "pid": _pid, "tid": threading.main_thread().ident,
+             "args": {"name": "main"}}]
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"traceEvents": meta + _events, "displayTimeUnit": "ms"}, f)
+    os.replace(tmp, path)
+
+
+if enabled:
+    atexit.register(flush)
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# transitions.py — screen transitions computed on packed page buffers.
+#
+# Every intermediate frame between two PageBuffers is made with a few
+# NumPy operations on the page bytes, without unpacking any pixels:
+#
+#   slide_left / slide_right   column shift of the two frames side by side
+#   slide_up / slide_down      row shift: each page byte is two neighbouring
+#                              page bytes shifted by the sub-page bit offset
+#   wipe_right / wipe_down     the new frame uncovered behind a moving edge
+#   dissolve                   ordered (8x8 Bayer) dissolve, one packed
+#                              mask byte per column since a page is 8 rows
+#
+# play() paces the frames with a pacing.FramePacer; late frames are
+# dropped and the transition keeps its duration.  Each frame is handed to
+# show() with the boxes that changed since the previous one, so a frame
+# costs little more than the bytes that actually move on the bus.
+#
+#   transitions.play(show, old_frame, new_frame, "slide_left")
+
+import numpy as np
+
+import pacing
+
+# Panel maximum: a full frame takes ~25 ms over SPI at 1 MHz
+DEFAULT_FPS = 40
+DEFAULT_DURATION = 0.3
+
+# 8x8 ordered-dither thresholds 0..63
+_BAYER = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+])
+
+# (level, width) -> mask byte per column of the pixels with threshold < level
+_dissolve_masks = {}
+
+
+def _shift_rows(stack, rows, pages):
+    """pages x width of stack starting at pixel row `rows`."""
+    q, r = rows >> 3, rows & 7
+    top = stack[q:q + pages].astype(np.uint16)
+    if r == 0:
+        return top.astype(np.uint8)
+    below = stack[q + 1:q + pages + 1].astype(np.uint16)
+    return ((top >> r) | (below << (8 - r))).astype(np.uint8)
+
+
+def _row_mask(rows, pages):
+    """Mask byte per page of the pixel rows above `rows`."""
+    bits = (1 << rows) - 1
+    return np.frombuffer(bits.to_bytes(pages, "little"), dtype=np.uint8)[:, None]
+
+
+def _dissolve_mask(level, width):
+    key = (level, width)
+    mask = _dissolve_masks.get(key)
+    if mask is None:
+        cols = (_BAYER < level)[:, np.arange(width) % 8]       # 8 x width
+        mask = np.packbits(cols, axis=0, bitorder="little")[0]
+        _dissolve_masks[key] = mask
+    return mask
+
+
+def render(kind, a, b, t, out):
+    """Draw the frame at t (0 = a, 1 = b) of transition kind into out."""
+    pa, pb, po = a.pages, b.pages, out.pages
+    pages, width = po.shape
+    height = pages * 8
+    if kind == "slide_left":
+        s = int(round(t * width))
+        po[:, :width - s] = pa[:, s:]
+        po[:, width - s:] = pb[:, :s]
+    elif kind == "slide_right":
+        s = int(round(t * width))
+        po[:, s:] = pa[:, :width - s]
+        po[:, :s] = pb[:, width - s:]
+    elif kind == "slide_up":
+        # a on top of b, the window moving down
+        stack = np.concatenate((pa, pb, pb[:1]))
+        po[:] = _shift_rows(stack, int(round(t * height)), pages)
+    elif kind == "slide_down":
+        stack = np.concatenate((pb, pa, pa[:1]))
+        po[:] = _shift_rows(stack, height - int(round(t * height)), pages)
+    elif kind == "wipe_right":
+        s = int(round(t * width))
+        po[:, :s] = pb[:, :s]
+        po[:, s:] = pa[:, s:]
+    elif kind == "wipe_down":
+        mask = _row_mask(int(round(t * height)), pages)
+        po[:] = (pa & ~mask) | (pb & mask)
+    elif kind == "dissolve":
+        mask = _dissolve_mask(int(round(t * 64)), width)
+        po[:] = (pa & ~mask) | (pb & mask)
+    else:
+        raise ValueError("unknown transition %r" % kind)
+    return out
+
+
+KINDS = ("slide_left", "slide_right", "slide_up", "slide_down", "wipe_right", "wipe_down", "dissolve")
+
+
+def play(show, a, b, kind="slide_left", duration=DEFAULT_DURATION, fps=DEFAULT_FPS):
+    """Show the frames from a to b over `duration` seconds.
+
+    show(frame, dirty) is called once per frame with one reused
+    PageBuffer, the last time with a frame equal to b (so showing b
+    afterwards costs nothing).  Returns the number of frames shown.
+    """
+    steps = max(1, int(round(duration * fps)))
+    pacer = pacing.FramePacer(fps=fps)
+    out = a.copy()
+    before = np.empty_like(out.pages)
+    shown = 0
+    step = 1
+    while True:
+        before[:] = out.pages
+        render(kind, a, b, min(step, steps) / steps, out)
+        show(out, out.diff(before))
+        shown += 1
+        if step >= steps:
+            return shown
+        step += pacer.wait()
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+#
+# videowall.py — one canvas spanned across several OLED panels.
+#
+# A VideoWall places 2-4 panels side by side or stacked (each at a page
+# aligned offset of the canvas) and draws into one PageBuffer the size of
+# the whole wall.  show() cuts the canvas into per-panel page buffers,
+# compares each with what that panel shows, and hands the changed spans to
+# a transfer worker per bus, so panels on different buses (SPI0 / SPI1 /
+# I2C) are written at the same time and a frame costs about what one
+# panel costs.  show() returns as soon as the spans are queued: the next
+# frame is drawn while this one is on the wire.
+#
+# Panels that share a bus (chip selects of one SPI controller, addresses
+# on one I2C bus) share its worker, which sends their spans interleaved
+# page by page: the panels update top to bottom together, instead of one
+# panel a whole transfer behind the other.  They may share the DC and
+# reset lines too; a shared reset line is pulsed once by Init().  Panels
+# on different SPI buses are sent to at the same time, so each SPI bus
+# needs its own DC line: from_spec() rejects a spec where two share one.
+# I2C panels tell commands from data by a control byte and leave DC alone.
+#
+#   wall = videowall.from_spec("spi0.0@0,0 spi0.1@128,0")     # 256x64
+#   wall.Init()
+#   draw = pagebuf.Draw(wall.frame)
+#   ...
+#   wall.show()
+#
+# Spec entries are spiB.C@x,y or i2cB:ADDR@x,y (ADDR in hex), optionally
+# followed by ,dc=N and ,rst=N; OLED_WALL holds the default spec.  With
+# OLED_BACKEND=emulator every panel is an emulated one; OLED_CONTROLLER
+# names the panels' controller (controllers.py).
+
+import os
+import queue
+import threading
+
+import SH1106
+import config
+import controllers
+import pagebuf
+
+DEFAULT_SPEC = "spi0.0@0,0 spi0.1@128,0"
+
+
+class Panel(object):
+    """An SH1106 at (x, y) of the canvas, on the bus named `bus`."""
+
+    def __init__(self, disp, x, y, bus):
+        if y % 8:
+            raise ValueError("panel y must be a multiple of 8, not %d" % y)
+        self.disp = disp
+        self.x = x
+        self.y = y
+        self.bus = bus
+        # What the panel shows, and the buffer the next frame is cut into
+        self.frame = pagebuf.PageBuffer(disp.width, disp.height)
+        self._next = pagebuf.PageBuffer(disp.width, disp.height)
+        self.full = True    # content unknown: send everything
+
+    def box(self):
+        return (self.x, self.y, self.x + self.disp.width, self.y + self.disp.height)
+
+
+class _BusWorker(threading.Thread):
+    """Sends the frames of the panels on one bus, one job at a time."""
+
+    def __init__(self, name):
+        threading.Thread.__init__(self, name="oled-wall-%s" % name, daemon=True)
+        # One frame queued behind the one being sent, at most
+        self.jobs = queue.Queue(maxsize=1)
+        self.error = None
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                self._send(job)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.jobs.task_done()
+
+    def _send(self, job):
+        # job: [(disp, encoded buffer, bursts), ...]; interleave the panels
+        # page by page (sorted() keeps panel order within a page)
+        order = sorted(((burst[1], n, burst) for n, (_, _, bursts) in enumerate(job) for burst in bursts),
+                       key=lambda item: item[:2])
+        for _, n, burst in order:
+            disp, buf, _ = job[n]
+            disp.send_burst(buf, burst)
+        for disp, _, _ in job:
+            disp.mark_frame()
+
+
+class VideoWall(object):
+    """Panels spanned into one canvas, drawn on through self.frame."""
+
+    def __init__(self, panels):
+        self.panels = list(panels)
+        if not self.panels:
+            raise ValueError("a video wall needs at least one panel")
+        self.width = max(p.x + p.disp.width for p in self.panels)
+        self.height = max(p.y + p.disp.height for p in self.panels)
+        self.frame = pagebuf.PageBuffer(self.width, self.height)
+        self._workers = {}
+        for panel in self.panels:
+            if panel.bus not in self._workers:
+                worker = _BusWorker(panel.bus)
+                worker.start()
+                self._workers[panel.bus] = worker
+
+    def Init(self):
+        """Initialize every panel; returns -1 if a backend fails."""
+        for panel in self.panels:
+            if panel.disp.RPI.module_init() != 0:
+                return -1
+        # Reset only after every module_init(): it drives reset low, which
+        # would hold panels on a shared reset line in reset
+        pulsed = []
+        for panel in self.panels:
+            rst = panel.disp.RPI.GPIO_RST_PIN
+            if not any(rst is other for other in pulsed):
+                panel.disp.reset()
+                pulsed.append(rst)
+        for panel in self.panels:
+            panel.disp.configure()
+            panel.full = True
+        return 0
+
+    def show(self, dirty=None):
+        """Send what changed on the canvas since the last show().
+
+        dirty, boxes (x0, y0, x1, y1) of the canvas, limits the comparison
+        to the panels they touch.
+        """
+        jobs = {}
+        for panel in self.panels:
+            if dirty is not None and not panel.full and not any(_overlaps(box, panel.box()) for box in dirty):
+                continue
+            x0, y0, x1, y1 = panel.box()
+            nxt = panel._next
+            nxt.pages[:] = self.frame.pages[y0 // 8:y1 // 8, x0:x1]
+            if panel.full:
+                rects = [(0, 0, nxt.width, nxt.height)]
+            else:
+                rects = nxt.diff(panel.frame)
+            if not rects:
+                continue
+            panel._next, panel.frame = panel.frame, nxt
+            panel.full = False
+            jobs.setdefault(panel.bus, []).append((panel.disp, nxt.tolist(), panel.disp.plan(rects)))
+        self._raise_errors()
+        for bus, job in jobs.items():
+            self._workers[bus].jobs.put(job)
+
+    def wait(self):
+        """Block until everything shown is on the panels."""
+        for worker in self._workers.values():
+            worker.jobs.join()
+        self._raise_errors()
+
+    def _raise_errors(self):
+        for worker in self._workers.values():
+            if worker.error is not None:
+                error, worker.error = worker.error, None
+                raise error
+
+    def clear(self):
+        self.frame.clear()
+        self.show()
+
+    def SetContrast(self, value):
+        self.wait()
+        for panel in self.panels:
+            panel.disp.SetContrast(value)
+
+    def SetPower(self, on):
+        self.wait()
+        for panel in self.panels:
+            panel.disp.SetPower(on)
+
+    def close(self):
+        self.wait()
+        for worker in self._workers.values():
+            worker.jobs.put(None)
+            worker.join()
+        self._workers = {}
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+# -- Construction from a spec string -----------------------------------------
+
+def _parse_entry(entry):
+    """"spi0.1@128,0,dc=23" -> (kind, bus number, chip select / address, x, y, pins)."""
+    where, _, at = entry.partition("@")
+    fields = at.split(",")
+    if not where or len(fields) < 2:
+        raise ValueError("bad panel %r: expected spiB.C@x,y or i2cB:ADDR@x,y" % entry)
+    pins = {}
+    for opt in fields[2:]:
+        name, _, value = opt.partition("=")
+        if name not in ("dc", "rst"):
+            raise ValueError("bad panel option %r" % opt)
+        pins[name] = int(value)
+    if where.startswith("spi"):
+        bus, _, cs = where[3:].partition(".")
+        return "spi", int(bus), int(cs or 0), int(fields[0]), int(fields[1]), pins
+    if where.startswith("i2c"):
+        bus, _, addr = where[3:].partition(":")
+        return "i2c", int(bus), int(addr or "3c", 16), int(fields[0]), int(fields[1]), pins
+    raise ValueError("bad panel %r: unknown bus" % entry)
+
+
+def from_spec(spec=None):
+    """VideoWall for a spec like "spi0.0@0,0 spi0.1@128,0" (see above)."""
+    spec = spec or os.environ.get("OLED_WALL") or DEFAULT_SPEC
+    emulated = os.environ.get("OLED_BACKEND") == "emulator"
+    controller = controllers.from_env()
+    panels = []
+    opened = {}     # pin number -> output device, shared between panels
+    dc_buses = {}   # DC pin number -> bus driving it
+    for n, entry in enumerate(spec.split()):
+        kind, bus, sub, x, y, pins = _parse_entry(entry)
+        # Each bus has its own transfer worker: two SPI buses toggling one
+        # DC line at once would mix up command and data bytes
+        name = "%s%d" % (kind, bus)
+        dc = pins.get("dc", config.DC_PIN)
+        if kind == "spi" and dc_buses.setdefault(dc, name) != name:
+            raise ValueError("panels on %s and %s share DC pin %d: give each bus its own (,dc=N)"
+                             % (dc_buses[dc], name, dc))
+        device = config.Device_SPI if kind == "spi" else config.Device_I2C
+        if emulated:
+            import emulator
+            rpi = emulator.EmulatedRaspberryPi(device, panel=emulator.SH1106Emulator(controller=controller))
+        else:
+            rpi = _hardware(kind, bus, sub, pins, opened, keys=(n == 0))
+        panels.append(Panel(SH1106.SH1106(rpi, controller), x, y, name))
+    return VideoWall(panels)
+
+
+def _hardware(kind, bus, sub, pins, opened, keys):
+    pin_args = {}
+    for name, default in (("rst", config.RST_PIN), ("dc", config.DC_PIN)):
+        number = pins.get(name, default)
+        pin_args[name] = opened.get(number, number)
+    if kind == "spi":
+        import spidev
+        rpi = config.RaspberryPi(spi=spidev.SpiDev(bus, sub), keys=keys, **pin_args)
+    else:
+        rpi = config.RaspberryPi(device=config.Device_I2C, i2c=bus, address=sub, keys=keys, **pin_args)
+    for name in ("rst", "dc"):
+        number = pins.get(name, config.RST_PIN if name == "rst" else config.DC_PIN)
+        opened.setdefault(number, getattr(rpi, "GPIO_%s_PIN" % name.upper()))
+    return rpi
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Bounce a box across a video wall")
+    parser.add_argument("spec", nargs="?", help="panels (default $OLED_WALL or %r)" % DEFAULT_SPEC)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    wall = from_spec(args.spec)
+    if wall.Init() != 0:
+        print("Error initializing display")
+        return 1
+    draw = pagebuf.Draw(wall.frame)
+    x, y, dx, dy = 0, 0, 3, 2
+    t0 = time.monotonic()
+    for _ in range(args.frames):
+        wall.frame.clear()
+        draw.rectangle((x, y, x + 23, y + 15), fill=0)
+        wall.show()
+        x, y = x + dx, y + dy
+        if not 0 <= x <= wall.width - 24:
+            dx = -dx
+            x += 2 * dx
+        if not 0 <= y <= wall.height - 16:
+            dy = -dy
+            y += 2 * dy
+    wall.wait()
+    elapsed = time.monotonic() - t0
+    print("%dx%d, %d panels: %.1f frames/s" % (wall.width, wall.height, len(wall.panels), args.frames / elapsed))
+    wall.clear()
+    wall.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())